@@ -18,6 +18,8 @@
 import os
 import sys
 import json
+import errno
+import ctypes
 import shutil
 import logging
 import argparse
@@ -25,11 +27,29 @@ import subprocess
 import re
 import time
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Any
-from dataclasses import dataclass, asdict, field
+from typing import List, Dict, Optional, Tuple, Any, Callable, Iterable, Iterator, Mapping, Sequence, Set, Union
+from collections import abc, defaultdict, deque
+import bisect
+from dataclasses import dataclass, asdict, field, replace
 from datetime import datetime
 from enum import Enum
 import tempfile
+import hashlib
+import hmac
+import contextlib
+import queue
+import threading
+import mmap
+import socket
+import zipfile
+import tarfile
+import fnmatch
+import tracemalloc
+
+try:
+    import resource  # Pico de memoria (solo Unix)
+except ImportError:
+    resource = None
 
 # =============================================================================
 # IMPORTACIONES DE RICH (CON INSTALACIÓN AUTOMÁTICA)
@@ -80,23 +100,34 @@ def install_and_import_rich():
             print("   Por favor instala manualmente: pip install rich requests pyyaml")
             sys.exit(1)
 
-# Instalar e importar Rich
-install_and_import_rich()
-
-# Ahora importar globalmente
-from rich.console import Console
-from rich.panel import Panel
-from rich.text import Text
-from rich.table import Table
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
-from rich.prompt import Prompt, Confirm, IntPrompt
-from rich.style import Style
-from rich import box
-from rich.align import Align
-from rich.columns import Columns
-from rich.tree import Tree
-from rich.syntax import Syntax
-from rich.live import Live
+def load_rich():
+    """Importa Rich bajo demanda (el modo --output json no lo necesita)"""
+    global Console, Panel, Text, Table, Progress, SpinnerColumn, TextColumn, BarColumn
+    global Prompt, Confirm, IntPrompt, Style, box, Align, Columns, Tree, Syntax, Live
+    
+    install_and_import_rich()
+    
+    from rich.console import Console
+    from rich.panel import Panel
+    from rich.text import Text
+    from rich.table import Table
+    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
+    from rich.prompt import Prompt, Confirm, IntPrompt
+    from rich.style import Style
+    from rich import box
+    from rich.align import Align
+    from rich.columns import Columns
+    from rich.tree import Tree
+    from rich.syntax import Syntax
+    from rich.live import Live
+
+# PyYAML es opcional: se usa el loader en C (libyaml) cuando está disponible
+try:
+    import yaml
+    YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+except ImportError:
+    yaml = None
 
 # =============================================================================
 # CONFIGURACIÓN GLOBAL
@@ -109,6 +140,59 @@ class Config:
     PROJECT_NAME: str = "AppNotesBG"
     EMOJI_LOGO: str = "📝"
     
+    # Pipeline de transformación (lectura → parseo/render → escritura)
+    IO_WORKERS: int = 4
+    CPU_WORKERS: int = field(default_factory=lambda: os.cpu_count() or 2)
+    PIPELINE_QUEUE_SIZE: int = 32
+    # Lotes pequeños (actualizaciones incrementales) se procesan sin lanzar hilos
+    PIPELINE_INLINE_MAX: int = 16
+    # Skills listados tras el descubrimiento; el resto se resume
+    DISCOVERY_TREE_MAX: int = 50
+    
+    # Skills a partir de este tamaño se parsean con memory-map (zero-copy)
+    MMAP_THRESHOLD: int = 1024 * 1024
+    
+    # Instalador: descubrir y parsear en segundo plano durante la detección y los prompts
+    PREFETCH_SKILLS: bool = True
+    PREFETCH_MAX_BYTES: int = 64 * 1024 * 1024
+    
+    # Límites por skill: quien los supera queda en cuarentena en vez de bloquear la pasada
+    SKILL_MAX_BYTES: int = 4 * 1024 * 1024
+    # Aproximado: un regex que retiene el GIL no se interrumpe (ver StagedPipeline)
+    SKILL_MAX_SECONDS: float = 10.0
+    
+    # Raíz alternativa del proyecto (API de biblioteca); None: la del propio script
+    ROOT: Optional[Path] = None
+    
+    # Linter: secciones obligatorias y tamaño máximo por sección
+    LINT_REQUIRED_SECTIONS: Tuple[str, ...] = ("rol",)
+    LINT_MAX_SECTION_BYTES: int = 64 * 1024
+    LINT_MAX_REPORTED: int = 20
+    
+    # Perfil compacto: presupuesto de bytes por skill y por asistente
+    COMPACT_SKILL_BUDGET: int = 8 * 1024
+    COMPACT_ASSISTANT_BUDGET: int = 256 * 1024
+    
+    # Layout bundle: un único archivo por asistente con este nombre
+    BUNDLE_NAME: str = "appnotesbg-bundle"
+    
+    # Secciones idénticas en varios skills se emiten una vez como include
+    SHARED_MIN_BYTES: int = 256
+    SHARED_MIN_SKILLS: int = 2
+    
+    # Validez de los veredictos de API keys en caché (segundos)
+    KEY_CACHE_TTL: int = 7 * 24 * 3600
+    
+    # Historial de ejecuciones y puerta de regresión de 'bench'
+    HISTORY_MAX: int = 200
+    BENCH_THRESHOLD: float = 0.25
+    # Diferencias menores que esto (ms) se consideran ruido aunque superen el umbral
+    BENCH_MIN_DELTA_MS: float = 25.0
+    
+    # --profile-memory: sitios de asignación por fase y profundidad de las trazas
+    MEMORY_TOP_SITES: int = 10
+    MEMORY_TRACE_FRAMES: int = 1
+    
     # Rutas
     @property
     def SCRIPT_DIR(self) -> Path:
@@ -116,10 +200,14 @@ class Config:
     
     @property
     def PROJECT_ROOT(self) -> Path:
+        if self.ROOT is not None:
+            return Path(self.ROOT).absolute()
         return self.SCRIPT_DIR.parent.absolute()
     
     @property
     def SKILLS_SOURCE_DIR(self) -> Path:
+        if self.ROOT is not None:
+            return self.PROJECT_ROOT / "skills"
         return self.SCRIPT_DIR
     
     # Archivos en raíz
@@ -139,6 +227,65 @@ class Config:
     def ENV_FILE(self) -> Path:
         return self.PROJECT_ROOT / ".env"
     
+    # Estado interno del instalador (locks, colas, cachés)
+    @property
+    def STATE_DIR(self) -> Path:
+        return self.PROJECT_ROOT / ".ai-assistant.d"
+    
+    @property
+    def UPDATE_LOCK(self) -> Path:
+        return self.STATE_DIR / "update.lock"
+    
+    @property
+    def UPDATE_PENDING(self) -> Path:
+        return self.STATE_DIR / "update.pending"
+    
+    @property
+    def UPDATE_STATUS(self) -> Path:
+        return self.STATE_DIR / "update.json"
+    
+    @property
+    def MANIFEST_FILE(self) -> Path:
+        return self.STATE_DIR / "manifest.json"
+    
+    @property
+    def PLAN_FILE(self) -> Path:
+        return self.STATE_DIR / "plan.json"
+    
+    @property
+    def GRAPH_FILE(self) -> Path:
+        return self.STATE_DIR / "graph.json"
+    
+    @property
+    def KEY_CACHE_FILE(self) -> Path:
+        return self.STATE_DIR / "keys.json"
+    
+    # Sal del HMAC de keys.json: por usuario y fuera del proyecto, nunca junto a los digests
+    @property
+    def KEY_SALT_FILE(self) -> Path:
+        base = os.environ.get("XDG_CONFIG_HOME") or str(Path.home() / ".config")
+        return Path(base) / "appnotesbg" / "key-cache.salt"
+    
+    @property
+    def SERVE_SOCKET(self) -> Path:
+        return self.STATE_DIR / "serve.sock"
+    
+    @property
+    def HISTORY_FILE(self) -> Path:
+        return self.STATE_DIR / "history.jsonl"
+    
+    @property
+    def BENCH_BASELINE(self) -> Path:
+        return self.STATE_DIR / "bench-baseline.json"
+    
+    @property
+    def QUARANTINE_FILE(self) -> Path:
+        return self.STATE_DIR / "quarantine.json"
+    
+    @property
+    def MEMORY_PROFILE_FILE(self) -> Path:
+        return self.STATE_DIR / "memory-profile.json"
+    
     # Directorios de asistentes
     def get_assistant_dir(self, assistant_id: str) -> Path:
         return self.PROJECT_ROOT / f".{assistant_id}"
@@ -163,7 +310,9 @@ class Config:
             "color": "bright_magenta", 
             "skills_subdir": "commands",
             "filename_template": "{name}.md",
-            "create_subdir": False
+            "create_subdir": False,
+            "shared_subdir": "shared",
+            "include_syntax": "@{path}"
         },
         "cursor": {
             "name": "Cursor",
@@ -173,7 +322,9 @@ class Config:
             "color": "bright_yellow",
             "skills_subdir": "rules",
             "filename_template": "{name}.md",
-            "create_subdir": False
+            "create_subdir": False,
+            "shared_subdir": "shared",
+            "include_syntax": "@{path}"
         }
     })
     
@@ -250,6 +401,7 @@ class Icons:
     CHIP = "💻"
     DATABASE = "🗄️"
     SETTINGS = "🔧"
+    CHART = "📊"
     
     # Asistentes
     OPENCODE = "🔷"
@@ -265,9 +417,25 @@ class UI:
     """Interfaz de usuario interactiva con Rich"""
     
     def __init__(self):
+        load_rich()
         self.console = Console()
         self.icons = Icons()
         self.colors = Colors()
+        self.timings: Dict[str, float] = {}
+        self.memory: Optional['MemoryProfiler'] = None
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Delimita una fase del instalador y mide su duración (para el historial)"""
+        started = time.perf_counter()
+        try:
+            with self.memory.phase(name) if self.memory is not None else contextlib.nullcontext():
+                yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - started) * 1000, 3)
+    
+    def event(self, kind: str, **fields: Any):
+        """Evento estructurado (solo se emite en modo JSON)"""
         
     def clear(self):
         """Limpia la consola"""
@@ -322,6 +490,10 @@ Versión: {CONFIG.VERSION}
         """Texto atenuado"""
         self.console.print(f"[{self.colors.MUTED}]{message}[/{self.colors.MUTED}]")
     
+    def print_panel(self, content: str, title: str = None, border_style: str = None):
+        """Panel con borde"""
+        self.console.print(Panel(content, title=title, border_style=border_style or "none"))
+    
     def create_table(self, title: str = None, show_header: bool = True) -> 'Table':
         """Crea una tabla formateada"""
         from rich.table import Table
@@ -353,6 +525,10 @@ Versión: {CONFIG.VERSION}
         if current == total:
             self.console.print()  # Nueva línea al completar
     
+    def print_counter(self, current: int, description: str = "Procesando"):
+        """Contador en una línea para cuando el total no se conoce de antemano"""
+        self.console.print(f"\r[{current:>6}] {description}".ljust(60), end="")
+    
     def print_tree(self, items: List[str], title: str = None):
         """Imprime una lista como árbol"""
         from rich.tree import Tree
@@ -373,6 +549,116 @@ Versión: {CONFIG.VERSION}
             border_style=self.colors.SUCCESS
         ))
 
+class _NullConsole:
+    """Consola que descarta toda la salida"""
+    
+    def print(self, *args: Any, **kwargs: Any):
+        pass
+    
+    def clear(self):
+        pass
+
+class _NullTable:
+    """Tabla que descarta columnas y filas"""
+    
+    def add_column(self, *args: Any, **kwargs: Any):
+        pass
+    
+    def add_row(self, *args: Any, **kwargs: Any):
+        pass
+
+class EventUI:
+    """Salida máquina: un evento NDJSON por línea en stdout, sin Rich ni prompts"""
+    
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.console = _NullConsole()
+        self.icons = Icons()
+        self.colors = Colors()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.timings: Dict[str, float] = {}
+        self.memory: Optional['MemoryProfiler'] = None
+    
+    def event(self, kind: str, **fields: Any):
+        """Emite un evento con marca de tiempo"""
+        record = {
+            "event": kind,
+            "ts": round(time.time(), 6),
+            "elapsed_ms": round((time.perf_counter() - self._started) * 1000, 3),
+        }
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Emite phase_start / phase_end con la duración de la fase"""
+        self.event("phase_start", phase=name)
+        started = time.perf_counter()
+        try:
+            with self.memory.phase(name) if self.memory is not None else contextlib.nullcontext():
+                yield
+        except BaseException as e:
+            self.timings[name] = round((time.perf_counter() - started) * 1000, 3)
+            self.event("phase_end", phase=name, status="error", error=str(e), duration_ms=self.timings[name])
+            raise
+        self.timings[name] = round((time.perf_counter() - started) * 1000, 3)
+        self.event("phase_end", phase=name, status="ok", duration_ms=self.timings[name])
+    
+    def clear(self):
+        pass
+    
+    def print_banner(self):
+        self.event("start", version=CONFIG.VERSION)
+    
+    def print_section(self, title: str, icon: str = ""):
+        pass
+    
+    def print_success(self, message: str, icon: str = None):
+        pass
+    
+    def print_error(self, message: str, icon: str = None):
+        self.event("error", message=message.strip())
+    
+    def print_warning(self, message: str, icon: str = None):
+        self.event("warning", message=message.strip())
+    
+    def print_info(self, message: str, icon: str = None):
+        pass
+    
+    def print_muted(self, message: str):
+        pass
+    
+    def print_panel(self, content: str, title: str = None, border_style: str = None):
+        pass
+    
+    def create_table(self, title: str = None, show_header: bool = True) -> _NullTable:
+        return _NullTable()
+    
+    def prompt(self, message: str, choices: List[str] = None, default: str = None) -> str:
+        # Modo no interactivo: siempre se usa el valor por defecto
+        self.event("prompt", message=message, answer=default)
+        return default
+    
+    def confirm(self, message: str, default: bool = True) -> bool:
+        self.event("prompt", message=message, answer=default)
+        return default
+    
+    def print_progress_bar(self, current: int, total: int, description: str = "Procesando"):
+        pass
+    
+    def print_counter(self, current: int, description: str = "Procesando"):
+        pass
+    
+    def print_tree(self, items: List[str], title: str = None):
+        pass
+    
+    def show_summary_panel(self, data: Dict[str, Any]):
+        self.event("summary", data=data)
+
 # =============================================================================
 # SISTEMA DE LOGS
 # =============================================================================
@@ -380,7 +666,7 @@ Versión: {CONFIG.VERSION}
 class SetupLogger:
     """Sistema de logging con archivo y consola"""
     
-    def __init__(self, log_file: Path):
+    def __init__(self, log_file: Path, console: bool = True):
         self.log_file = log_file
         self.logger = logging.getLogger("AppNotesBG_Setup")
         self.logger.setLevel(logging.DEBUG)
@@ -399,7 +685,9 @@ class SetupLogger:
         file_handler.setFormatter(file_formatter)
         self.logger.addHandler(file_handler)
         
-        # Handler para consola
+        # Handler para consola (desactivado en modo JSON)
+        if not console:
+            return
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_formatter = logging.Formatter('%(message)s')
@@ -427,6 +715,142 @@ class SetupLogger:
         self.logger.info(f" {title}")
         self.logger.info(f"{'='*50}\n")
 
+# =============================================================================
+# CONCURRENCIA ENTRE PROCESOS
+# =============================================================================
+
+if os.name == "nt":
+    import msvcrt
+    
+    def _lock_fd(fd: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    
+    def _unlock_fd(fd: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+    
+    def _lock_fd(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    
+    def _unlock_fd(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+class FileLock:
+    """Lock exclusivo entre procesos basado en archivo (flock / msvcrt)"""
+    
+    POLL_INTERVAL = 0.05
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+    
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+    
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        """Adquiere el lock; con blocking=False retorna False si otro proceso lo tiene"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        while True:
+            try:
+                _lock_fd(fd)
+                break
+            except OSError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    os.close(fd)
+                    return False
+                time.sleep(self.POLL_INTERVAL)
+        
+        self._fd = fd
+        return True
+    
+    def release(self):
+        """Libera el lock (el SO también lo libera si el proceso muere)"""
+        if self._fd is None:
+            return
+        try:
+            _unlock_fd(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+    
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release()
+
+def state_lock(path: Path, state_dir: Optional[Path] = None) -> FileLock:
+    """Lock asociado a un archivo de estado del instalador (en el STATE_DIR global si no se indica otro)"""
+    return FileLock((state_dir or CONFIG.STATE_DIR) / f"{path.name.lstrip('.')}.lock")
+
+def atomic_write_text(path: Path, content: str, mode: int = 0o644):
+    """Escribe en un temporal del mismo directorio y lo reemplaza atómicamente"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # Conservar permisos del archivo existente
+        os.chmod(tmp_name, path.stat().st_mode & 0o777 if path.exists() else mode)
+        os.replace(tmp_name, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+def sha256_file(path: Path) -> str:
+    """Hash SHA-256 de un archivo leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def decode_source(data: bytes, errors: str = 'strict') -> str:
+    """Texto de un skill: sin BOM y con saltos de línea universales (como read_text())"""
+    return data.decode('utf-8-sig', errors).replace('\r\n', '\n').replace('\r', '\n')
+
+def encode_output(content: str) -> bytes:
+    """Bytes que escribiría write_text() en esta plataforma"""
+    return content.replace('\n', os.linesep).encode('utf-8')
+
+TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+def estimate_tokens(text: str) -> int:
+    """Aproximación offline de tokens BPE: ~4 caracteres por palabra y 1 por signo"""
+    return sum((len(t) + 3) // 4 if t[0].isalnum() or t[0] == '_' else 1 for t in TOKEN_RE.findall(text))
+
+def project_relative(path: Path, root: Optional[Path] = None) -> str:
+    """Ruta relativa a la raíz del proyecto en formato POSIX"""
+    return path.relative_to(root or CONFIG.PROJECT_ROOT).as_posix()
+
+def spawn_detached(cmd: List[str]):
+    """Lanza un proceso desacoplado de la terminal y del proceso padre"""
+    kwargs: Dict[str, Any] = {
+        "stdin": subprocess.DEVNULL,
+        "stdout": subprocess.DEVNULL,
+        "stderr": subprocess.DEVNULL,
+        "cwd": str(CONFIG.PROJECT_ROOT),
+        "close_fds": True,
+    }
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    subprocess.Popen(cmd, **kwargs)
+
 # =============================================================================
 # DETECCIÓN DE ASISTENTES
 # =============================================================================
@@ -482,6 +906,8 @@ class AssistantDetector:
             status = self._detect_single(assistant_id, config)
             results.append(status)
             
+            self.ui.event("detection", **asdict(status))
+            
             # Log del resultado
             self.logger.info(
                 f"{config['name']}: binary={status.binary_found}, "
@@ -563,12 +989,90 @@ class AssistantDetector:
 # GESTIÓN DE API KEYS
 # =============================================================================
 
+class KeyValidationCache:
+    """Veredictos de validación indexados por HMAC(sal, provider + key); la key nunca se guarda
+    
+    La sal es por usuario (KEY_SALT_FILE): con solo keys.json no se pueden probar keys candidatas.
+    """
+    
+    def __init__(self, path: Optional[Path] = None, ttl: Optional[int] = None, salt_path: Optional[Path] = None):
+        self.path = path or CONFIG.KEY_CACHE_FILE
+        self.ttl = CONFIG.KEY_CACHE_TTL if ttl is None else ttl
+        self.salt_path = salt_path or CONFIG.KEY_SALT_FILE
+    
+    def _load(self) -> Dict[str, Any]:
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            data = {}
+        if "salt" in data or not isinstance(data.get("entries"), dict):
+            # Formato anterior (sal junto a los digests) o archivo dañado: se descarta
+            data = {"entries": {}}
+        return data
+    
+    def _salt(self, create: bool = False) -> Optional[bytes]:
+        """Sal del usuario; None si no existe (o no se puede crear): entonces no hay caché"""
+        try:
+            return bytes.fromhex(self.salt_path.read_text(encoding='utf-8').strip())
+        except (OSError, ValueError):
+            if not create:
+                return None
+        try:
+            with FileLock(self.salt_path.with_name(self.salt_path.name + ".lock")):
+                # Otro proceso pudo crearla mientras se esperaba el lock
+                with contextlib.suppress(OSError, ValueError):
+                    return bytes.fromhex(self.salt_path.read_text(encoding='utf-8').strip())
+                salt = os.urandom(16)
+                atomic_write_text(self.salt_path, salt.hex(), mode=0o600)
+                return salt
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _digest(salt: bytes, provider: str, key: str) -> str:
+        message = f"{provider}\0{key}".encode('utf-8')
+        return hmac.new(salt, message, hashlib.sha256).hexdigest()
+    
+    def get(self, provider: str, key: str) -> Optional[Tuple[bool, str]]:
+        """Veredicto vigente o None si no hay o caducó"""
+        salt = self._salt()
+        if salt is None:
+            return None
+        with state_lock(self.path, self.path.parent):
+            data = self._load()
+        entry = data["entries"].get(self._digest(salt, provider, key))
+        if not entry or time.time() - entry.get("checked_at", 0) > self.ttl:
+            return None
+        return entry["valid"], entry.get("error", "")
+    
+    def put(self, provider: str, key: str, valid: bool, error: str):
+        salt = self._salt(create=True)
+        if salt is None:
+            return
+        with state_lock(self.path, self.path.parent):
+            data = self._load()
+            now = time.time()
+            # Purgar caducados para que el archivo no crezca indefinidamente
+            data["entries"] = {
+                digest: entry for digest, entry in data["entries"].items()
+                if now - entry.get("checked_at", 0) <= self.ttl
+            }
+            data["entries"][self._digest(salt, provider, key)] = {
+                "provider": provider,
+                "valid": valid,
+                "error": error,
+                "checked_at": now,
+            }
+            atomic_write_text(self.path, json.dumps(data, indent=2), mode=0o600)
+
 class APIKeyManager:
     """Gestiona la configuración de API keys"""
     
-    def __init__(self, ui: UI, logger: SetupLogger):
+    def __init__(self, ui: UI, logger: SetupLogger, offline: bool = False):
         self.ui = ui
         self.logger = logger
+        self.offline = offline
+        self.cache = KeyValidationCache()
         self.configured_keys: Dict[str, str] = {}
     
     def configure_interactive(self) -> Dict[str, str]:
@@ -621,9 +1125,21 @@ class APIKeyManager:
             self.ui.print_muted(f"  {self.ui.icons.ARROW} Omitido\n")
             return
         
-        # Validar
-        self.ui.print_info("Validando API key...")
-        is_valid, error_msg = self._validate_key(provider_id, key)
+        # Validar (veredicto en caché si existe; sin red en modo offline)
+        cached = self.cache.get(provider_id, key)
+        if cached is None and self.offline:
+            self.configured_keys[provider_id] = key
+            os.environ[config['env_var']] = key
+            self.ui.print_warning("Modo offline: key guardada sin validar\n")
+            self.logger.info(f"API key sin validar (offline): {provider_id}")
+            return
+        
+        if cached is not None:
+            is_valid, error_msg = cached
+            self.logger.debug(f"Veredicto de validación en caché: {provider_id}")
+        else:
+            self.ui.print_info("Validando API key...")
+            is_valid, error_msg = self._validate_key(provider_id, key)
         
         if is_valid:
             self.configured_keys[provider_id] = key
@@ -635,57 +1151,18 @@ class APIKeyManager:
             self._handle_validation_failure(provider_id, config, key)
     
     def _validate_key(self, provider: str, key: str) -> Tuple[bool, str]:
-        """Valida una API key haciendo petición real"""
+        """Valida una API key haciendo petición real; cachea solo respuestas definitivas del provider"""
+        # Comprobación local: no pasa por la caché
+        if provider == "anthropic" and not key.startswith("sk-ant-"):
+            return False, "Formato incorrecto - debe empezar con 'sk-ant-'"
+        
         try:
             import requests
-            
-            config = CONFIG.API_PROVIDERS[provider]
-            
-            if provider == "openai":
-                headers = {"Authorization": f"Bearer {key}"}
-                response = requests.get(
-                    config['test_url'],
-                    headers=headers,
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    return True, ""
-                elif response.status_code == 401:
-                    return False, "Autenticación fallida - key inválida"
-                else:
-                    return False, f"Error HTTP {response.status_code}"
-                    
-            elif provider == "anthropic":
-                # Anthropic no tiene endpoint público simple, verificamos formato
-                if not key.startswith("sk-ant-"):
-                    return False, "Formato incorrecto - debe empezar con 'sk-ant-'"
-                # Intentamos una petición que requiere auth
-                headers = {
-                    "x-api-key": key,
-                    "Content-Type": "application/json"
-                }
-                response = requests.get(
-                    "https://api.anthropic.com/v1/models",
-                    headers=headers,
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    return True, ""
-                elif response.status_code == 401:
-                    return False, "Autenticación fallida"
-                else:
-                    return True, ""  # 404 u otros pueden ser OK si la auth pasó
-                    
-            elif provider == "google":
-                url = f"{config['test_url']}?key={key}"
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    return True, ""
-                elif response.status_code == 400:
-                    return False, "Key inválida"
-                else:
-                    return False, f"Error HTTP {response.status_code}"
-                    
+        except ImportError as e:
+            return False, f"Error: {str(e)}"
+        
+        try:
+            is_valid, error_msg = self._request_validation(provider, key)
         except requests.exceptions.Timeout:
             return False, "Timeout - verifica tu conexión"
         except requests.exceptions.ConnectionError:
@@ -693,6 +1170,64 @@ class APIKeyManager:
         except Exception as e:
             return False, f"Error: {str(e)}"
         
+        self.cache.put(provider, key, is_valid, error_msg)
+        return is_valid, error_msg
+    
+    def _request_validation(self, provider: str, key: str) -> Tuple[bool, str]:
+        """Petición al provider; los fallos de red y 5xx se propagan como excepción"""
+        import requests
+        
+        config = CONFIG.API_PROVIDERS[provider]
+        
+        if provider == "openai":
+            headers = {"Authorization": f"Bearer {key}"}
+            response = requests.get(
+                config['test_url'],
+                headers=headers,
+                timeout=10
+            )
+            if response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code == 200:
+                return True, ""
+            elif response.status_code == 401:
+                return False, "Autenticación fallida - key inválida"
+            else:
+                return False, f"Error HTTP {response.status_code}"
+                
+        elif provider == "anthropic":
+            # Anthropic no tiene endpoint público simple (el formato ya se verificó en _validate_key)
+            # Intentamos una petición que requiere auth
+            headers = {
+                "x-api-key": key,
+                "Content-Type": "application/json"
+            }
+            response = requests.get(
+                "https://api.anthropic.com/v1/models",
+                headers=headers,
+                timeout=10
+            )
+            if response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code == 200:
+                return True, ""
+            elif response.status_code == 401:
+                return False, "Autenticación fallida"
+            else:
+                return True, ""  # 404 u otros pueden ser OK si la auth pasó
+                
+        elif provider == "google":
+            url = f"{config['test_url']}?key={key}"
+            response = requests.get(url, timeout=10)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code == 200:
+                return True, ""
+            elif response.status_code == 400:
+                return False, "Key inválida"
+            else:
+                return False, f"Error HTTP {response.status_code}"
+        
         return False, "Provider no soportado"
     
     def _handle_validation_failure(self, provider_id: str, config: Dict, key: str):
@@ -736,158 +1271,2338 @@ class APIKeyManager:
         self.ui.print_muted("💡 Puedes agregar más keys después con: ./skills/setup.py update")
 
 # =============================================================================
-# TRANSFORMACIÓN DE SKILLS
+# PIPELINE POR ETAPAS
 # =============================================================================
 
 @dataclass
-class SkillData:
-    """Datos de un skill parseado"""
-    name: str
-    title: str
-    file_path: Path
-    relative_path: str
-    sections: Dict[str, str]
-    raw_content: str
+class PipelineItem:
+    """Elemento que recorre el pipeline"""
+    key: Any
+    payload: Any
+    error: Optional[Exception] = None
+    timings: Dict[str, float] = field(default_factory=dict)
 
-class SkillTransformer:
-    """Transforma skills al formato de cada asistente"""
+class StagedPipeline:
+    """Pipeline de etapas concurrentes unidas por colas acotadas (backpressure).
     
-    def __init__(self, ui: UI, logger: SetupLogger):
-        self.ui = ui
-        self.logger = logger
+    item_timeout es un watchdog cooperativo, no un límite duro: detecta el item vencido desde otro
+    hilo, así que solo actúa cuando ese hilo obtiene el GIL. Un regex con backtracking catastrófico
+    (o cualquier llamada en C larga que no lo suelte) bloquea el proceso entero hasta terminar, y el
+    hilo retirado tampoco se puede matar: sigue consumiendo CPU hasta que su etapa acabe. Contener
+    de verdad una entrada así exigiría procesarla en un subproceso que se pueda terminar.
+    """
     
-    def discover_skills(self) -> List[Path]:
-        """Descubre todos los skills en /skills/"""
-        self.logger.section("DESCUBRIMIENTO DE SKILLS")
-        self.ui.print_section("Descubriendo Skills", self.ui.icons.BOOK)
-        
-        skills = []
+    _END = object()
+    
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any], int]], queue_size: int = 32,
+                 item_timeout: Optional[float] = None, inline_max: Optional[int] = None):
+        self.stages = stages
+        self.queue_size = queue_size
+        # Lotes de hasta inline_max items (lista o tupla) se procesan sin arrancar la pipeline
+        self.inline_max = CONFIG.PIPELINE_INLINE_MAX if inline_max is None else inline_max
+        # Tiempo máximo de un item en una etapa: se entrega con TimeoutError y la pasada sigue
+        self.item_timeout = item_timeout
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        # Items en proceso: id → (item, etapa, inicio, hilo); los hilos atascados se retiran
+        self._active: Dict[int, Tuple[PipelineItem, str, float, threading.Thread]] = {}
+        self._retired: Set[threading.Thread] = set()
+        self._stage_args: Dict[str, Tuple[Any, ...]] = {}
+    
+    def run(self, items: Iterable[Any]) -> Iterator[PipelineItem]:
+        """Procesa los items y los entrega en orden de finalización"""
+        if isinstance(items, (list, tuple)) and len(items) <= self.inline_max:
+            # Arrancar los hilos cuesta más que procesar unos pocos skills
+            yield from self._run_inline(items)
+            return
         
-        # Buscar todos los .md excepto el propio setup.py
-        for md_file in CONFIG.SKILLS_SOURCE_DIR.rglob("*.md"):
-            if md_file.name == "setup.py":
-                continue
-            if self._is_valid_skill(md_file):
-                skills.append(md_file)
-                self.logger.debug(f"Skill encontrado: {md_file}")
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self._cancel.clear()
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
         
-        skills.sort()
+        for index, (name, fn, workers) in enumerate(self.stages):
+            remaining = [workers]
+            next_workers = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+            self._stage_args[name] = (name, fn, queues[index], queues[index + 1], remaining, next_workers)
+            for n in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=self._stage_args[name],
+                    name=f"pipeline-{name}-{n}",
+                    daemon=True
+                ))
         
-        self.ui.print_success(f"Skills encontrados: {len(skills)}")
+        for thread in threads:
+            thread.start()
         
-        # Mostrar lista
-        skill_names = [f"{self.ui.icons.FILE} {s.stem}" for s in skills]
-        self.ui.print_tree(skill_names, "Skills Disponibles")
+        try:
+            while True:
+                item = self._next(queues[-1])
+                if item is None or item is self._END:
+                    break
+                yield item
+        finally:
+            # Desbloquea a los workers si el consumidor abandona antes de terminar
+            self._cancel.set()
+    
+    def _run_inline(self, items: Sequence[Any]) -> Iterator[PipelineItem]:
+        """Pocos items en serie; con item_timeout, en un único hilo auxiliar que se abandona si se atasca"""
+        pending = deque(PipelineItem(key=key, payload=key) for key in items)
+        if not self.item_timeout:
+            while pending:
+                item = pending.popleft()
+                for name, fn, _ in self.stages:
+                    self._apply(name, fn, item)
+                yield item
+            return
         
-        return skills
+        while pending:
+            # (item, etapa, inicio) en curso; _END cuando el hilo queda abandonado
+            progress: List[Any] = [None]
+            done: queue.Queue = queue.Queue()
+            threading.Thread(target=self._chain, args=(pending, done, progress),
+                             name="pipeline-inline", daemon=True).start()
+            try:
+                while True:
+                    try:
+                        item = done.get(timeout=0.1)
+                    except queue.Empty:
+                        expired = self._abandon(progress)
+                        if expired is None:
+                            continue
+                        # El resto de items sigue en un hilo nuevo
+                        yield expired
+                        break
+                    if item is self._END:
+                        break
+                    yield item
+            finally:
+                with self._lock:
+                    progress[0] = self._END
     
-    def _is_valid_skill(self, file: Path) -> bool:
-        """Verifica si un archivo es un skill válido"""
-        # Excluir archivos comunes que no son skills
-        excluded = {'README', 'CHANGELOG', 'CONTRIBUTING', 'LICENSE', 'setup'}
-        return file.stem.lower() not in excluded
+    def _chain(self, pending: deque, done: queue.Queue, progress: List[Any]):
+        while True:
+            with self._lock:
+                if progress[0] is self._END:
+                    return
+                if not pending:
+                    break
+                item = pending.popleft()
+            for name, fn, _ in self.stages:
+                with self._lock:
+                    if progress[0] is self._END:
+                        return
+                    progress[0] = (item, name, time.perf_counter())
+                self._apply(name, fn, item)
+            with self._lock:
+                if progress[0] is self._END:
+                    # El watchdog ya entregó este item como TimeoutError
+                    return
+                progress[0] = None
+            done.put(item)
+        done.put(self._END)
     
-    def transform_all(self, skills: List[Path], assistant_id: str) -> int:
-        """Transforma todos los skills para un asistente"""
-        config = CONFIG.ASSISTANTS[assistant_id]
-        output_dir = CONFIG.get_assistant_dir(assistant_id) / config['skills_subdir']
-        
-        self.logger.section(f"TRANSFORMACIÓN PARA {config['name'].upper()}")
-        self.ui.print_section(
-            f"Transformando Skills para {config['emoji']} {config['name']}",
-            self.ui.icons.MAGIC
-        )
-        
-        # Crear directorio de salida
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        transformed_count = 0
+    def _abandon(self, progress: List[Any]) -> Optional[PipelineItem]:
+        """Item de la etapa en curso si superó item_timeout; su hilo deja de tomar items"""
+        with self._lock:
+            current = progress[0]
+            if current is None or current is self._END:
+                return None
+            item, name, started = current
+            elapsed = time.perf_counter() - started
+            if elapsed <= self.item_timeout:
+                return None
+            progress[0] = self._END
+        timings = dict(item.timings, **{name: elapsed})
+        return PipelineItem(key=item.key, payload=None, error=self._timeout_error(name, elapsed), timings=timings)
+    
+    def _feed(self, items: Iterable[Any], out_q: queue.Queue):
+        try:
+            for item in items:
+                if not self._put(out_q, PipelineItem(key=item, payload=item)):
+                    return
+        finally:
+            for _ in range(self.stages[0][2]):
+                self._put(out_q, self._END)
+    
+    def _work(self, name: str, fn: Callable[[Any], Any], in_q: queue.Queue, out_q: queue.Queue,
+              remaining: List[int], next_workers: int):
+        while True:
+            item = self._get(in_q)
+            if item is None:
+                return
+            if item is self._END:
+                break
+            with self._lock:
+                self._active[id(item)] = (item, name, time.perf_counter(), threading.current_thread())
+            self._apply(name, fn, item)
+            with self._lock:
+                self._active.pop(id(item), None)
+                if threading.current_thread() in self._retired:
+                    # El watchdog ya entregó este item y otro hilo ocupa este puesto
+                    return
+            if not self._put(out_q, item):
+                return
         
-        # Procesar cada skill con barra de progreso
-        for i, skill_file in enumerate(skills, 1):
+        # El último worker de la etapa propaga el fin a la siguiente
+        with self._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(out_q, self._END)
+    
+    @staticmethod
+    def _apply(name: str, fn: Callable[[Any], Any], item: PipelineItem):
+        # Los elementos fallidos atraviesan el resto de etapas sin procesarse
+        if item.error is None:
+            started = time.perf_counter()
             try:
-                self._transform_single(skill_file, assistant_id, output_dir)
-                transformed_count += 1
-                
-                # Mostrar progreso
-                self.ui.print_progress_bar(i, len(skills), f"Transformando {skill_file.stem}")
-                
+                item.payload = fn(item.payload)
             except Exception as e:
-                self.logger.error(f"Error transformando {skill_file}: {e}")
-                self.ui.print_error(f"Error en {skill_file.name}: {str(e)[:50]}")
-        
-        self.ui.console.print()
-        self.ui.print_success(
-            f"{transformed_count} skills transformados exitosamente",
-            icon=self.ui.icons.SPARKLES
-        )
-        
-        return transformed_count
+                item.error = e
+            item.timings[name] = time.perf_counter() - started
     
-    def _transform_single(self, skill_file: Path, assistant_id: str, output_dir: Path):
-        """Transforma un skill individual"""
-        # Parsear skill
-        skill_data = self._parse_skill(skill_file)
-        
-        # Transformar según asistente
-        if assistant_id == "opencode":
-            content = self._to_opencode(skill_data)
-        elif assistant_id == "claude":
-            content = self._to_claude(skill_data)
-        elif assistant_id == "cursor":
-            content = self._to_cursor(skill_data)
-        else:
-            raise ValueError(f"Asistente no soportado: {assistant_id}")
-        
-        # Guardar archivo
-        output_path = self._get_output_path(skill_file, assistant_id, output_dir)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(content, encoding='utf-8')
-        
-        self.logger.info(f"Transformado: {skill_file.name} -> {output_path}")
+    def _next(self, q: queue.Queue) -> Any:
+        """Como _get, pero entre esperas entrega los items que superaron item_timeout"""
+        while not self._cancel.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                expired = self._expire() if self.item_timeout else None
+                if expired is not None:
+                    return expired
+        return None
     
-    def _parse_skill(self, skill_file: Path) -> SkillData:
-        """Extrae información de un archivo de skill"""
-        content = skill_file.read_text(encoding='utf-8')
-        
-        # Extraer título (# Título)
-        title_match = re.search(r'^# (.+)$', content, re.MULTILINE)
-        title = title_match.group(1) if title_match else skill_file.stem
-        
-        # Extraer secciones
-        sections = {}
-        current_section = None
-        current_content = []
-        
-        for line in content.split('\n'):
-            section_match = re.match(r'^##?\s+(.+)$', line)
-            if section_match:
-                if current_section:
-                    sections[current_section] = '\n'.join(current_content).strip()
-                current_section = section_match.group(1).strip().lower().replace(' ', '_')
-                current_content = []
-            elif current_section:
-                current_content.append(line)
-        
-        if current_section and current_content:
-            sections[current_section] = '\n'.join(current_content).strip()
+    def _expire(self) -> Optional[PipelineItem]:
+        now = time.perf_counter()
+        with self._lock:
+            for key, (item, name, started, thread) in self._active.items():
+                if now - started <= self.item_timeout:
+                    continue
+                del self._active[key]
+                self._retired.add(thread)
+                break
+            else:
+                return None
         
-        return SkillData(
-            name=skill_file.stem,
-            title=title,
-            file_path=skill_file,
-            relative_path=str(skill_file.relative_to(CONFIG.SKILLS_SOURCE_DIR)),
-            sections=sections,
-            raw_content=content
-        )
+        # El hilo atascado no se puede interrumpir (sigue gastando CPU hasta acabar): se sustituye para
+        # que la etapa siga su ritmo
+        threading.Thread(target=self._work, args=self._stage_args[name],
+                         name=f"pipeline-{name}-relevo", daemon=True).start()
+        timings = dict(item.timings, **{name: now - started})
+        return PipelineItem(key=item.key, payload=None, error=self._timeout_error(name, now - started),
+                            timings=timings)
     
-    def _get_output_path(self, skill_file: Path, assistant_id: str, output_dir: Path) -> Path:
-        """Determina la ruta de salida según el asistente"""
-        config = CONFIG.ASSISTANTS[assistant_id]
-        skill_name = skill_file.stem.lower().replace('_', '-').replace(' ', '-')
-        
-        if config.get('create_subdir', False):
-            # Estructura: .opencode/skills/{skill-name}/SKILL.md
+    def _timeout_error(self, name: str, seconds: float) -> TimeoutError:
+        return TimeoutError(f"la etapa '{name}' superó {self.item_timeout:g} s ({seconds:.1f} s)")
+    
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._cancel.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._cancel.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+# =============================================================================
+# MANIFIESTO DE SALIDAS
+# =============================================================================
+
+class OutputManifest:
+    """Registro persistente de los archivos generados para cada asistente"""
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or CONFIG.MANIFEST_FILE
+    
+    def load(self) -> Dict[str, Any]:
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault("assistants", {})
+        return data
+    
+    def assistant(self, assistant_id: str) -> Dict[str, Any]:
+        return self.load()["assistants"].get(assistant_id, {"outputs": {}})
+    
+    def restore(self, assistant_id: str, target: Dict[str, Any]):
+        """Sustituye la entrada completa de un asistente (rollback a la generación anterior)"""
+        with state_lock(self.path, self.path.parent):
+            data = self.load()
+            data["assistants"][assistant_id] = target
+            atomic_write_text(self.path, json.dumps(data, indent=2, sort_keys=True))
+    
+    def update(self, assistant_id: str, written: Dict[str, Dict[str, Any]], removed: Iterable[str] = (),
+               profile: Optional[str] = None, layout: Optional[str] = None):
+        """Fusiona las entradas bajo lock y reescribe el manifiesto atómicamente"""
+        with state_lock(self.path, self.path.parent):
+            data = self.load()
+            target = data["assistants"].setdefault(assistant_id, {"outputs": {}})
+            target["outputs"].update(written)
+            for key in removed:
+                target["outputs"].pop(key, None)
+            target["installer_version"] = CONFIG.VERSION
+            target.pop("rolled_back", None)
+            if profile:
+                target["profile"] = profile
+            if layout:
+                target["layout"] = layout
+            target["updated_at"] = datetime.now().isoformat()
+            atomic_write_text(self.path, json.dumps(data, indent=2, sort_keys=True))
+    
+    @staticmethod
+    def entry(output: 'RenderedOutput', root: Optional[Path] = None) -> Tuple[str, Dict[str, Any]]:
+        """Entrada de manifiesto para una salida renderizada (clave relativa a la raíz del proyecto)"""
+        data = encode_output(output.content)
+        return project_relative(output.path, root), {
+            "source": output.source_relative,
+            "source_sha256": output.source_sha256,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "bytes": len(data),
+            "tokens": output.tokens if output.tokens is not None else estimate_tokens(output.content),
+        }
+
+# =============================================================================
+# GENERACIONES DE SALIDA (STAGING Y SWAP)
+# =============================================================================
+
+def link_or_copy(source: str, destination: str):
+    """Hardlink (solo metadatos) o copia si el sistema de archivos no lo permite"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+# renameat2() de glibc (Linux ≥ 3.15); None en otras plataformas o si la libc no la exporta
+try:
+    _RENAMEAT2 = ctypes.CDLL(None, use_errno=True).renameat2 if sys.platform.startswith("linux") else None
+except (OSError, AttributeError):
+    _RENAMEAT2 = None
+if _RENAMEAT2 is not None:
+    _RENAMEAT2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    _RENAMEAT2.restype = ctypes.c_int
+AT_FDCWD = -100
+RENAME_EXCHANGE = 1 << 1
+
+def rename_exchange(first: Path, second: Path) -> bool:
+    """Intercambia dos rutas existentes en un único rename atómico (renameat2 con RENAME_EXCHANGE)
+    
+    Retorna False si la plataforma o el sistema de archivos no lo admiten: el llamador decide el fallback.
+    """
+    if _RENAMEAT2 is None:
+        return False
+    if _RENAMEAT2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE) == 0:
+        return True
+    code = ctypes.get_errno()
+    if code in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+        return False
+    raise OSError(code, os.strerror(code), str(first), None, str(second))
+
+class OutputGenerations:
+    """Salidas de un asistente por generaciones: los cambios se preparan aparte y se publican por directorio
+    
+    Los directorios de salida siguen siendo directorios reales (pueden estar versionados en git). Solo se
+    prepara el directorio de cada salida escrita o borrada (la carpeta del skill en Opencode, el directorio
+    plano en Claude y Cursor), con hardlinks de lo que no cambia, en .generations/ y en el mismo sistema
+    de archivos. Al publicar, cada directorio preparado se intercambia con el vigente en un único rename
+    atómico; lo reemplazado queda como generación anterior para rollback.
+    """
+    
+    DIRNAME = ".generations"
+    
+    def __init__(self, assistant_dir: Path, subdirs: List[str]):
+        self.assistant_dir = assistant_dir
+        self.subdirs = subdirs
+        self.base = assistant_dir / self.DIRNAME
+        self.state_path = self.base / "generations.json"
+        # Generación en preparación y sus directorios preparados (relativos, p. ej. "skills/mi-skill")
+        self.generation: Optional[Path] = None
+        self.units: Set[str] = set()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def for_assistant(cls, config: 'Config', assistant_id: str) -> 'OutputGenerations':
+        settings = config.ASSISTANTS[assistant_id]
+        subdirs = [settings['skills_subdir']]
+        if settings.get('shared_subdir'):
+            subdirs.append(settings['shared_subdir'])
+        return cls(config.get_assistant_dir(assistant_id), subdirs)
+    
+    def load(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+    
+    def staged_path(self, path: Path) -> Optional[Path]:
+        """Dónde se escribe una salida vigente; prepara antes su directorio (None si no es de este asistente)"""
+        try:
+            relative = path.relative_to(self.assistant_dir)
+        except ValueError:
+            return None
+        if len(relative.parts) < 2 or relative.parts[0] not in self.subdirs:
+            return None
+        with self._lock:
+            if self.generation is None:
+                self._migrate()
+                self.generation = self._new_generation()
+            self._stage(relative.parent.as_posix())
+        return self.generation / relative
+    
+    def publish(self, manifest: Dict[str, Any]):
+        """Intercambia cada directorio preparado con el vigente; lo reemplazado queda como anterior
+        
+        Cada directorio cambia de golpe (un lector ve el conjunto viejo o el nuevo, nunca uno parcial),
+        pero dos directorios distintos (p. ej. el de salidas y shared/) se publican uno tras otro.
+        """
+        if self.generation is None:
+            return
+        previous = self._new_generation()
+        units = sorted(self.units)
+        done: List[str] = []
+        try:
+            for unit in units:
+                self._swap(self.generation / unit, self.assistant_dir / unit, previous / unit)
+                done.append(unit)
+        except OSError:
+            # Los directorios ya publicados vuelven a su estado; la generación queda para descartar
+            for unit in reversed(done):
+                self._swap(previous / unit, self.assistant_dir / unit, self.generation / unit)
+            shutil.rmtree(previous, ignore_errors=True)
+            raise
+        
+        atomic_write_text(self.state_path, json.dumps({
+            "previous": previous.name,
+            "units": units,
+            "manifest": manifest,
+        }, indent=2, sort_keys=True))
+        self._collect({previous.name})
+        self.generation, self.units = None, set()
+    
+    def rollback(self, manifest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Vuelve a la generación anterior y retorna su manifiesto; None si no hay anterior"""
+        state = self.load()
+        previous = self.base / state["previous"] if state.get("previous") else None
+        if previous is None or not previous.is_dir():
+            return None
+        # Los estados sin "units" guardaban el árbol completo de cada subdirectorio
+        units = state.get("units") or [subdir for subdir in self.subdirs if (previous / subdir).is_dir()]
+        self._migrate()
+        self.generation, self.units = previous, set(units)
+        self.publish(manifest)
+        return state.get("manifest") or {"outputs": {}}
+    
+    def discard(self):
+        if self.generation is not None:
+            shutil.rmtree(self.generation, ignore_errors=True)
+        self.generation, self.units = None, set()
+    
+    def _new_generation(self) -> Path:
+        self.base.mkdir(parents=True, exist_ok=True)
+        generation = self.base / f"gen-{time.time_ns()}"
+        generation.mkdir()
+        return generation
+    
+    def _stage(self, unit: str):
+        """Prepara un directorio con hardlinks del vigente, salvo que ya lo cubra otro preparado"""
+        if any(unit == staged or unit.startswith(staged + "/") for staged in self.units):
+            return
+        self._mirror(self.assistant_dir / unit, self.generation / unit)
+        self.units = {staged for staged in self.units if not staged.startswith(unit + "/")}
+        self.units.add(unit)
+    
+    def _mirror(self, live: Path, staged: Path):
+        """Hardlinks del árbol vigente; los directorios ya preparados dentro conservan sus cambios"""
+        staged.mkdir(parents=True, exist_ok=True)
+        try:
+            entries = list(os.scandir(live))
+        except FileNotFoundError:
+            return  # Directorio nuevo
+        for entry in entries:
+            target = staged / entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if target.relative_to(self.generation).as_posix() not in self.units:
+                    self._mirror(Path(entry.path), target)
+            elif not target.exists():
+                link_or_copy(entry.path, str(target))
+    
+    @staticmethod
+    def _swap(staged: Path, live: Path, displaced: Path):
+        """Pone staged en el lugar de live y mueve live a displaced; si staged no existe, live se retira
+        
+        Con ambos presentes se usa rename_exchange. Donde no está disponible (fuera de Linux o en
+        sistemas de archivos sin RENAME_EXCHANGE) se hacen dos renames: entre ambos el directorio
+        vigente no existe durante un instante, y en Windows el rename falla si hay un archivo abierto.
+        """
+        displaced.parent.mkdir(parents=True, exist_ok=True)
+        if not staged.exists():
+            if live.exists():
+                os.replace(live, displaced)
+            return
+        if not live.exists():
+            live.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged, live)
+            return
+        if rename_exchange(staged, live):
+            os.replace(staged, displaced)
+            return
+        os.replace(live, displaced)
+        try:
+            os.replace(staged, live)
+        except OSError:
+            os.replace(displaced, live)
+            raise
+    
+    def _migrate(self):
+        """Versiones anteriores enlazaban los subdirectorios a .generations/current: vuelven a ser reales"""
+        for subdir in self.subdirs:
+            live = self.assistant_dir / subdir
+            if live.is_symlink():
+                target = live.resolve()
+                live.unlink()
+                if target.is_dir():
+                    os.replace(target, live)
+        current = self.base / "current"
+        if current.is_symlink():
+            current.unlink()
+    
+    def _collect(self, keep: Set[str]):
+        """Solo queda la generación anterior; también se van restos de staging abortados"""
+        for entry in self.base.iterdir():
+            if entry.name.startswith("gen-") and entry.name not in keep:
+                shutil.rmtree(entry, ignore_errors=True)
+
+# =============================================================================
+# FRONTMATTER YAML
+# =============================================================================
+
+FRONTMATTER_RE = re.compile(r'\A\ufeff?---[ \t]*\n(.*?)^---[ \t]*(?:\n|\Z)', re.DOTALL | re.MULTILINE)
+FRONTMATTER_RE_BYTES = re.compile(rb'\A---[ \t]*\r?\n(.*?)^---[ \t]*\r?(?:\n|\Z)', re.DOTALL | re.MULTILINE)
+
+def parse_frontmatter(text: str) -> Dict[str, Any]:
+    """Parsea el bloque YAML (claves normalizadas como las secciones)"""
+    if yaml is not None:
+        try:
+            data = yaml.load(text, Loader=YAML_LOADER)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Frontmatter YAML inválido: {e}")
+    else:
+        # Sin PyYAML: solo pares clave: valor escalares
+        data = {}
+        for line in text.splitlines():
+            key, sep, value = line.partition(':')
+            if sep and key.strip() and not key.lstrip().startswith('#'):
+                data[key] = value.strip().strip('"\'')
+    
+    if not isinstance(data, dict):
+        return {}
+    # Fechas y otros tipos YAML a valores serializables en JSON
+    normalized = {str(k).strip().lower().replace(' ', '_'): v for k, v in data.items()}
+    return json.loads(json.dumps(normalized, default=str))
+
+def split_frontmatter(content: str) -> Tuple[Dict[str, Any], int]:
+    """Retorna los metadatos del frontmatter y el offset donde empieza el cuerpo"""
+    match = FRONTMATTER_RE.match(content)
+    if not match:
+        return {}, 0
+    return parse_frontmatter(match.group(1)), match.end()
+
+def dump_frontmatter(data: Dict[str, Any]) -> str:
+    """Serializa un bloque de frontmatter (--- ... ---)"""
+    if yaml is not None:
+        body = yaml.dump(data, Dumper=YAML_DUMPER, sort_keys=False, allow_unicode=True,
+                         default_flow_style=None, width=1_000_000)
+    else:
+        # JSON es YAML válido en estilo flow
+        body = "".join(f"{k}: {json.dumps(v, ensure_ascii=False)}\n" for k, v in data.items())
+    return f"---\n{body}---\n"
+
+def index_metadata(content: str) -> Dict[str, Any]:
+    """Metadatos indexables (frontmatter, nivel, dominio) sin parsear todo el cuerpo"""
+    metadata, offset = split_frontmatter(content)
+    body = content[offset:]
+    for key in ("nivel", "dominio"):
+        if key in metadata:
+            continue
+        match = re.search(rf'^##?[ \t]+{key}[ \t]*$(.*?)(?=^##?[ \t]|\Z)', body,
+                          re.IGNORECASE | re.MULTILINE | re.DOTALL)
+        if match:
+            metadata[key] = match.group(1).strip()
+    return metadata
+
+# Encabezado de sección: el mismo criterio que SECTION_RE_BYTES e index_metadata
+SECTION_RE = re.compile(r'##?[ \t]+(.+)')
+
+def split_sections(body: str) -> Dict[str, str]:
+    """Secciones (# o ##) del cuerpo con la clave normalizada"""
+    sections = {}
+    current_section = None
+    current_content = []
+    
+    for line in body.split('\n'):
+        section_match = SECTION_RE.match(line)
+        if section_match:
+            if current_section:
+                sections[current_section] = '\n'.join(current_content).strip()
+            current_section = section_match.group(1).strip().lower().replace(' ', '_')
+            current_content = []
+        elif current_section:
+            current_content.append(line)
+    
+    if current_section and current_content:
+        sections[current_section] = '\n'.join(current_content).strip()
+    
+    return sections
+
+def section_digest(body: str) -> str:
+    """Huella corta del cuerpo de una sección (identifica contenido compartido)"""
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+
+# =============================================================================
+# FUENTES DE SKILLS (DIRECTORIOS Y ARCHIVOS ZIP / TAR)
+# =============================================================================
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+class SetupIgnore:
+    """Patrones de .setupignore: uno por línea, con comodines, sobre el nombre o la ruta"""
+    
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.patterns = [p.rstrip('/') for p in patterns if p.strip() and not p.lstrip().startswith('#')]
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> 'SetupIgnore':
+        try:
+            lines = (path or CONFIG.SETUP_IGNORE).read_text(encoding='utf-8').splitlines()
+        except OSError:
+            lines = []
+        return cls(line.strip() for line in lines)
+    
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+    
+    def matches(self, relative: str) -> bool:
+        """Ruta relativa (posix) excluida por algún patrón, en cualquier nivel"""
+        parts = relative.split('/')
+        for pattern in self.patterns:
+            if any(fnmatch.fnmatchcase(part, pattern) for part in parts):
+                return True
+            if '/' in pattern and any(fnmatch.fnmatchcase('/'.join(parts[i:]), pattern) for i in range(len(parts))):
+                return True
+        return False
+
+@dataclass(frozen=True)
+class SkillSelection:
+    """Subconjunto de skills de un asistente por dominio, nivel y ruta (vacía: todo el corpus)"""
+    domains: Tuple[str, ...] = ()
+    levels: Tuple[str, ...] = ()
+    include: Tuple[str, ...] = ()  # patrones como los de .setupignore
+    exclude: Tuple[str, ...] = ()
+    
+    FIELDS = (("domains", "domain"), ("levels", "level"), ("include", "include"), ("exclude", "exclude"))
+    
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> Optional['SkillSelection']:
+        """La pedida por línea de comandos (repetible o separada por comas); None si no se pidió ninguna"""
+        if getattr(args, 'all_skills', False):
+            return cls()
+        values = {
+            name: tuple(value.strip() for arg in (getattr(args, flag, None) or []) for value in arg.split(',')
+                        if value.strip())
+            for name, flag in cls.FIELDS
+        }
+        return cls(**values) if any(values.values()) else None
+    
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> 'SkillSelection':
+        return cls(**{name: tuple(str(value) for value in data.get(name) or ()) for name, _ in cls.FIELDS})
+    
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {name: list(getattr(self, name)) for name, _ in self.FIELDS if getattr(self, name)}
+    
+    def __bool__(self) -> bool:
+        return any(getattr(self, name) for name, _ in self.FIELDS)
+    
+    @property
+    def needs_index(self) -> bool:
+        """Dominio y nivel salen del índice del grafo; las rutas no necesitan leer nada"""
+        return bool(self.domains or self.levels)
+    
+    @staticmethod
+    def _values(value: Any) -> Set[str]:
+        # Sección '## Dominio' (primera línea) o frontmatter (texto o lista)
+        items = value if isinstance(value, list) else str(value or "").strip().splitlines()[:1]
+        return {str(item).strip().lower() for item in items}
+    
+    def matches(self, relative: str, metadata: Mapping[str, Any]) -> bool:
+        if self.include and not SetupIgnore(self.include).matches(relative):
+            return False
+        if self.exclude and SetupIgnore(self.exclude).matches(relative):
+            return False
+        for wanted, key in ((self.domains, "dominio"), (self.levels, "nivel")):
+            if wanted and not self._values(metadata.get(key)) & {value.lower() for value in wanted}:
+                return False
+        return True
+    
+    def describe(self) -> str:
+        labels = {"domains": "dominio", "levels": "nivel", "include": "incluir", "exclude": "excluir"}
+        return "; ".join(f"{labels[name]}={','.join(values)}" for name, values in self.to_dict().items())
+
+def load_selections(config: Mapping[str, Any]) -> Dict[str, SkillSelection]:
+    """Selección guardada por asistente en .ai-assistant.json"""
+    stored = config.get("configuration", {}).get("skill_selection", {})
+    return {assistant_id: SkillSelection.from_dict(data)
+            for assistant_id, data in stored.items() if isinstance(data, dict)}
+
+def store_selections(config: Dict[str, Any], selections: Mapping[str, SkillSelection]):
+    """Guarda las selecciones no vacías (una vacía equivale a instalar todo)"""
+    config.setdefault("configuration", {})["skill_selection"] = {
+        assistant_id: selection.to_dict() for assistant_id, selection in sorted(selections.items()) if selection
+    }
+
+class SkillArchive:
+    """Zip/tar de skills leído sin extraer; índice de miembros con su tamaño y CRC
+    
+    Las instancias abiertas se cachean por proceso (_open), por ruta absoluta y para cualquier
+    Config, también los de render(): se reabren si el archivo cambia y quedan abiertas hasta salir.
+    """
+    
+    _open: Dict[Path, 'SkillArchive'] = {}
+    _registry_lock = threading.Lock()
+    
+    def __init__(self, path: Path):
+        self.path = path
+        stat = path.stat()
+        self.stamp = (stat.st_size, stat.st_mtime_ns)
+        self._lock = threading.Lock()
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._tar: Optional[tarfile.TarFile] = None
+        # Miembro → (tamaño, clave, valor) con la misma forma que source_stamp()
+        self.members: Dict[str, Tuple[int, str, int]] = {}
+        
+        if path.name.lower().endswith(".zip"):
+            self._zip = zipfile.ZipFile(path)
+            for info in self._zip.infolist():
+                if not info.is_dir():
+                    self.members[info.filename] = (info.file_size, "crc", info.CRC)
+        else:
+            # tar no guarda CRC: el mtime del miembro hace de marca de cambio
+            self._tar = tarfile.open(path)
+            self._infos = {m.name: m for m in self._tar.getmembers() if m.isfile()}
+            for name, info in self._infos.items():
+                self.members[name] = (info.size, "mtime", int(info.mtime))
+    
+    @classmethod
+    def open(cls, path: Path) -> 'SkillArchive':
+        """Instancia compartida; se reabre si el archivo cambió en disco"""
+        stat = path.stat()
+        with cls._registry_lock:
+            archive = cls._open.get(path)
+            if archive is None or archive.stamp != (stat.st_size, stat.st_mtime_ns):
+                if archive is not None:
+                    archive.close()
+                archive = cls._open[path] = cls(path)
+            return archive
+    
+    def names(self) -> List[str]:
+        """Miembros seguros (sin rutas absolutas ni '..') en el orden de sorted() sobre rutas"""
+        safe = [name for name in self.members
+                if not name.startswith('/') and '..' not in name.split('/')]
+        return sorted(safe, key=lambda name: name.split('/'))
+    
+    def read(self, name: str) -> bytes:
+        with self._lock:
+            if self._zip is not None:
+                return self._zip.read(name)  # zipfile verifica el CRC
+            return self._tar.extractfile(self._infos[name]).read()
+    
+    def close(self):
+        for handle in (self._zip, self._tar):
+            if handle is not None:
+                handle.close()
+
+def archive_member(path: Path) -> Optional[Tuple[SkillArchive, str]]:
+    """Archivo y nombre del miembro si la ruta apunta dentro de un zip/tar"""
+    for parent in path.parents:
+        if is_archive(parent.name):
+            if parent.is_file():
+                return SkillArchive.open(parent), path.relative_to(parent).as_posix()
+            return None
+    return None
+
+def source_stamp(path: Path) -> Tuple[int, str, int]:
+    """Tamaño y marca de cambio de una fuente: mtime en disco, CRC (zip) o mtime del miembro (tar)"""
+    member = archive_member(path)
+    if member is None:
+        stat = path.stat()
+        return stat.st_size, "mtime_ns", stat.st_mtime_ns
+    archive, name = member
+    if name not in archive.members:
+        raise FileNotFoundError(str(path))
+    return archive.members[name]
+
+def read_source_bytes(path: Path) -> bytes:
+    member = archive_member(path)
+    if member is None:
+        return path.read_bytes()
+    archive, name = member
+    if name not in archive.members:
+        raise FileNotFoundError(str(path))
+    return archive.read(name)
+
+def source_exists(path: Path) -> bool:
+    member = archive_member(path)
+    if member is None:
+        return path.exists()
+    return member[1] in member[0].members
+
+class QuarantinedSkill(RuntimeError):
+    """Skill apartado por superar el límite de tamaño o de tiempo"""
+
+class SkillQuarantine:
+    """Skills apartados por tiempo (se reintentan en cuanto cambia su fuente) o por tamaño"""
+    
+    def __init__(self, config: Optional['Config'] = None):
+        self.config = config or CONFIG
+        self.path = self.config.QUARANTINE_FILE
+        self._lock = threading.Lock()
+        # Cambios de esta ejecución (None: entrada retirada); save() los fusiona con lo que haya en disco
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        try:
+            self.entries: Dict[str, Dict[str, Any]] = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.entries = {}
+    
+    def check(self, skill_file: Path):
+        """Lanza QuarantinedSkill si sigue apartado o si excede el tamaño, antes de leerlo"""
+        stamp = list(source_stamp(skill_file))
+        if self.entries:
+            node = self._node(skill_file)
+            entry = self.entries.get(node)
+            if entry is not None:
+                if entry["stamp"] == stamp:
+                    raise QuarantinedSkill(entry["reason"])
+                with self._lock:
+                    self.entries.pop(node, None)
+                    self._pending[node] = None
+        if stamp[0] > self.config.SKILL_MAX_BYTES:
+            raise QuarantinedSkill(f"{stamp[0]:,} bytes (máx. {self.config.SKILL_MAX_BYTES:,})")
+    
+    def add(self, skill_file: Path, reason: str):
+        try:
+            stamp = list(source_stamp(skill_file))
+        except OSError:
+            return
+        node = self._node(skill_file)
+        with self._lock:
+            if self.entries.get(node, {}).get("stamp") == stamp:
+                return
+            self.entries[node] = {"reason": reason, "stamp": stamp, "at": datetime.now().isoformat(timespec="seconds")}
+            self._pending[node] = self.entries[node]
+    
+    def save(self):
+        """Read-merge-write bajo lock: no pisa lo que otro proceso apartó o retiró entretanto"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with state_lock(self.path, self.path.parent):
+            try:
+                entries = json.loads(self.path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                entries = {}
+            for node, entry in pending.items():
+                if entry is None:
+                    entries.pop(node, None)
+                else:
+                    entries[node] = entry
+            atomic_write_text(self.path, json.dumps(entries, indent=2, sort_keys=True))
+        with self._lock:
+            self.entries = entries
+    
+    def _node(self, skill_file: Path) -> str:
+        return skill_file.relative_to(self.config.SKILLS_SOURCE_DIR).as_posix()
+
+# =============================================================================
+# GRAFO DE DEPENDENCIAS
+# =============================================================================
+
+class ReferenceResolver:
+    """Resuelve referencias (archivo, nombre o directorio) a skills del corpus"""
+    
+    def __init__(self, nodes: Iterable[str]):
+        self.ordered = sorted(nodes)
+        self.by_name: Dict[str, List[str]] = defaultdict(list)
+        for node in self.ordered:
+            self.by_name[node.rsplit('/', 1)[-1]].append(node)
+    
+    def resolve(self, node: str, ref: str) -> Set[str]:
+        if ref.endswith('/'):
+            # Directorio: todos los skills bajo ese prefijo
+            found = set()
+            start = bisect.bisect_left(self.ordered, ref)
+            while start < len(self.ordered) and self.ordered[start].startswith(ref):
+                found.add(self.ordered[start])
+                start += 1
+            return found
+        
+        candidates = self.by_name.get(ref.rsplit('/', 1)[-1], [])
+        if '/' in ref:
+            candidates = [c for c in candidates if c == ref or c.endswith('/' + ref)]
+        if len(candidates) > 1:
+            # Nombre ambiguo: preferir el del mismo directorio
+            folder = node.rsplit('/', 1)[0] if '/' in node else ""
+            candidates = [c for c in candidates if (c.rsplit('/', 1)[0] if '/' in c else "") == folder]
+        return set(candidates) if len(candidates) == 1 else set()
+
+class SkillGraph:
+    """Grafo de dependencias entre skills extraído de sus referencias cruzadas"""
+    
+    GRAPH_VERSION = 3
+    # Tramos de ruta ([\w.-] separados por '/' simples): determinista, sin backtracking.
+    # Equivale a (?:[\w.-]+/)*[\w.-]+\.md(?![\w-]), que era cuadrático en líneas largas sin '.md'
+    PATH_RUN_RE = re.compile(r'[\w.-]+(?:/[\w.-]+)*')
+    DIR_REF_RE = re.compile(r'(?:skills/)?(AppNotesBG-[\w-]+/(?:[\w.-]+/)*)(?![\w.-])')
+    
+    def __init__(self, path: Optional[Path] = None, config: Optional['Config'] = None):
+        # Con config, el grafo, las rutas de los nodos y los límites son los de ese proyecto
+        self.config = config or CONFIG
+        self.path = path or self.config.GRAPH_FILE
+        # Nodo: huella de la fuente, referencias sin resolver, metadatos indexados
+        # y huellas de las secciones grandes (candidatas a contenido compartido)
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[str, Set[str]] = {}
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None, config: Optional['Config'] = None) -> 'SkillGraph':
+        graph = cls(path, config)
+        try:
+            data = json.loads(graph.path.read_text(encoding='utf-8'))
+            if data.get("version") == cls.GRAPH_VERSION:
+                graph.nodes = data.get("nodes", {})
+        except (OSError, ValueError):
+            pass
+        graph.edges = graph._resolve(graph.nodes)
+        return graph
+    
+    def save(self):
+        data = {
+            "version": self.GRAPH_VERSION,
+            "nodes": self.nodes,
+            "edges": {node: sorted(deps) for node, deps in self.edges.items() if deps},
+        }
+        with state_lock(self.path, self.path.parent):
+            atomic_write_text(self.path, json.dumps(data, indent=2, sort_keys=True))
+    
+    @staticmethod
+    def node_id(skill_file: Path, source_dir: Optional[Path] = None) -> str:
+        return skill_file.relative_to(source_dir or CONFIG.SKILLS_SOURCE_DIR).as_posix()
+    
+    def refresh(self, skills: Iterable[Path]) -> Set[str]:
+        """Actualiza los nodos y retorna los skills nuevos, modificados o eliminados"""
+        previous_edges = self.edges
+        previous_shared = self.shared_sections()
+        source_dir = self.config.SKILLS_SOURCE_DIR
+        current = {self.node_id(path, source_dir): path for path in skills}
+        changed = set(self.nodes) - set(current)
+        nodes: Dict[str, Dict[str, Any]] = {}
+        
+        for node, path in current.items():
+            # Miembros de zip/tar: el CRC y tamaño guardados evitan leerlos si no cambiaron
+            size, stamp_key, stamp = source_stamp(path)
+            previous = self.nodes.get(node)
+            if previous and previous["size"] == size and previous.get(stamp_key) == stamp:
+                nodes[node] = previous
+                continue
+            if size > self.config.SKILL_MAX_BYTES:
+                # No se lee: el instalador lo pondrá en cuarentena
+                nodes[node] = {"size": size, stamp_key: stamp, "sha256": "", "refs": [],
+                               "metadata": {}, "sections": {}}
+                changed.add(node)
+                continue
+            
+            data = read_source_bytes(path)
+            sha256 = hashlib.sha256(data).hexdigest()
+            if previous and previous["sha256"] == sha256:
+                nodes[node] = dict(previous, **{stamp_key: stamp})
+                continue
+            
+            content = decode_source(data, errors='replace')
+            try:
+                metadata = index_metadata(content)
+            except ValueError:
+                metadata = {}
+            nodes[node] = {
+                "size": size,
+                stamp_key: stamp,
+                "sha256": sha256,
+                "refs": self.extract_refs(content),
+                "metadata": metadata,
+                "sections": self.section_index(content, self.config.SHARED_MIN_BYTES),
+            }
+            changed.add(node)
+        
+        self.nodes = nodes
+        self.edges = self._resolve(nodes)
+        
+        # Skills sin cambios cuyas referencias ahora resuelven distinto (p. ej. se añadió el destino)
+        for node in nodes:
+            if node not in changed and self.edges.get(node) != previous_edges.get(node):
+                changed.add(node)
+        
+        # Secciones que pasan a ser (o dejan de ser) compartidas cambian la salida de sus skills
+        shared = self.shared_sections()
+        for digest in set(shared) ^ set(previous_shared):
+            changed.update(n for n, data in nodes.items() if digest in data.get("sections", {}))
+        
+        return changed
+    
+    def forget(self, skills: Iterable[Path]):
+        """Invalida la huella de skills que no se instalaron: el próximo refresh los da por modificados"""
+        for path in skills:
+            node = self.node_id(path, self.config.SKILLS_SOURCE_DIR)
+            if node in self.nodes:
+                # Tamaño y hash imposibles; referencias y secciones se conservan hasta releerlos
+                self.nodes[node] = dict(self.nodes[node], size=-1, sha256="")
+    
+    @staticmethod
+    def section_index(content: str, min_bytes: Optional[int] = None) -> Dict[str, str]:
+        """Huella → clave de las secciones con tamaño suficiente para compartirse"""
+        min_bytes = CONFIG.SHARED_MIN_BYTES if min_bytes is None else min_bytes
+        frontmatter = FRONTMATTER_RE.match(content)
+        return {
+            section_digest(body): key
+            for key, body in split_sections(content[frontmatter.end() if frontmatter else 0:]).items()
+            if len(body.encode('utf-8')) >= min_bytes
+        }
+    
+    def shared_sections(self, min_skills: Optional[int] = None) -> Dict[str, str]:
+        """Huella → clave de las secciones idénticas en al menos SHARED_MIN_SKILLS skills"""
+        min_skills = self.config.SHARED_MIN_SKILLS if min_skills is None else min_skills
+        owners: Dict[str, List[str]] = defaultdict(list)
+        for node in sorted(self.nodes):
+            for digest, key in self.nodes[node].get("sections", {}).items():
+                owners[digest].append(key)
+        return {digest: keys[0] for digest, keys in owners.items() if len(keys) >= min_skills}
+    
+    @classmethod
+    def extract_refs(cls, content: Union[str, Iterable[str]]) -> List[str]:
+        """Referencias a otros skills: archivos .md y directorios AppNotesBG-*/
+        
+        Acepta el texto o tramos cortados en fin de línea: ninguna referencia cruza un salto de línea.
+        """
+        refs = set()
+        for chunk in ((content,) if isinstance(content, str) else content):
+            for ref in cls.file_refs(chunk):
+                refs.add(cls._normalize(ref))
+            for match in cls.DIR_REF_RE.finditer(chunk):
+                refs.add(cls._normalize(match.group(1)))
+        return sorted(refs)
+    
+    @classmethod
+    def file_refs(cls, content: str) -> Iterator[str]:
+        """Rutas a archivos .md en tiempo lineal: por tramo, desde su inicio hasta el '.md' válido más lejano"""
+        for match in cls.PATH_RUN_RE.finditer(content):
+            run = match.group(0)
+            end = len(run)
+            while True:
+                i = run.rfind(".md", 0, end)
+                if i < 1:
+                    break
+                # Nombre no vacío antes de '.md' y sin continuar como palabra (.mdx, .md-old)
+                if run[i - 1] != '/' and (i + 3 == len(run) or run[i + 3] in './'):
+                    yield run[:i + 3]
+                    break
+                end = i + 2
+    
+    @staticmethod
+    def _normalize(ref: str) -> str:
+        ref = ref.lstrip('./')
+        return ref[len("skills/"):] if ref.startswith("skills/") else ref
+    
+    def _resolve(self, nodes: Dict[str, Dict[str, Any]]) -> Dict[str, Set[str]]:
+        """Resuelve las referencias contra el corpus actual"""
+        resolver = ReferenceResolver(nodes)
+        edges: Dict[str, Set[str]] = {}
+        for node in resolver.ordered:
+            deps: Set[str] = set()
+            for ref in nodes[node].get("refs", []):
+                deps |= resolver.resolve(node, ref)
+            deps.discard(node)
+            edges[node] = deps
+        return edges
+    
+    def dependents(self) -> Dict[str, Set[str]]:
+        """Aristas inversas: skill → skills que lo referencian"""
+        reverse: Dict[str, Set[str]] = defaultdict(set)
+        for node, deps in self.edges.items():
+            for dep in deps:
+                reverse[dep].add(node)
+        return reverse
+    
+    def impact(self, changed: Iterable[str]) -> Set[str]:
+        """Skills cambiados más todos sus dependientes transitivos"""
+        reverse = self.dependents()
+        impacted = set(changed)
+        pending = list(impacted)
+        while pending:
+            for dependent in reverse.get(pending.pop(), ()):
+                if dependent not in impacted:
+                    impacted.add(dependent)
+                    pending.append(dependent)
+        return impacted
+    
+    def cycles(self) -> List[List[str]]:
+        """Componentes fuertemente conexos con ciclo (Tarjan iterativo)"""
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        on_stack: Set[str] = set()
+        stack: List[str] = []
+        result: List[List[str]] = []
+        counter = 0
+        
+        for root in sorted(self.edges):
+            if root in index:
+                continue
+            work = [(root, iter(sorted(self.edges[root])))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(sorted(self.edges.get(child, ())))))
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                    continue
+                
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        result.append(sorted(component))
+        
+        return result
+    
+    def metadata(self, node: str) -> Dict[str, Any]:
+        """Metadatos del índice (frontmatter, nivel, dominio) sin releer el skill"""
+        return self.nodes.get(node, {}).get("metadata", {})
+    
+    def find(self, query: str) -> List[str]:
+        """Nodos que coinciden con una ruta relativa o un nombre de skill"""
+        query = self._normalize(query.replace('\\', '/'))
+        return [
+            node for node in sorted(self.nodes)
+            if node == query or node.endswith('/' + query) or Path(node).stem == query
+        ]
+
+# =============================================================================
+# TRANSFORMACIÓN DE SKILLS
+# =============================================================================
+
+@dataclass
+class TransformOptions:
+    """Opciones de transformación elegidas por línea de comandos"""
+    mmap_mode: str = "auto"  # auto | always | never
+    full: bool = False       # ignorar el grafo y regenerar todo en 'update'
+    profile: Optional[str] = None  # full | compact (None: el registrado en el manifiesto)
+    layout: Optional[str] = None   # files | bundle (None: el registrado en el manifiesto)
+    selection: Optional[SkillSelection] = None  # None: la guardada en .ai-assistant.json
+    
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> 'TransformOptions':
+        return cls(
+            mmap_mode=getattr(args, 'mmap', None) or "auto",
+            full=getattr(args, 'full', False),
+            profile=getattr(args, 'profile', None),
+            layout=getattr(args, 'layout', None),
+            selection=SkillSelection.from_args(args)
+        )
+
+class MappedSkill:
+    """Archivo de skill mapeado en memoria; el texto se decodifica bajo demanda"""
+    
+    BOM = b'\xef\xbb\xbf'
+    
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap no admite archivos vacíos
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # Vista sin BOM: los offsets de secciones son relativos a ella
+        self.offset = len(self.BOM) if self.buffer[:len(self.BOM)] == self.BOM else 0
+        self.view = memoryview(self.buffer)[self.offset:]
+    
+    def decode(self, start: int, end: int) -> str:
+        """Decodifica un rango de bytes normalizando los saltos de línea"""
+        return str(self.view[start:end], 'utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    
+    def text(self) -> str:
+        return self.decode(0, len(self.view))
+    
+    def chunks(self, size: int = 1 << 16) -> Iterator[str]:
+        """Texto en tramos de ~size bytes cortados tras un salto de línea, sin decodificarlo entero"""
+        start, total = 0, len(self.view)
+        while start < total:
+            end = self.buffer.find(b'\n', self.offset + start + size)
+            end = total if end < 0 else end - self.offset + 1
+            yield self.decode(start, end)
+            start = end
+
+class LazySections(abc.Mapping):
+    """Secciones como rangos sobre el buffer; se decodifican al primer acceso"""
+    
+    def __init__(self, source: MappedSkill, spans: Dict[str, Tuple[int, int]]):
+        self._source = source
+        self._spans = spans
+        self._cache: Dict[str, str] = {}
+    
+    def __getitem__(self, key: str) -> str:
+        value = self._cache.get(key)
+        if value is None:
+            start, end = self._spans[key]
+            value = self._cache[key] = self._source.decode(start, end).strip()
+        return value
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._spans)
+    
+    def __len__(self) -> int:
+        return len(self._spans)
+    
+    def size(self, key: str) -> int:
+        """Tamaño en bytes de la sección sin decodificarla"""
+        start, end = self._spans[key]
+        return end - start
+
+def section_size(sections: Mapping[str, str], key: str) -> int:
+    """Tamaño en bytes de una sección (sin decodificar si es perezosa)"""
+    if isinstance(sections, LazySections):
+        return sections.size(key)
+    return len(sections[key].encode('utf-8'))
+
+@dataclass
+class SkillSource:
+    """Contenido leído de un skill junto con su huella"""
+    path: Path
+    content: Any  # str | MappedSkill
+    sha256: str
+
+@dataclass
+class RenderedOutput:
+    """Archivo de salida renderizado para un asistente"""
+    source_path: Path
+    source_relative: str
+    source_sha256: str
+    path: Path
+    content: str
+    full_bytes: int = 0  # tamaño con el perfil completo (para el informe de ahorro)
+    bundled: bool = False  # va al bundle del asistente en lugar de a su propio archivo
+    tokens: Optional[int] = None  # estimación ya calculada (None: se estima al registrar)
+
+@dataclass
+class SkillData:
+    """Datos de un skill parseado"""
+    name: str
+    title: str
+    file_path: Path
+    relative_path: str
+    sections: Mapping[str, str]
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    _raw: Any = field(default="", repr=False)
+    
+    @property
+    def raw_content(self) -> str:
+        if isinstance(self._raw, MappedSkill):
+            self._raw = self._raw.text()
+        return self._raw
+    
+    def text_chunks(self) -> Iterable[str]:
+        """Texto fuente por tramos de líneas completas; el mapeado no se decodifica de una vez"""
+        if isinstance(self._raw, MappedSkill):
+            return self._raw.chunks()
+        return (self._raw,)
+    
+    def get(self, key: str, default: str) -> str:
+        """Valor de frontmatter (escalar) o de sección markdown"""
+        value = self.metadata.get(key)
+        if value is not None and not isinstance(value, (dict, list)):
+            return str(value)
+        return self.sections.get(key, default)
+    
+    def index_metadata(self) -> Dict[str, Any]:
+        """Lo que index_metadata() extrae del texto (frontmatter, nivel, dominio), desde el skill parseado"""
+        metadata = dict(self.metadata)
+        for key in ("nivel", "dominio"):
+            if key not in metadata and key in self.sections:
+                metadata[key] = self.sections[key]
+        return metadata
+
+class SkillTransformer:
+    """Transforma skills al formato de cada asistente"""
+    
+    # Mismas líneas que el parseo de texto: el '\r' de CRLF nunca forma parte del título
+    TITLE_RE_BYTES = re.compile(rb'^# ([^\r\n]+?)\r?$', re.MULTILINE)
+    SECTION_RE_BYTES = re.compile(rb'^##?[ \t]+([^\r\n]+?)\r?$', re.MULTILINE)
+    # Un '\r' suelto (saltos de Mac clásico) parte líneas que los offsets no ven
+    LONE_CR_RE_BYTES = re.compile(rb'\r(?!\n)')
+    
+    # Bloques fijos que el perfil compacto elimina
+    OPENCODE_PROTOCOLS = (
+        '## Input Protocol\n```json\n{\n  "action": "string",\n  "data": {}\n}\n```\n\n'
+        '## Output Protocol\n```json\n{\n  "success": true,\n  "result": {}\n}\n```\n\n'
+    )
+    COMPACT_DROP_RE = re.compile(
+        r'^generated_at: .*\n|^- \*\*Generated\*\*: .*\n|\n---\n\*Generated by AppNotesBG [^\n]*\*\n\Z',
+        re.MULTILINE
+    )
+    # Valores por defecto de los renderers: secciones sin contenido real
+    COMPACT_PLACEHOLDERS = (
+        'Sin descripción', 'Cuando sea necesario', 'Seguir las instrucciones del skill',
+        'Seguir las reglas del proyecto', 'Not specified', 'General', 'Use when needed',
+        'Follow instructions', 'JSON format', 'Follow best practices', 'Skill for AppNotesBG',
+        'Automatic or on demand', 'Execute as documented',
+    )
+    PLACEHOLDER_RE = re.compile(
+        r'^#{1,2} [^\n]+\n(?:' + '|'.join(map(re.escape, COMPACT_PLACEHOLDERS)) + r')\n(?:\n|\Z)',
+        re.MULTILINE
+    )
+    
+    # Índice del bundle: offset y tamaño en bytes (ancho fijo), fuente y nombre
+    BUNDLE_TOC_RE = re.compile(r'^- (\d{10}) (\d{10}) (\d+) `([^`]+)` (\S+)$', re.MULTILINE)
+    BUNDLE_MARKER = "<!-- skill: {source} -->\n"
+    
+    def __init__(self, ui: UI, logger: SetupLogger, options: Optional[TransformOptions] = None,
+                 config: Optional['Config'] = None):
+        self.ui = ui
+        self.logger = logger
+        self.options = options or TransformOptions()
+        self.config = config or CONFIG
+        self.corpus: List[Path] = []
+        self.linter: Optional['SkillLinter'] = None
+        self._linted = False
+        self._profiles: Dict[str, str] = {}
+        self._layouts: Dict[str, str] = {}
+        # Selección de skills por asistente y lo que cada una deja fuera (nodos del grafo)
+        self.selections: Dict[str, SkillSelection] = {}
+        self._deselected: Dict[str, Set[str]] = {}
+        # Bundle vigente de cada asistente: fuente → (contenido, tokens)
+        self._bundles: Dict[str, Dict[str, Tuple[str, int]]] = {}
+        # Asistentes en transacción y su generación en preparación (se crea con la primera escritura)
+        self._transaction: Set[str] = set()
+        self._staging: Dict[str, OutputGenerations] = {}
+        # Contenido compartido: huella → nombre del include, y lo usado en cada pasada
+        self.shared: Optional[Dict[str, str]] = None
+        self._includes: Dict[str, Dict[str, Tuple[SkillData, str]]] = defaultdict(dict)
+        self._dedup_bytes: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lock = threading.Lock()
+        # Modo serve: fuentes leídas y skills parseados que sobreviven entre ejecuciones
+        # (el instalador también las llena con la precarga, sin cachear durante la pasada)
+        self.warm = False
+        self._warm_sources: Dict[Path, Tuple[Tuple[int, str, int], SkillSource]] = {}
+        self._warm_parsed: Dict[Path, Tuple[str, SkillData]] = {}
+        # Skills que atravesaron el pipeline (ritmo del historial) y los que no llegaron a instalarse
+        self.processed = 0
+        self.failed: Set[Path] = set()
+        # Límites de tamaño y tiempo por skill (solo durante una transformación)
+        self.quarantine: Optional[SkillQuarantine] = None
+    
+    def reset(self):
+        """Olvida el estado de la ejecución anterior (las cachés en caliente se conservan)"""
+        self.processed = 0
+        self.failed.clear()
+        self.linter = None
+        self._linted = False
+        self._profiles.clear()
+        self._layouts.clear()
+        self._deselected.clear()
+        self._bundles.clear()
+        self.shared = None
+        self.quarantine = None
+    
+    def discover_skills(self) -> List[Path]:
+        """Descubre todos los skills en /skills/"""
+        self.logger.section("DESCUBRIMIENTO DE SKILLS")
+        self.ui.print_section("Descubriendo Skills", self.ui.icons.BOOK)
+        
+        skills = []
+        for md_file in self.iter_skills():
+            skills.append(md_file)
+            self.logger.debug(f"Skill encontrado: {md_file}")
+        self.corpus = skills
+        
+        self.ui.print_success(f"Skills encontrados: {len(skills)}")
+        self.ui.event("discovery", count=len(skills))
+        
+        # Mostrar lista (acotada: con árboles grandes el listado no aporta)
+        limit = self.config.DISCOVERY_TREE_MAX
+        skill_names = [f"{self.ui.icons.FILE} {s.stem}" for s in skills[:limit]]
+        if len(skills) > limit:
+            skill_names.append(f"... y {len(skills) - limit} más")
+        self.ui.print_tree(skill_names, "Skills Disponibles")
+        
+        return skills
+    
+    def iter_skills(self) -> Iterator[Path]:
+        """Recorre /skills/ de forma perezosa, en el mismo orden que sorted() sobre las rutas"""
+        ignore = SetupIgnore.load(self.config.SETUP_IGNORE)
+        pending = [iter(self._scan(self.config.SKILLS_SOURCE_DIR))]
+        while pending:
+            entry = next(pending[-1], None)
+            if entry is None:
+                pending.pop()
+            elif entry.is_dir() and not entry.is_symlink():
+                # Profundidad primero con entradas ordenadas: solo se retiene un directorio por nivel
+                pending.append(iter(self._scan(entry.path)))
+            elif is_archive(entry.name) and entry.is_file():
+                yield from self._iter_archive(Path(entry.path), ignore)
+            elif entry.name.endswith(".md") and entry.is_file() and self._is_valid_skill(Path(entry.path)):
+                if not (ignore and ignore.matches(self._relative(Path(entry.path)))):
+                    yield Path(entry.path)
+    
+    def _iter_archive(self, archive_path: Path, ignore: SetupIgnore) -> Iterator[Path]:
+        """Miembros .md de un zip/tar como rutas virtuales bajo el propio archivo"""
+        try:
+            archive = SkillArchive.open(archive_path)
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            self.logger.warning(f"Archivo de skills ilegible {archive_path.name}: {e}")
+            return
+        for name in archive.names():
+            path = archive_path / name
+            if name.endswith(".md") and self._is_valid_skill(path):
+                if not (ignore and ignore.matches(self._relative(path))):
+                    yield path
+    
+    def _relative(self, path: Path) -> str:
+        return path.relative_to(self.config.SKILLS_SOURCE_DIR).as_posix()
+    
+    @staticmethod
+    def _scan(directory: Union[str, Path]) -> List[os.DirEntry]:
+        try:
+            with os.scandir(directory) as entries:
+                return sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            return []
+    
+    def _is_valid_skill(self, file: Path) -> bool:
+        """Verifica si un archivo es un skill válido"""
+        # Excluir archivos comunes que no son skills
+        excluded = {'README', 'CHANGELOG', 'CONTRIBUTING', 'LICENSE', 'setup'}
+        return file.stem.lower() not in excluded
+    
+    def select(self, skills: Iterable[Path], assistant_id: str,
+               graph: Optional['SkillGraph'] = None) -> List[Path]:
+        """Skills que la selección del asistente incluye; dominio y nivel se leen del índice, sin parsear"""
+        skills = list(skills)
+        selection = self.selections.get(assistant_id)
+        if not selection:
+            self._deselected.pop(assistant_id, None)
+            return skills
+        if selection.needs_index and graph is None:
+            graph = SkillGraph.load(config=self.config)
+            graph.refresh(skills)  # Solo indexa lo nuevo; se guarda al terminar la pasada
+        
+        selected, skipped = [], set()
+        for skill_file in skills:
+            node = SkillGraph.node_id(skill_file, self.config.SKILLS_SOURCE_DIR)
+            if selection.matches(node, graph.metadata(node) if selection.needs_index else {}):
+                selected.append(skill_file)
+            else:
+                skipped.add(node)
+        self._deselected[assistant_id] = skipped
+        return selected
+    
+    def route(self, skill_file: Path, skill_data: SkillData, assistant_ids: List[str]) -> List[str]:
+        """Asistentes cuya selección incluye el skill ya parseado; los demás lo anotan como excluido"""
+        node = SkillGraph.node_id(skill_file, self.config.SKILLS_SOURCE_DIR)
+        metadata = skill_data.index_metadata()
+        targets = []
+        for assistant_id in assistant_ids:
+            selection = self.selections.get(assistant_id)
+            if not selection or selection.matches(node, metadata):
+                targets.append(assistant_id)
+                continue
+            with self._lock:
+                self._deselected.setdefault(assistant_id, set()).add(node)
+        return targets
+    
+    def has_deselected_outputs(self, assistant_id: str) -> bool:
+        """Si quedan en disco salidas de skills que la selección excluye (según el layout con que se escribieron)"""
+        skipped = self._deselected.get(assistant_id)
+        if not skipped:
+            return False
+        previous = OutputManifest(self.config.MANIFEST_FILE).assistant(assistant_id)
+        if previous.get("layout", "files") == "bundle":
+            return any(source in skipped for source in self.read_bundle(assistant_id))
+        return any(self._output_source(entry) in skipped for entry in previous.get("outputs", {}).values())
+    
+    @staticmethod
+    def _output_source(entry: Mapping[str, Any]) -> str:
+        return str(entry.get("source", "")).replace('\\', '/')
+    
+    def transform_all(self, skills: List[Path], assistant_id: str) -> int:
+        """Transforma todos los skills para un asistente"""
+        return self.transform_many({assistant_id: skills}).get(assistant_id, 0)
+    
+    @contextlib.contextmanager
+    def transaction(self, assistant_ids: Iterable[str]):
+        """Las escrituras van a generaciones nuevas; lo no publicado al salir (error, Ctrl+C) se descarta"""
+        self._transaction = set(assistant_ids)
+        try:
+            yield
+        finally:
+            for assistant_id, generations in self._staging.items():
+                if generations.generation is not None:
+                    self.logger.warning(f"{assistant_id}: generación sin publicar descartada "
+                                        f"({generations.generation.name})")
+                    generations.discard()
+            self._staging.clear()
+            self._transaction.clear()
+    
+    def staged_path(self, path: Path) -> Path:
+        """Dónde se escribe realmente una salida: en la generación en preparación si hay transacción"""
+        for assistant_id in self._transaction:
+            with self._lock:
+                if assistant_id not in self._staging:
+                    self._staging[assistant_id] = OutputGenerations.for_assistant(self.config, assistant_id)
+            staged = self._staging[assistant_id].staged_path(path)
+            if staged is not None:
+                return staged
+        return path
+    
+    def write_staged(self, path: Path, data: bytes):
+        target = self.staged_path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Nunca escribir a través de un hardlink compartido con la generación vigente
+        with contextlib.suppress(FileNotFoundError):
+            target.unlink()
+        target.write_bytes(data)
+    
+    def delete_staged(self, path: Path) -> Path:
+        target = self.staged_path(path)
+        with contextlib.suppress(FileNotFoundError):
+            target.unlink()
+        return target
+    
+    def publish(self, assistant_id: str, manifest: Dict[str, Any]):
+        """Swap de la generación preparada; sin escrituras no hay nada que publicar"""
+        self._transaction.discard(assistant_id)
+        generations = self._staging.pop(assistant_id, None)
+        if generations is not None and generations.generation is not None:
+            name, units = generations.generation.name, len(generations.units)
+            generations.publish(manifest)
+            self.logger.info(f"{assistant_id}: generación {name} publicada ({units} directorios)")
+    
+    def transform_many(self, jobs: Mapping[str, List[Path]]) -> Dict[str, int]:
+        """Transforma para varios asistentes en una pasada: un parseo por skill y un render por destino"""
+        # Un asistente sin skills a regenerar sigue en la pasada si su selección deja salidas que borrar
+        jobs = {assistant_id: list(skills) for assistant_id, skills in jobs.items()
+                if skills or self.has_deselected_outputs(assistant_id)}
+        if not jobs:
+            return {}
+        
+        # Destinos de cada skill (en update cada asistente puede tener su propio subconjunto)
+        targets: Dict[Path, List[str]] = defaultdict(list)
+        for assistant_id, skills in jobs.items():
+            for skill_file in skills:
+                targets[skill_file].append(assistant_id)
+        with self.transaction(jobs):
+            return self._transform(list(targets), lambda skill_file, skill_data=None: targets[skill_file], list(jobs))
+    
+    def transform_stream(self, skills: Iterable[Path], assistant_ids: List[str]) -> Dict[str, int]:
+        """Transforma a medida que se descubren los skills; grafo, includes y lint se cierran al final"""
+        self.corpus = []
+        for assistant_id in assistant_ids:
+            self._deselected.pop(assistant_id, None)
+        # Con selección, los destinos de cada skill se deciden al parsearlo (dominio y nivel)
+        selective = any(self.selections.get(assistant_id) for assistant_id in assistant_ids)
+        routes: Dict[Path, List[str]] = {}
+        
+        def discovered() -> Iterator[Path]:
+            for skill_file in skills:
+                self.corpus.append(skill_file)
+                self.logger.debug(f"Skill encontrado: {skill_file}")
+                yield skill_file
+        
+        def targets_for(skill_file: Path, skill_data: Optional[SkillData] = None) -> List[str]:
+            if skill_data is None or not selective:
+                # Sin parsear (error o cuarentena): los eventos van a todos los destinos
+                return routes.get(skill_file, assistant_ids)
+            routes[skill_file] = self.route(skill_file, skill_data, assistant_ids)
+            return routes[skill_file]
+        
+        with self.transaction(assistant_ids):
+            return self._transform(discovered(), targets_for, assistant_ids, streaming=True)
+    
+    def _transform(self, skills: Iterable[Path], targets_for: Callable[..., List[str]],
+                   assistant_ids: List[str], streaming: bool = False) -> Dict[str, int]:
+        configs = {assistant_id: self.config.ASSISTANTS[assistant_id] for assistant_id in assistant_ids}
+        output_dirs = {assistant_id: self.get_output_dir(assistant_id) for assistant_id in assistant_ids}
+        
+        self.logger.section(f"TRANSFORMACIÓN PARA {', '.join(c['name'].upper() for c in configs.values())}")
+        names = [f"{c['emoji']} {c['name']}" for c in configs.values()]
+        self.ui.print_section(f"Transformando Skills para {', '.join(names)}", self.ui.icons.MAGIC)
+        
+        # Por clave de salida: un skill re-renderizado sustituye su entrada en vez de sumarse
+        written: Dict[str, Dict[str, Dict[str, Any]]] = {assistant_id: {} for assistant_id in assistant_ids}
+        full_bytes: Dict[str, Dict[str, int]] = {assistant_id: {} for assistant_id in assistant_ids}
+        bundled: Dict[str, Dict[str, Tuple[str, int]]] = {assistant_id: {} for assistant_id in assistant_ids}
+        
+        # El lint viaja en la etapa de parseo: una sola pasada por ejecución
+        if not self._linted:
+            self.linter = SkillLinter(self.corpus if streaming else (self.corpus or skills), self.config)
+        if streaming and self.shared is None:
+            # Sin el corpus completo se parte del índice anterior; al terminar se corrige lo que cambie
+            self.shared = self.shared_names(SkillGraph.load(config=self.config))
+        for assistant_id in assistant_ids:
+            self._begin_includes(assistant_id, skills)
+        self.quarantine = SkillQuarantine(self.config)
+        quarantined: List[Path] = []
+        
+        def run(items: Iterable[Path], progress: bool):
+            # Lectura y escritura en el pool de I/O; el parseo se hace una vez y se renderiza por destino
+            pipeline = StagedPipeline([
+                ("read", self._read_skill, self.config.IO_WORKERS),
+                ("parse", self._parse_stage, self.config.CPU_WORKERS),
+                ("render", lambda parsed: [
+                    self._render_skill(parsed[0], assistant_id, output_dirs[assistant_id], parsed[1])
+                    for assistant_id in targets_for(parsed[0].path, parsed[1])
+                ], self.config.CPU_WORKERS),
+                ("write", lambda outputs: [
+                    output if output.bundled else self._write_output(output) for output in outputs
+                ], self.config.IO_WORKERS),
+            ], queue_size=self.config.PIPELINE_QUEUE_SIZE, item_timeout=self.config.SKILL_MAX_SECONDS,
+               inline_max=self.config.PIPELINE_INLINE_MAX)
+            
+            # Los resultados llegan en orden de finalización; el manifiesto se guarda ordenado
+            for i, item in enumerate(pipeline.run(items), 1):
+                skill_file = item.key
+                self.processed += 1
+                timings = {stage: round(seconds * 1000, 3) for stage, seconds in item.timings.items()}
+                if isinstance(item.error, (QuarantinedSkill, TimeoutError)):
+                    # Excede los límites: la salida anterior se conserva y la pasada sigue.
+                    # Solo los timeouts se recuerdan; el tamaño se vuelve a medir en cada pasada
+                    if isinstance(item.error, TimeoutError):
+                        self.quarantine.add(skill_file, str(item.error))
+                    quarantined.append(skill_file)
+                    self.failed.add(skill_file)
+                    self.logger.warning(f"En cuarentena: {skill_file} ({item.error})")
+                    for assistant_id in targets_for(skill_file):
+                        self.ui.event("skill", assistant=assistant_id, source=str(skill_file),
+                                      status="quarantined", error=str(item.error), timings_ms=timings)
+                elif item.error is not None:
+                    self.failed.add(skill_file)
+                    self.logger.error(f"Error transformando {skill_file}: {item.error}")
+                    self.ui.print_error(f"Error en {skill_file.name}: {str(item.error)[:50]}")
+                    for assistant_id in targets_for(skill_file):
+                        self.ui.event("skill", assistant=assistant_id, source=str(skill_file),
+                                      status="error", error=str(item.error), timings_ms=timings)
+                else:
+                    self.failed.discard(skill_file)
+                    for assistant_id, output in zip(targets_for(skill_file), item.payload):
+                        if output.bundled:
+                            bundled[assistant_id][Path(output.source_relative).as_posix()] = (
+                                output.content, estimate_tokens(output.content)
+                            )
+                            continue
+                        key, entry = OutputManifest.entry(output, self.config.PROJECT_ROOT)
+                        written[assistant_id][key] = entry
+                        full_bytes[assistant_id][key] = output.full_bytes or entry["bytes"]
+                        self.ui.event("skill", assistant=assistant_id, source=str(skill_file),
+                                      output=str(output.path), status="ok", timings_ms=timings)
+                
+                # Mostrar progreso (en streaming el total no se conoce hasta el final)
+                if not progress:
+                    continue
+                if streaming:
+                    self.ui.print_counter(i, f"Transformando {skill_file.stem}")
+                else:
+                    self.ui.print_progress_bar(i, len(skills), f"Transformando {skill_file.stem}")
+        
+        run(skills, progress=True)
+        
+        if streaming:
+            self.ui.console.print()
+            self.ui.print_success(f"Skills encontrados: {len(self.corpus)}")
+            self.ui.event("discovery", count=len(self.corpus))
+            
+            # Grafo completo (se guarda tras publicar) para que 'update' sea incremental desde el inicio
+            graph = SkillGraph.load(config=self.config)
+            graph.refresh(self.corpus)
+            if self.linter is not None:
+                self.linter.corpus = list(self.corpus)
+            
+            # Re-renderizar los skills cuyas secciones cambiaron de estado compartido
+            shared = self.shared_names(graph)
+            moved = {d for d in set(shared) | set(self.shared) if shared.get(d) != self.shared.get(d)}
+            affected = [
+                skill_file for skill_file in self.corpus
+                if moved & set(graph.nodes.get(SkillGraph.node_id(skill_file, self.config.SKILLS_SOURCE_DIR), {}).get("sections", {}))
+            ]
+            self.shared = shared
+            if affected and any(self._supports_includes(assistant_id) for assistant_id in assistant_ids):
+                self.logger.info(f"Contenido compartido actualizado: {len(affected)} skills a re-renderizar")
+                for assistant_id in assistant_ids:
+                    includes = self._includes[assistant_id]
+                    for name in set(includes) - set(shared.values()):
+                        del includes[name]
+                    for skill_file in affected:
+                        self._dedup_bytes[assistant_id].pop(str(skill_file), None)
+                run(affected, progress=False)
+        
+        self.ui.console.print()
+        counts = {assistant_id: len(written[assistant_id]) + len(bundled[assistant_id])
+                  for assistant_id in assistant_ids}
+        for assistant_id in assistant_ids:
+            self._finish_assistant(assistant_id, counts[assistant_id], written[assistant_id],
+                                   sum(full_bytes[assistant_id].values()), bundled[assistant_id])
+        if streaming:
+            graph.forget(self.failed)
+            graph.save()
+        
+        self.quarantine.save()
+        if quarantined:
+            self.ui.print_warning(
+                f"{len(quarantined)} skills en cuarentena por tamaño o tiempo (se reintentan al modificarse): "
+                + ", ".join(skill_file.name for skill_file in quarantined[:5])
+                + (" ..." if len(quarantined) > 5 else "")
+            )
+        
+        if self.linter is not None:
+            self.report_lint(self.linter.finish())
+            self.linter = None
+            self._linted = True
+        
+        return counts
+    
+    def _finish_assistant(self, assistant_id: str, count: int, written: Dict[str, Dict[str, Any]],
+                          full_bytes: int, bundled: Optional[Dict[str, Tuple[str, int]]] = None):
+        """Includes, bundle, manifiesto e informes de un asistente tras la pasada común"""
+        removed: List[str] = []
+        previous = OutputManifest(self.config.MANIFEST_FILE).assistant(assistant_id)
+        layout = self.layout_for(assistant_id)
+        if layout == "bundle":
+            output = self._write_bundle(assistant_id, bundled or {})
+            key, entry = OutputManifest.entry(output, self.config.PROJECT_ROOT)
+            written[key] = dict(entry, skills=len(self._bundles[assistant_id]))
+        if self._supports_includes(assistant_id):
+            rendered_bytes = sum(e["bytes"] for e in written.values())
+            for output in self.include_outputs(assistant_id):
+                data = encode_output(output.content)
+                if not output.path.exists() or output.path.read_bytes() != data:
+                    self.write_staged(output.path, data)
+                key, entry = OutputManifest.entry(output, self.config.PROJECT_ROOT)
+                written[key] = entry
+            removed = self._prune_includes(assistant_id)
+        
+        # Skills que la selección dejó fuera, con el layout ya resuelto (en bundle no entran al reescribirlo)
+        skipped = self._deselected.get(assistant_id)
+        if layout == "files" and skipped:
+            removed += self._remove_outputs(assistant_id, [
+                key for key, entry in previous.get("outputs", {}).items()
+                if key not in written and self._output_source(entry) in skipped
+            ])
+        
+        # Al cambiar de layout sobran las salidas del anterior (archivos sueltos o el bundle)
+        if previous.get("layout", "files") != layout:
+            removed += self._remove_outputs(assistant_id, [
+                key for key in previous.get("outputs", {}) if key not in written and key not in removed
+            ])
+        
+        # Cada directorio preparado se intercambia de golpe con el vigente; si un intercambio falla, se deshacen todos
+        self.publish(assistant_id, previous)
+        profile = self.profile_for(assistant_id)
+        OutputManifest(self.config.MANIFEST_FILE).update(assistant_id, written, removed, profile=profile, layout=layout)
+        
+        self.ui.print_success(
+            f"{self.config.ASSISTANTS[assistant_id]['name']}: {count} skills transformados exitosamente",
+            icon=self.ui.icons.SPARKLES
+        )
+        if profile == "compact" and layout == "files":
+            self.report_budget(assistant_id, full_bytes, sum(e["bytes"] for e in written.values()))
+        if self._supports_includes(assistant_id):
+            self.report_dedup(assistant_id, rendered_bytes)
+    
+    def layout_for(self, assistant_id: str) -> str:
+        """Layout de salida: el pedido o, si no, el registrado en el manifiesto"""
+        if assistant_id not in self._layouts:
+            self._layouts[assistant_id] = (
+                self.options.layout
+                or OutputManifest(self.config.MANIFEST_FILE).assistant(assistant_id).get("layout")
+                or "files"
+            )
+        return self._layouts[assistant_id]
+    
+    def bundle_path(self, assistant_id: str) -> Path:
+        return self._get_output_path(Path(f"{self.config.BUNDLE_NAME}.md"), assistant_id,
+                                     self.get_output_dir(assistant_id))
+    
+    def build_bundle(self, entries: Mapping[str, Tuple[str, int]]) -> Tuple[str, int]:
+        """Un archivo con todos los skills; el índice da offset, bytes y tokens de cada uno"""
+        sources = sorted(entries)
+        head = (
+            f"---\nname: {self.config.BUNDLE_NAME}\n"
+            f"description: Skills de {self.config.PROJECT_NAME} en un único archivo ({len(sources)} skills)\n---\n\n"
+            f"# 📦 {self.config.PROJECT_NAME} Skills\n\n"
+            "Índice: offset y tamaño en bytes desde el inicio del archivo, tokens estimados, fuente y nombre.\n\n"
+        )
+        sizes = {source: len(encode_output(entries[source][0])) for source in sources}
+        newline = len(encode_output("\n"))
+        
+        def toc(offsets: List[int]) -> str:
+            return "".join(
+                f"- {offset:010d} {sizes[source]:010d} {entries[source][1]} "
+                f"`{source}` {self.skill_slug(Path(source))}\n"
+                for source, offset in zip(sources, offsets)
+            ) + "\n"
+        
+        # Los offsets tienen ancho fijo: el tamaño del índice no depende de sus valores
+        index = head + toc([0] * len(sources))
+        position = len(encode_output(index))
+        offsets: List[int] = []
+        markers: List[str] = []
+        body: List[str] = []
+        for source in sources:
+            marker = self.BUNDLE_MARKER.format(source=source)
+            position += len(encode_output(marker))
+            offsets.append(position)
+            markers.append(marker)
+            body.append(marker + entries[source][0] + "\n")
+            position += sizes[source] + newline
+        # Tokens sin re-estimar el archivo completo: los de cada skill vienen del índice
+        tokens = (estimate_tokens(index) + estimate_tokens("".join(markers))
+                  + sum(entries[source][1] for source in sources))
+        return head + toc(offsets) + "".join(body), tokens
+    
+    def read_bundle(self, assistant_id: str) -> Dict[str, Tuple[str, int]]:
+        """Skills del bundle en disco (contenido y tokens) leídos por offset; vacío si falta o no es consistente"""
+        if assistant_id in self._bundles:
+            return self._bundles[assistant_id]
+        entries: Dict[str, Tuple[str, int]] = {}
+        try:
+            data = self.bundle_path(assistant_id).read_bytes()
+        except OSError:
+            data = b""
+        head = data.split(b"<!-- skill: ", 1)[0].decode('utf-8', errors='replace').replace(os.linesep, '\n')
+        for match in self.BUNDLE_TOC_RE.finditer(head):
+            offset, size, tokens, source = (int(match.group(1)), int(match.group(2)),
+                                            int(match.group(3)), match.group(4))
+            marker = encode_output(self.BUNDLE_MARKER.format(source=source))
+            if data[offset - len(marker):offset] != marker or offset + size > len(data):
+                self.logger.warning(f"Bundle de {assistant_id} inconsistente: se regenera completo")
+                entries = {}
+                break
+            entries[source] = (data[offset:offset + size].decode('utf-8').replace(os.linesep, '\n'), tokens)
+        self._bundles[assistant_id] = entries
+        return entries
+    
+    def _write_bundle(self, assistant_id: str, fresh: Dict[str, Tuple[str, int]]) -> RenderedOutput:
+        """Bundle anterior (por offsets) + skills re-renderizados, sin los que ya no existen"""
+        source_dir = self.config.SKILLS_SOURCE_DIR
+        corpus = {skill_file.relative_to(source_dir).as_posix() for skill_file in self.corpus}
+        skipped = self._deselected.get(assistant_id, set())
+        entries = {source: entry for source, entry in self.read_bundle(assistant_id).items()
+                   if (not corpus or source in corpus) and source not in skipped}
+        entries.update(fresh)
+        
+        content, tokens = self.build_bundle(entries)
+        output = RenderedOutput(
+            source_path=source_dir,
+            source_relative="",
+            source_sha256="",
+            path=self.bundle_path(assistant_id),
+            content=content,
+            tokens=tokens
+        )
+        data = encode_output(output.content)
+        if not output.path.exists() or output.path.read_bytes() != data:
+            self.write_staged(output.path, data)
+        self._bundles[assistant_id] = entries
+        self.logger.info(f"Bundle: {len(entries)} skills -> {output.path}")
+        return output
+    
+    def _remove_outputs(self, assistant_id: str, keys: List[str]) -> List[str]:
+        """Borra salidas registradas y los directorios por skill que queden vacíos"""
+        output_dir = self.get_output_dir(assistant_id)
+        for key in keys:
+            path = self.config.PROJECT_ROOT / key
+            target = self.delete_staged(path)
+            if path.parent != output_dir:
+                with contextlib.suppress(OSError):
+                    target.parent.rmdir()
+        return keys
+    
+    def profile_for(self, assistant_id: str) -> str:
+        """Perfil de render: el pedido o, si no, el registrado en el manifiesto"""
+        if assistant_id not in self._profiles:
+            self._profiles[assistant_id] = (
+                self.options.profile
+                or OutputManifest(self.config.MANIFEST_FILE).assistant(assistant_id).get("profile")
+                or "full"
+            )
+        return self._profiles[assistant_id]
+    
+    def report_budget(self, assistant_id: str, full_bytes: int, compact_bytes: int):
+        """Bytes ahorrados por el perfil compacto y total del asistente frente a su presupuesto"""
+        saved = full_bytes - compact_bytes
+        ratio = saved / full_bytes * 100 if full_bytes else 0.0
+        self.ui.print_info(
+            f"Perfil compacto: {full_bytes:,} → {compact_bytes:,} bytes "
+            f"({saved:,} ahorrados, -{ratio:.1f}%)"
+        )
+        self.ui.event("budget", assistant=assistant_id, full_bytes=full_bytes,
+                      compact_bytes=compact_bytes, saved_bytes=saved,
+                      budget=self.config.COMPACT_ASSISTANT_BUDGET)
+        
+        # El total cuenta todas las salidas registradas, no solo las de esta pasada
+        total = sum(e.get("bytes", 0) for e in OutputManifest(self.config.MANIFEST_FILE).assistant(assistant_id)["outputs"].values())
+        if total > self.config.COMPACT_ASSISTANT_BUDGET:
+            self.ui.print_warning(
+                f"{self.config.ASSISTANTS[assistant_id]['name']}: {total:,} bytes superan el presupuesto "
+                f"de {self.config.COMPACT_ASSISTANT_BUDGET:,}"
+            )
+    
+    def report_dedup(self, assistant_id: str, rendered_bytes: int):
+        """Bytes que dejan de repetirse gracias a los includes compartidos"""
+        includes = len(self._includes[assistant_id])
+        saved = sum(self._dedup_bytes[assistant_id].values())
+        ratio = saved / (rendered_bytes + saved) * 100 if rendered_bytes + saved else 0.0
+        if includes:
+            self.ui.print_info(
+                f"Contenido compartido: {includes} includes, {saved:,} bytes deduplicados ({ratio:.1f}%)"
+            )
+        self.ui.event("dedup", assistant=assistant_id, includes=includes,
+                      saved_bytes=saved, ratio=round(ratio, 2))
+    
+    def _supports_includes(self, assistant_id: str) -> bool:
+        return bool(self.config.ASSISTANTS[assistant_id].get("include_syntax"))
+    
+    def _begin_includes(self, assistant_id: str, skills: List[Path]):
+        """Carga las secciones compartidas del índice y reinicia lo usado por el asistente"""
+        if not self._supports_includes(assistant_id):
+            return
+        if self.shared is None:
+            graph = SkillGraph.load(config=self.config)
+            if graph.refresh(self.corpus or skills):
+                graph.save()
+            self.shared = self.shared_names(graph)
+        self._includes[assistant_id] = {}
+        self._dedup_bytes[assistant_id] = {}
+    
+    def shared_names(self, graph: 'SkillGraph') -> Dict[str, str]:
+        """Huella → nombre del include para las secciones compartidas del grafo"""
+        return {
+            digest: self._include_name(key, digest)
+            for digest, key in graph.shared_sections(self.config.SHARED_MIN_SKILLS).items()
+        }
+    
+    @staticmethod
+    def _include_name(key: str, digest: str) -> str:
+        """Nombre estable del include: clave de la sección + huella"""
+        slug = re.sub(r'[^\w]+', '-', key).strip('-')[:40] or "section"
+        return f"{slug}-{digest[:8]}.md"
+    
+    def _include_path(self, assistant_id: str, name: str) -> Path:
+        config = self.config.ASSISTANTS[assistant_id]
+        return self.config.get_assistant_dir(assistant_id) / config['shared_subdir'] / name
+    
+    def _factor_shared(self, skill: SkillData, assistant_id: str) -> SkillData:
+        """Sustituye las secciones compartidas por una referencia al include"""
+        syntax = self.config.ASSISTANTS[assistant_id]['include_syntax']
+        sections: Dict[str, str] = {}
+        saved = 0
+        factored = False
+        
+        for key in skill.sections:
+            size = section_size(skill.sections, key)
+            body = skill.sections[key]
+            name = self.shared.get(section_digest(body)) if size >= self.config.SHARED_MIN_BYTES else None
+            if name is None:
+                sections[key] = body
+                continue
+            
+            include = self._include_path(assistant_id, name)
+            pointer = syntax.format(path=project_relative(include, self.config.PROJECT_ROOT))
+            sections[key] = pointer
+            saved += size - len(pointer.encode('utf-8'))
+            factored = True
+            with self._lock:
+                # Fuente determinista del include aunque los skills terminen en cualquier orden
+                owner = self._includes[assistant_id].get(name)
+                if owner is None or skill.relative_path < owner[0].relative_path:
+                    self._includes[assistant_id][name] = (skill, body)
+        
+        if not factored:
+            return skill
+        with self._lock:
+            self._dedup_bytes[assistant_id][str(skill.file_path)] = saved
+        return replace(skill, sections=sections)
+    
+    def include_outputs(self, assistant_id: str) -> List[RenderedOutput]:
+        """Includes compartidos referenciados en la última pasada del asistente"""
+        outputs = []
+        for name, (skill, body) in sorted(self._includes[assistant_id].items()):
+            outputs.append(RenderedOutput(
+                source_path=skill.file_path,
+                source_relative=skill.relative_path,
+                source_sha256=hashlib.sha256(body.encode('utf-8')).hexdigest(),
+                path=self._include_path(assistant_id, name),
+                content=body + "\n"
+            ))
+        return outputs
+    
+    def _prune_includes(self, assistant_id: str) -> List[str]:
+        """Elimina includes de secciones que ya no se comparten"""
+        directory = self._include_path(assistant_id, "")
+        expected = set((self.shared or {}).values())
+        removed = []
+        if directory.is_dir():
+            for path in directory.glob("*.md"):
+                if path.name not in expected:
+                    self.delete_staged(path)
+                    removed.append(project_relative(path, self.config.PROJECT_ROOT))
+        return removed
+    
+    def lint_all(self, skills: List[Path]) -> List['LintIssue']:
+        """Solo lectura, parseo y lint: sin render ni escritura"""
+        linter = SkillLinter(self.corpus or skills, self.config)
+        pipeline = StagedPipeline([
+            ("read", self._read_skill, self.config.IO_WORKERS),
+            ("lint", lambda source: linter.check(self._parse_source(source)), self.config.CPU_WORKERS),
+        ], queue_size=self.config.PIPELINE_QUEUE_SIZE, inline_max=self.config.PIPELINE_INLINE_MAX)
+        
+        for item in pipeline.run(skills):
+            if item.error is not None:
+                linter.add(item.key, "parse-error", str(item.error), "error")
+        return linter.finish()
+    
+    def report_lint(self, issues: List['LintIssue']):
+        """Muestra los problemas del linter (los errores primero)"""
+        errors = sum(1 for issue in issues if issue.severity == "error")
+        warnings = len(issues) - errors
+        
+        for issue in issues:
+            self.logger.debug(f"Lint [{issue.code}] {issue.source}: {issue.message}")
+            self.ui.event("lint", **asdict(issue))
+        for issue in issues[:self.config.LINT_MAX_REPORTED]:
+            show = self.ui.print_error if issue.severity == "error" else self.ui.print_warning
+            show(f"{issue.source}: {issue.message}")
+        if len(issues) > self.config.LINT_MAX_REPORTED:
+            self.ui.print_muted(f"   ... y {len(issues) - self.config.LINT_MAX_REPORTED} más (ver setup.log)")
+        
+        if issues:
+            self.ui.print_warning(f"Lint: {errors} errores, {warnings} advertencias")
+        else:
+            self.ui.print_success("Lint: sin problemas")
+    
+    def stale_skills(self, skills: List[Path], assistant_id: str, impacted: Set[str]) -> List[Path]:
+        """Skills a regenerar: afectados por cambios o sin salida registrada en disco"""
+        previous = OutputManifest(self.config.MANIFEST_FILE).assistant(assistant_id)
+        # Tras un rollback las salidas no corresponden al grafo actual: se regenera todo una vez
+        if (previous.get("installer_version") != self.config.VERSION
+                or previous.get("rolled_back")
+                or previous.get("profile", "full") != self.profile_for(assistant_id)
+                or previous.get("layout", "files") != self.layout_for(assistant_id)):
+            return list(skills)
+        
+        if self.layout_for(assistant_id) == "bundle":
+            bundled = self.read_bundle(assistant_id)
+            source_dir = self.config.SKILLS_SOURCE_DIR
+            sources = {skill_file: skill_file.relative_to(source_dir).as_posix() for skill_file in skills}
+            return [skill_file for skill_file, source in sources.items()
+                    if source in impacted or source not in bundled]
+        
+        outputs = previous.get("outputs", {})
+        output_dir = self.get_output_dir(assistant_id)
+        stale = []
+        for skill_file in skills:
+            output_path = self._get_output_path(skill_file, assistant_id, output_dir)
+            if (SkillGraph.node_id(skill_file, self.config.SKILLS_SOURCE_DIR) in impacted
+                    or project_relative(output_path, self.config.PROJECT_ROOT) not in outputs
+                    or not output_path.exists()):
+                stale.append(skill_file)
+        return stale
+    
+    def render_all(self, skills: Iterable[Path], assistant_id: str) -> Iterator[PipelineItem]:
+        """Renderiza sin escribir; cada item trae un RenderedOutput o su error"""
+        output_dir = self.get_output_dir(assistant_id)
+        skills = list(skills)
+        self._begin_includes(assistant_id, skills)
+        pipeline = StagedPipeline([
+            ("read", self._read_skill, self.config.IO_WORKERS),
+            ("render", lambda source: self._render_skill(source, assistant_id, output_dir), self.config.CPU_WORKERS),
+        ], queue_size=self.config.PIPELINE_QUEUE_SIZE, inline_max=self.config.PIPELINE_INLINE_MAX)
+        return pipeline.run(skills)
+    
+    def get_output_dir(self, assistant_id: str) -> Path:
+        config = self.config.ASSISTANTS[assistant_id]
+        return self.config.get_assistant_dir(assistant_id) / config['skills_subdir']
+    
+    def _transform_single(self, skill_file: Path, assistant_id: str, output_dir: Path):
+        """Transforma un skill individual"""
+        source = self._read_skill(skill_file)
+        self._write_output(self._render_skill(source, assistant_id, output_dir))
+    
+    def _read_skill(self, skill_file: Path) -> SkillSource:
+        """Etapa de lectura (I/O)"""
+        if self.quarantine is not None:
+            self.quarantine.check(skill_file)
+        if self.warm or self._warm_sources:
+            stamp = source_stamp(skill_file)
+            cached = self._warm_sources.get(skill_file)
+            if cached and cached[0] == stamp:
+                return cached[1]
+        
+        if self._use_mmap(skill_file) and not self.warm:
+            mapped = MappedSkill(skill_file)
+            return SkillSource(skill_file, mapped, hashlib.sha256(mapped.buffer).hexdigest())
+        
+        data = read_source_bytes(skill_file)
+        content = decode_source(data)
+        source = SkillSource(skill_file, content, hashlib.sha256(data).hexdigest())
+        if self.warm:
+            self._warm_sources[skill_file] = (stamp, source)
+        return source
+    
+    def _parse_source(self, source: SkillSource) -> SkillData:
+        """Parseo de la etapa de render; en modo serve o tras la precarga se reutiliza si la fuente no cambió"""
+        if not (self.warm or self._warm_parsed):
+            return self._parse_skill(source.path, source.content)
+        cached = self._warm_parsed.get(source.path)
+        if cached and cached[0] == source.sha256:
+            return cached[1]
+        skill = self._parse_skill(source.path, source.content)
+        if self.warm:
+            self._warm_parsed[source.path] = (source.sha256, skill)
+        return skill
+    
+    def prefetch(self, skill_file: Path) -> Tuple[Tuple[int, str, int], SkillSource, SkillData]:
+        """Lee y parsea un skill para las cachés en caliente; no lo guarda (ver keep_prefetched)"""
+        stamp = source_stamp(skill_file)
+        data = read_source_bytes(skill_file)
+        source = SkillSource(skill_file, decode_source(data), hashlib.sha256(data).hexdigest())
+        return stamp, source, self._parse_skill(skill_file, source.content)
+    
+    def keep_prefetched(self, stamp: Tuple[int, str, int], source: SkillSource, skill: SkillData):
+        self._warm_sources[source.path] = (stamp, source)
+        self._warm_parsed[source.path] = (source.sha256, skill)
+    
+    def drop_prefetched(self):
+        """Libera lo precargado (en modo serve las cachés se conservan)"""
+        if not self.warm:
+            self._warm_sources.clear()
+            self._warm_parsed.clear()
+    
+    def _use_mmap(self, skill_file: Path) -> bool:
+        if self.options.mmap_mode != "never" and archive_member(skill_file) is not None:
+            return False  # Los miembros de un zip/tar se leen del archivo
+        if self.options.mmap_mode == "auto":
+            return skill_file.stat().st_size >= self.config.MMAP_THRESHOLD
+        return self.options.mmap_mode == "always"
+    
+    def _parse_stage(self, source: SkillSource) -> Tuple[SkillSource, SkillData]:
+        """Etapa de parseo (CPU): la representación que comparten todos los destinos"""
+        skill_data = self._parse_source(source)
+        if self.linter is not None:
+            self.linter.check(skill_data)
+        return source, skill_data
+    
+    def _render_skill(self, source: SkillSource, assistant_id: str, output_dir: Path,
+                      skill_data: Optional[SkillData] = None) -> RenderedOutput:
+        """Etapa de render (CPU); parsea la fuente si no recibe el skill ya parseado"""
+        if skill_data is None:
+            source, skill_data = self._parse_stage(source)
+        if self.shared and self._supports_includes(assistant_id):
+            skill_data = self._factor_shared(skill_data, assistant_id)
+        
+        # Transformar según asistente
+        if assistant_id == "opencode":
+            rendered = self._to_opencode(skill_data)
+        elif assistant_id == "claude":
+            rendered = self._to_claude(skill_data)
+        elif assistant_id == "cursor":
+            rendered = self._to_cursor(skill_data)
+        else:
+            raise ValueError(f"Asistente no soportado: {assistant_id}")
+        
+        full_bytes = 0
+        if self.profile_for(assistant_id) == "compact":
+            full_bytes = len(encode_output(rendered))
+            rendered = self._compact(rendered, skill_data)
+        
+        return RenderedOutput(
+            source_path=source.path,
+            source_relative=skill_data.relative_path,
+            source_sha256=source.sha256,
+            path=self._get_output_path(source.path, assistant_id, output_dir),
+            content=rendered,
+            full_bytes=full_bytes,
+            bundled=self.layout_for(assistant_id) == "bundle"
+        )
+    
+    def _compact(self, rendered: str, skill: SkillData) -> str:
+        """Perfil compacto: sin bloques fijos ni relleno, espacios colapsados y recorte al presupuesto"""
+        rendered = rendered.replace(self.OPENCODE_PROTOCOLS, "")
+        rendered = self.COMPACT_DROP_RE.sub("", rendered)
+        rendered = self.PLACEHOLDER_RE.sub("", rendered)
+        
+        # Colapsar espacios fuera de los bloques de código
+        lines: List[str] = []
+        in_code = False
+        for line in rendered.split('\n'):
+            if line.lstrip().startswith('```'):
+                in_code = not in_code
+            if not in_code:
+                line = line.rstrip()
+                if not line and (not lines or not lines[-1]):
+                    continue
+            lines.append(line)
+        rendered = '\n'.join(lines).strip('\n') + '\n'
+        
+        return self._fit_budget(rendered, skill)
+    
+    def _fit_budget(self, rendered: str, skill: SkillData) -> str:
+        """Recorta en un salto de línea para no superar COMPACT_SKILL_BUDGET"""
+        budget = self.config.COMPACT_SKILL_BUDGET
+        if len(encode_output(rendered)) <= budget:
+            return rendered
+        
+        marker = f"\n> ✂️ Recortado a {budget:,} bytes; ver `{skill.relative_path}`\n"
+        fence = "```\n"
+        # Se mide ya codificado (saltos de línea del sistema); se reserva sitio para cerrar un bloque
+        used = len(encode_output(marker)) + len(encode_output(fence))
+        kept: List[str] = []
+        in_code = False
+        for line in rendered.split('\n'):
+            used += len(encode_output(line + '\n'))
+            if used > budget:
+                break
+            kept.append(line + '\n')
+            if line.lstrip().startswith('```'):
+                in_code = not in_code
+        if in_code:
+            kept.append(fence)
+        
+        self.logger.warning(f"{skill.relative_path}: salida recortada al presupuesto de {budget} bytes")
+        return ''.join(kept) + marker
+    
+    def _write_output(self, output: RenderedOutput) -> RenderedOutput:
+        """Etapa de escritura (I/O), en la generación en preparación"""
+        self.write_staged(output.path, encode_output(output.content))
+        
+        self.logger.info(f"Transformado: {output.source_path.name} -> {output.path}")
+        return output
+    
+    def _parse_skill(self, skill_file: Path, content: Any = None) -> SkillData:
+        """Extrae información de un archivo de skill"""
+        if content is None:
+            content = self._read_skill(skill_file).content
+        if isinstance(content, MappedSkill):
+            if self.LONE_CR_RE_BYTES.search(content.view) is None:
+                return self._parse_mapped(skill_file, content)
+            content = content.text()
+        
+        # Frontmatter YAML opcional
+        metadata, offset = split_frontmatter(content)
+        body = content[offset:] if offset else content
+        
+        # Extraer título (# Título)
+        title_match = re.search(r'^# (.+)$', body, re.MULTILINE)
+        title = title_match.group(1) if title_match else skill_file.stem
+        
+        # Extraer secciones
+        sections = split_sections(body)
+        
+        return SkillData(
+            name=skill_file.stem,
+            title=title,
+            file_path=skill_file,
+            relative_path=str(skill_file.relative_to(self.config.SKILLS_SOURCE_DIR)),
+            sections=sections,
+            metadata=metadata,
+            _raw=content
+        )
+    
+    def _parse_mapped(self, skill_file: Path, source: MappedSkill) -> SkillData:
+        """Parseo zero-copy: localiza encabezados sobre los bytes y guarda solo offsets"""
+        buffer = source.view
+        
+        # Frontmatter YAML opcional; el cuerpo empieza tras el delimitador de cierre
+        metadata, offset = {}, 0
+        frontmatter = FRONTMATTER_RE_BYTES.match(buffer)
+        if frontmatter:
+            metadata = parse_frontmatter(source.decode(*frontmatter.span(1)))
+            offset = frontmatter.end()
+        
+        title_match = self.TITLE_RE_BYTES.search(buffer, offset)
+        title = source.decode(*title_match.span(1)) if title_match else skill_file.stem
+        
+        spans: Dict[str, Tuple[int, int]] = {}
+        headings = list(self.SECTION_RE_BYTES.finditer(buffer, offset))
+        
+        for i, match in enumerate(headings):
+            key = source.decode(*match.span(1)).strip().lower().replace(' ', '_')
+            if i + 1 < len(headings):
+                body_end = headings[i + 1].start()
+            elif match.end() < len(buffer):
+                body_end = len(buffer)
+            else:
+                # Encabezado final sin contenido
+                continue
+            spans[key] = (min(match.end() + 1, body_end), body_end)
+        
+        return SkillData(
+            name=skill_file.stem,
+            title=title,
+            file_path=skill_file,
+            relative_path=str(skill_file.relative_to(self.config.SKILLS_SOURCE_DIR)),
+            sections=LazySections(source, spans),
+            metadata=metadata,
+            _raw=source
+        )
+    
+    @staticmethod
+    def skill_slug(skill_file: Path) -> str:
+        """Nombre normalizado con el que se publica el skill"""
+        return skill_file.stem.lower().replace('_', '-').replace(' ', '-')
+    
+    def _get_output_path(self, skill_file: Path, assistant_id: str, output_dir: Path) -> Path:
+        """Determina la ruta de salida según el asistente"""
+        config = self.config.ASSISTANTS[assistant_id]
+        skill_name = self.skill_slug(skill_file)
+        
+        if config.get('create_subdir', False):
+            # Estructura: .opencode/skills/{skill-name}/SKILL.md
             return output_dir / skill_name / config['filename_template']
         else:
             # Estructura: .claude/commands/{skill-name}.md
@@ -896,46 +3611,37 @@ class SkillTransformer:
     
     def _to_opencode(self, skill: SkillData) -> str:
         """Transforma a formato Opencode"""
-        sections = skill.sections
-        
-        return f"""---
-name: {skill.name.lower().replace('_', '-').replace(' ', '-')}
-description: {sections.get('rol', 'Skill de AppNotesBG')[:100]}
-version: "1.0.0"
-source: {skill.relative_path}
-generated_at: {datetime.now().isoformat()}
-tags: [{skill.name.lower().replace('_', '-')}, appnotesbg]
----
-
+        frontmatter = {
+            "name": skill.name.lower().replace('_', '-').replace(' ', '-'),
+            "description": skill.get('description', skill.get('rol', 'Skill de AppNotesBG'))[:100],
+            "version": "1.0.0",
+            "source": skill.relative_path,
+            "generated_at": datetime.now().isoformat(),
+            "tags": [skill.name.lower().replace('_', '-'), "appnotesbg"],
+        }
+        
+        # Fusionar el frontmatter de la fuente (name, source y generated_at los fija el instalador)
+        for key, value in skill.metadata.items():
+            if key == "tags":
+                extra = value if isinstance(value, list) else [value]
+                frontmatter["tags"] += [str(t) for t in extra if str(t) not in frontmatter["tags"]]
+            elif key not in ("name", "source", "generated_at", "description"):
+                frontmatter[key] = value
+        
+        return f"""{dump_frontmatter(frontmatter)}
 # 🎯 What I Do
-{sections.get('rol', 'Sin descripción')}
+{skill.get('rol', 'Sin descripción')}
 
 # ⚡ When to Use Me
-{sections.get('activacion', 'Cuando sea necesario')}
+{skill.get('activacion', 'Cuando sea necesario')}
 
 # 🔄 How to Use Me
 
 ## Execution Flow
-{sections.get('flujo_de_ejecucion', sections.get('protocolo_de_entrada', 'Seguir las instrucciones del skill'))}
-
-## Input Protocol
-```json
-{{
-  "action": "string",
-  "data": {{}}
-}}
-```
-
-## Output Protocol
-```json
-{{
-  "success": true,
-  "result": {{}}
-}}
-```
-
-# ⚠️ Constraints
-{sections.get('restricciones_clave', 'Seguir las reglas del proyecto')}
+{skill.get('flujo_de_ejecucion', skill.get('protocolo_de_entrada', 'Seguir las instrucciones del skill'))}
+
+{self.OPENCODE_PROTOCOLS}# ⚠️ Constraints
+{skill.get('restricciones_clave', 'Seguir las reglas del proyecto')}
 
 # 📚 References
 - **Source**: `{skill.relative_path}`
@@ -943,72 +3649,780 @@ tags: [{skill.name.lower().replace('_', '-')}, appnotesbg]
 - **Generated**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 ---
-*Generated by AppNotesBG Multi-Assistant Installer v{CONFIG.VERSION}*
+*Generated by AppNotesBG Multi-Assistant Installer v{self.config.VERSION}*
 """
     
+    def _source_frontmatter(self, skill: SkillData) -> str:
+        """Frontmatter de la fuente para formatos que no generan uno propio"""
+        return dump_frontmatter(skill.metadata) + "\n" if skill.metadata else ""
+    
     def _to_claude(self, skill: SkillData) -> str:
         """Transforma a formato Claude Code"""
-        sections = skill.sections
-        
-        return f"""# {skill.title}
+        return f"""{self._source_frontmatter(skill)}# {skill.title}
 
 ## 🎯 Role
-{sections.get('rol', 'Sin descripción')}
+{skill.get('rol', 'Sin descripción')}
 
 ## 📊 Level
-{sections.get('nivel', 'Not specified')}
+{skill.get('nivel', 'Not specified')}
 
 ## 🌍 Domain
-{sections.get('dominio', 'General')}
+{skill.get('dominio', 'General')}
 
 ## ⚡ When to Use
-{sections.get('activacion', 'Use when needed')}
+{skill.get('activacion', 'Use when needed')}
 
 ## 🔄 Execution Flow
-{sections.get('flujo_de_ejecucion', sections.get('protocolo_de_entrada', 'Follow instructions'))}
+{skill.get('flujo_de_ejecucion', skill.get('protocolo_de_entrada', 'Follow instructions'))}
 
 ## 📥 Input Protocol
-{sections.get('protocolo_de_entrada', 'JSON format')}
+{skill.get('protocolo_de_entrada', 'JSON format')}
 
 ## 📤 Output Protocol
-{sections.get('protocolo_de_salida', 'JSON format')}
+{skill.get('protocolo_de_salida', 'JSON format')}
 
 ## ⚠️ Constraints
-{sections.get('restricciones_clave', sections.get('reglas', 'Follow best practices'))}
+{skill.get('restricciones_clave', skill.get('reglas', 'Follow best practices'))}
 
 ## 📚 References
 - **Source**: `{skill.relative_path}`
 - **Generated**: {datetime.now().isoformat()}
 
 ---
-*Generated by AppNotesBG Multi-Assistant Installer v{CONFIG.VERSION}*
+*Generated by AppNotesBG Multi-Assistant Installer v{self.config.VERSION}*
 """
     
     def _to_cursor(self, skill: SkillData) -> str:
         """Transforma a formato Cursor"""
-        sections = skill.sections
-        
-        return f"""# {skill.title}
+        return f"""{self._source_frontmatter(skill)}# {skill.title}
 
 ## Description
-{sections.get('rol', 'Skill for AppNotesBG')}
+{skill.get('rol', 'Skill for AppNotesBG')}
 
 ## Activation
-{sections.get('activacion', 'Automatic or on demand')}
+{skill.get('activacion', 'Automatic or on demand')}
 
 ## Rules
-{sections.get('restricciones_clave', sections.get('reglas', 'Follow best practices'))}
+{skill.get('restricciones_clave', skill.get('reglas', 'Follow best practices'))}
 
 ## Workflow
-{sections.get('flujo_de_ejecucion', 'Execute as documented')}
+{skill.get('flujo_de_ejecucion', 'Execute as documented')}
 
 ## Source
 {skill.relative_path}
 
 ---
-*Generated by AppNotesBG Multi-Assistant Installer v{CONFIG.VERSION}*
+*Generated by AppNotesBG Multi-Assistant Installer v{self.config.VERSION}*
 """
 
+# =============================================================================
+# LINTER DE SKILLS
+# =============================================================================
+
+@dataclass
+class LintIssue:
+    """Problema detectado en un skill"""
+    source: str
+    code: str      # missing-section | oversized-section | duplicate-name | broken-reference | parse-error
+    message: str
+    severity: str = "warning"  # warning | error
+
+class SkillLinter:
+    """Validaciones sobre el skill ya parseado; las cruzadas se resuelven al final"""
+    
+    def __init__(self, corpus: List[Path], config: Optional['Config'] = None):
+        self.config = config or CONFIG
+        self.corpus = list(corpus)
+        self.issues: List[LintIssue] = []
+        self.refs: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, skill_file: Path, code: str, message: str, severity: str = "warning"):
+        with self._lock:
+            self.issues.append(LintIssue(project_relative(skill_file, self.config.PROJECT_ROOT), code, message, severity))
+    
+    def check(self, skill: SkillData) -> SkillData:
+        """Chequeos por skill; corre en los workers de render"""
+        for key in self.config.LINT_REQUIRED_SECTIONS:
+            if not skill.get(key, ""):
+                self.add(skill.file_path, "missing-section", f"Falta la sección obligatoria '{key}'")
+        
+        for key in skill.sections:
+            size = section_size(skill.sections, key)
+            if size > self.config.LINT_MAX_SECTION_BYTES:
+                self.add(skill.file_path, "oversized-section",
+                         f"Sección '{key}' de {size} bytes (máx. {self.config.LINT_MAX_SECTION_BYTES})")
+        
+        # Por tramos: el lint no deshace el parseo sin copia de los skills mapeados
+        refs = SkillGraph.extract_refs(skill.text_chunks())
+        with self._lock:
+            self.refs[SkillGraph.node_id(skill.file_path, self.config.SKILLS_SOURCE_DIR)] = refs
+        return skill
+    
+    def finish(self) -> List[LintIssue]:
+        """Chequeos cruzados (nombres duplicados, referencias rotas) y orden estable"""
+        by_slug: Dict[str, List[Path]] = defaultdict(list)
+        for skill_file in self.corpus:
+            by_slug[SkillTransformer.skill_slug(skill_file)].append(skill_file)
+        for slug, files in by_slug.items():
+            if len(files) > 1:
+                others = ", ".join(project_relative(f, self.config.PROJECT_ROOT) for f in files)
+                for skill_file in files:
+                    self.add(skill_file, "duplicate-name", f"Nombre '{slug}' duplicado: {others}", "error")
+        
+        resolver = ReferenceResolver(SkillGraph.node_id(f, self.config.SKILLS_SOURCE_DIR) for f in self.corpus)
+        for node, refs in self.refs.items():
+            skill_file = self.config.SKILLS_SOURCE_DIR / node
+            for ref in refs:
+                if not resolver.resolve(node, ref) and not self._exists(skill_file, ref):
+                    self.add(skill_file, "broken-reference", f"Referencia rota: {ref}")
+        
+        return sorted(self.issues, key=lambda i: (i.severity != "error", i.source, i.code, i.message))
+    
+    def _exists(self, skill_file: Path, ref: str) -> bool:
+        """Referencias a archivos del proyecto que no son skills (NEGOCIO.md, etc.)"""
+        bases = (skill_file.parent, self.config.SKILLS_SOURCE_DIR, self.config.PROJECT_ROOT)
+        return any(source_exists(base / ref) for base in bases)
+
+# =============================================================================
+# PLAN / APPLY
+# =============================================================================
+
+class InstallPlanner:
+    """Calcula los cambios de una instalación y los aplica sin volver a parsear"""
+    
+    PLAN_VERSION = 1
+    
+    def __init__(self, ui: UI, logger: SetupLogger, transformer: SkillTransformer):
+        self.ui = ui
+        self.logger = logger
+        self.transformer = transformer
+        self.manifest = OutputManifest(transformer.config.MANIFEST_FILE)
+    
+    def build(self, assistants: List[str], skills: Optional[List[Path]] = None) -> Dict[str, Any]:
+        """Renderiza en memoria y compara con el manifiesto y el disco"""
+        if skills is None:
+            skills = self.transformer.discover_skills()
+        
+        sources: Dict[str, Dict[str, Any]] = {}
+        changes: List[Dict[str, Any]] = []
+        errors: List[Dict[str, str]] = []
+        profiles: Dict[str, str] = {}
+        unchanged = 0
+        
+        for assistant_id in assistants:
+            previous = self.manifest.assistant(assistant_id)
+            outputs = previous.get("outputs", {})
+            profiles[assistant_id] = self.transformer.profile_for(assistant_id)
+            same_version = (previous.get("installer_version") == CONFIG.VERSION
+                            and previous.get("profile", "full") == profiles[assistant_id])
+            expected = set()
+            rendered: List[RenderedOutput] = []
+            
+            # Lo que la selección excluye no se renderiza: sus salidas registradas se planifican como borrado
+            for item in self.transformer.render_all(self.transformer.select(skills, assistant_id), assistant_id):
+                if item.error is not None:
+                    errors.append({"assistant": assistant_id, "source": str(item.key), "error": str(item.error)})
+                    sources[str(item.key.relative_to(CONFIG.SKILLS_SOURCE_DIR))] = self._fingerprint(item.key)
+                    continue
+                
+                output = item.payload
+                sources[output.source_relative] = self._fingerprint(output.source_path, output.source_sha256)
+                rendered.append(output)
+            
+            # Los includes compartidos se planifican como una salida más
+            for output in rendered + self.transformer.include_outputs(assistant_id):
+                key, entry = OutputManifest.entry(output, self.transformer.config.PROJECT_ROOT)
+                expected.add(key)
+                previous_entry = outputs.get(key)
+                
+                if not output.path.exists():
+                    action = "create"
+                elif (same_version and previous_entry
+                      and previous_entry.get("source_sha256") == output.source_sha256
+                      and self._matches(output.path, previous_entry)):
+                    unchanged += 1
+                    continue
+                else:
+                    action = "update"
+                
+                changes.append(dict(entry, action=action, assistant=assistant_id, path=key, content=output.content))
+            
+            # Solo se borran salidas que el instalador generó (registradas en el manifiesto)
+            for key, entry in outputs.items():
+                if key not in expected and (CONFIG.PROJECT_ROOT / key).exists():
+                    changes.append(dict(entry, action="delete", assistant=assistant_id, path=key))
+        
+        # También lo que la selección excluye: si cambia su dominio o nivel, la selección cambia con él
+        for skill_file in skills:
+            relative = str(skill_file.relative_to(CONFIG.SKILLS_SOURCE_DIR))
+            if relative not in sources:
+                sources[relative] = self._fingerprint(skill_file)
+        
+        written = [c for c in changes if c["action"] != "delete"]
+        return {
+            "plan_version": self.PLAN_VERSION,
+            "installer_version": CONFIG.VERSION,
+            "created_at": datetime.now().isoformat(),
+            "assistants": assistants,
+            "profiles": profiles,
+            "selections": {assistant_id: self.transformer.selections.get(assistant_id, SkillSelection()).to_dict()
+                           for assistant_id in assistants},
+            "sources": sources,
+            "changes": changes,
+            "errors": errors,
+            "estimated_cost": {
+                "write_ops": len(written),
+                "delete_ops": len(changes) - len(written),
+                "bytes_written": sum(c["bytes"] for c in written),
+                "unchanged": unchanged,
+            },
+        }
+    
+    def _fingerprint(self, path: Path, sha256: Optional[str] = None) -> Dict[str, Any]:
+        size, stamp_key, stamp = source_stamp(path)
+        return {
+            "size": size,
+            stamp_key: stamp,
+            "sha256": sha256 or hashlib.sha256(read_source_bytes(path)).hexdigest(),
+        }
+    
+    def _matches(self, path: Path, entry: Dict[str, Any]) -> bool:
+        """El archivo en disco es el que registró el manifiesto"""
+        try:
+            return path.stat().st_size == entry.get("bytes") and sha256_file(path) == entry.get("sha256")
+        except OSError:
+            return False
+    
+    def display(self, plan: Dict[str, Any]):
+        """Muestra el resumen del plan por asistente"""
+        table = self.ui.create_table("Plan de instalación")
+        table.add_column("Asistente", width=15)
+        table.add_column("Crear", justify="right")
+        table.add_column("Actualizar", justify="right")
+        table.add_column("Eliminar", justify="right")
+        table.add_column("Bytes", justify="right")
+        
+        for assistant_id in plan["assistants"]:
+            config = CONFIG.ASSISTANTS[assistant_id]
+            changes = [c for c in plan["changes"] if c["assistant"] == assistant_id]
+            counts = {action: sum(1 for c in changes if c["action"] == action)
+                      for action in ("create", "update", "delete")}
+            table.add_row(
+                f"{config['emoji']} {config['name']}",
+                str(counts["create"]),
+                str(counts["update"]),
+                str(counts["delete"]),
+                f"{sum(c['bytes'] for c in changes if c['action'] != 'delete'):,}"
+            )
+        
+        self.ui.console.print(table)
+        
+        cost = plan["estimated_cost"]
+        self.ui.print_info(
+            f"Coste estimado: {cost['write_ops']} escrituras, {cost['delete_ops']} borrados, "
+            f"{cost['bytes_written']:,} bytes ({cost['unchanged']} sin cambios)"
+        )
+        for error in plan["errors"]:
+            self.ui.print_error(f"Error en {error['source']}: {error['error'][:50]}")
+        
+        self.ui.event("plan", assistants=plan["assistants"], estimated_cost=cost,
+                      changes=[{k: c[k] for k in ("action", "assistant", "path", "bytes")} for c in plan["changes"]],
+                      errors=plan["errors"])
+    
+    def save(self, plan: Dict[str, Any], path: Path):
+        atomic_write_text(path, json.dumps(plan, indent=2, ensure_ascii=False))
+    
+    def load(self, path: Path) -> Dict[str, Any]:
+        plan = json.loads(path.read_text(encoding='utf-8'))
+        if plan.get("plan_version") != self.PLAN_VERSION:
+            raise ValueError(f"Versión de plan no soportada: {plan.get('plan_version')}")
+        return plan
+    
+    def changed_sources(self, plan: Dict[str, Any]) -> List[str]:
+        """Fuentes añadidas, eliminadas o modificadas desde que se generó el plan"""
+        planned = plan["sources"]
+        current = {
+            str(path.relative_to(CONFIG.SKILLS_SOURCE_DIR)): path
+            for path in self.transformer.iter_skills()
+        }
+        
+        changed = sorted(set(planned) ^ set(current))
+        for relative, fingerprint in planned.items():
+            path = current.get(relative)
+            if path is None:
+                continue
+            size, stamp_key, stamp = source_stamp(path)
+            if size != fingerprint["size"]:
+                changed.append(relative)
+            elif (stamp != fingerprint.get(stamp_key)
+                  and hashlib.sha256(read_source_bytes(path)).hexdigest() != fingerprint["sha256"]):
+                changed.append(relative)
+        return changed
+    
+    def apply(self, plan: Dict[str, Any]) -> int:
+        """Ejecuta los cambios del plan y actualiza el manifiesto"""
+        written: Dict[str, Dict[str, Dict[str, Any]]] = {a: {} for a in plan["assistants"]}
+        removed: Dict[str, List[str]] = {a: [] for a in plan["assistants"]}
+        
+        with self.transformer.transaction(plan["assistants"]):
+            for change in plan["changes"]:
+                path = CONFIG.PROJECT_ROOT / change["path"]
+                if change["action"] == "delete":
+                    target = self.transformer.delete_staged(path)
+                    if path.parent != self.transformer.get_output_dir(change["assistant"]):
+                        self._prune_empty_dir(target.parent)
+                    removed[change["assistant"]].append(change["path"])
+                else:
+                    self.transformer.write_staged(path, encode_output(change["content"]))
+                    written[change["assistant"]][change["path"]] = {
+                        k: change[k] for k in ("source", "source_sha256", "sha256", "bytes", "tokens")
+                    }
+                self.logger.info(f"Plan aplicado: {change['action']} {change['path']}")
+                self.ui.event("change", action=change["action"], assistant=change["assistant"], path=change["path"])
+            
+            for assistant_id in plan["assistants"]:
+                self.transformer.publish(assistant_id, self.manifest.assistant(assistant_id))
+                self.manifest.update(assistant_id, written[assistant_id], removed[assistant_id],
+                                     profile=plan.get("profiles", {}).get(assistant_id))
+        
+        return len(plan["changes"])
+    
+    def _prune_empty_dir(self, directory: Path):
+        """Elimina el subdirectorio del skill si quedó vacío"""
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+
+# =============================================================================
+# SERVIDOR EN CALIENTE
+# =============================================================================
+
+def server_request(payload: Dict[str, Any], timeout: float = 60.0) -> Optional[Dict[str, Any]]:
+    """Envía una petición al servidor 'serve'; None si no hay ninguno escuchando"""
+    if not hasattr(socket, "AF_UNIX") or not CONFIG.SERVE_SOCKET.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(CONFIG.SERVE_SOCKET))
+            sock.sendall(json.dumps(payload).encode('utf-8') + b"\n")
+            line = sock.makefile('rb').readline()
+    except OSError:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def serve_client(full: bool = False) -> int:
+    """--client: encola una actualización en 'serve' sin esperar (el hook usa skills/tools/serve_client.py)"""
+    response = server_request({"cmd": "update", "full": full, "wait": False}, timeout=TransformServer.CLIENT_TIMEOUT)
+    return 0 if response is not None and response.get("ok") else 1
+
+class TransformServer:
+    """Proceso de larga vida que atiende regeneraciones por un socket Unix"""
+    
+    MAX_REQUEST_BYTES = 64 * 1024
+    # accept() despierta cada segundo para ver si hay que salir; un cliente no retiene más de 5 s
+    ACCEPT_TIMEOUT = 1.0
+    CLIENT_TIMEOUT = 5.0
+    
+    def __init__(self, ui: UI, logger: SetupLogger, options: Optional[TransformOptions] = None):
+        self.ui = ui
+        self.logger = logger
+        self.options = options or TransformOptions()
+        self.path = CONFIG.SERVE_SOCKET
+        self.transformer = SkillTransformer(ui, logger, self.options)
+        self.transformer.warm = True
+        self.started = time.time()
+        self._running = False
+        # Actualizaciones sin espera: varias solicitudes seguidas se agrupan en una pasada
+        self._queued = threading.Event()
+        self._queued_full = False
+        self._update_lock = threading.Lock()
+    
+    def serve(self) -> int:
+        if not hasattr(socket, "AF_UNIX"):
+            self.ui.print_error("Este sistema no soporta sockets Unix")
+            return 1
+        
+        CONFIG.STATE_DIR.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            if server_request({"cmd": "ping"}, timeout=1.0) is not None:
+                self.ui.print_error(f"Ya hay un servidor escuchando en {self.path}")
+                return 1
+            # Socket huérfano de un servidor que terminó mal
+            self.path.unlink()
+        
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(str(self.path))
+            self.path.chmod(0o600)
+            sock.listen(8)
+            sock.settimeout(self.ACCEPT_TIMEOUT)
+            
+            # Primera pasada: deja el corpus leído y parseado en memoria
+            self._update({})
+            self.ui.print_success(f"Servidor escuchando en {project_relative(self.path)} (Ctrl+C para salir)")
+            self.ui.event("serve", socket=str(self.path), pid=os.getpid())
+            
+            self._running = True
+            worker = threading.Thread(target=self._drain, name="serve-updates", daemon=True)
+            worker.start()
+            while self._running:
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(self.CLIENT_TIMEOUT)
+                    self._serve_connection(conn)
+            # La pasada en curso termina antes de salir
+            worker.join()
+        except KeyboardInterrupt:
+            self.ui.print_muted("Servidor detenido")
+        finally:
+            sock.close()
+            self.path.unlink(missing_ok=True)
+        return 0
+    
+    def _serve_connection(self, conn: socket.socket):
+        """Una petición JSON por línea y una respuesta JSON por línea"""
+        try:
+            line = conn.makefile('rb').readline(self.MAX_REQUEST_BYTES)
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("la petición debe ser un objeto JSON")
+            response = self.handle(request)
+        except ValueError as e:
+            response = {"ok": False, "error": f"Petición inválida: {e}"}
+        except Exception as e:
+            self.logger.error(f"Error atendiendo petición: {e}", exc_info=True)
+            response = {"ok": False, "error": str(e)}
+        try:
+            conn.sendall(json.dumps(response).encode('utf-8') + b"\n")
+        except OSError:
+            pass
+    
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command = request.get("cmd")
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid(), "uptime_s": round(time.time() - self.started, 3)}
+        if command == "update":
+            if request.get("wait", True):
+                return self._update(request)
+            # Se confirma antes de empezar: el cliente (git checkout) no espera a la pasada
+            self._queued_full = self._queued_full or bool(request.get("full"))
+            self._queued.set()
+            return {"ok": True, "queued": True}
+        if command == "shutdown":
+            self._running = False
+            return {"ok": True}
+        return {"ok": False, "error": f"Comando desconocido: {command}"}
+    
+    def _drain(self):
+        """Hilo de actualizaciones encoladas: accept() sigue atendiendo mientras corre una pasada"""
+        while self._running:
+            if not self._queued.wait(timeout=self.ACCEPT_TIMEOUT):
+                continue
+            self._queued.clear()
+            full, self._queued_full = self._queued_full, False
+            try:
+                self._update({"full": full})
+            except Exception as e:
+                self.logger.error(f"Error en actualización encolada: {e}", exc_info=True)
+    
+    def _update(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with self._update_lock:
+            start = time.perf_counter()
+            self.transformer.options = replace(self.options, full=bool(request.get("full", self.options.full)))
+            with FileLock(CONFIG.UPDATE_LOCK):
+                rc = cmd_update(self.ui, self.logger, transformer=self.transformer)
+        elapsed = round((time.perf_counter() - start) * 1000, 3)
+        self.logger.info(f"Actualización servida en {elapsed} ms (rc={rc})")
+        return {"ok": rc == 0, "rc": rc, "elapsed_ms": elapsed}
+
+# =============================================================================
+# HISTORIAL DE RENDIMIENTO
+# =============================================================================
+
+def peak_rss_kb() -> Optional[int]:
+    """Pico de memoria residente del proceso en KiB (None si la plataforma no lo expone)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+class RunHistory:
+    """Historial local (JSONL) con duración por fase, ritmo y memoria de cada ejecución"""
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or CONFIG.HISTORY_FILE
+    
+    def record(self, command: str, phases: Mapping[str, float], skills: int,
+               **extra: Any) -> Optional[Dict[str, Any]]:
+        """Añade una ejecución; el historial es auxiliar y nunca hace fallar al instalador"""
+        transform_ms = phases.get("install", 0.0)
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "command": command,
+            "version": CONFIG.VERSION,
+            "phases_ms": dict(phases),
+            "total_ms": round(sum(phases.values()), 3),
+            "skills": skills,
+            "skills_per_sec": round(skills / (transform_ms / 1000), 1) if transform_ms and skills else None,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        entry.update(extra)
+        try:
+            with state_lock(self.path, self.path.parent):
+                lines = self.path.read_text(encoding='utf-8').splitlines() if self.path.exists() else []
+                lines.append(json.dumps(entry, sort_keys=True, ensure_ascii=False))
+                atomic_write_text(self.path, "\n".join(lines[-CONFIG.HISTORY_MAX:]) + "\n")
+        except OSError:
+            return None
+        return entry
+    
+    def entries(self, command: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Ejecuciones registradas, de la más antigua a la más reciente"""
+        try:
+            lines = self.path.read_text(encoding='utf-8').splitlines()
+        except OSError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if command is None or entry.get("command") == command:
+                entries.append(entry)
+        return entries
+
+class MemoryProfiler:
+    """Perfil de memoria con tracemalloc: instantánea al entrar y salir de cada fase de la UI"""
+    
+    # Asignaciones que no son del instalador: el propio tracemalloc y la maquinaria de importación
+    IGNORED = (tracemalloc.__file__, "<frozen importlib._bootstrap>",
+               "<frozen importlib._bootstrap_external>", "<unknown>")
+    
+    def __init__(self, top: Optional[int] = None, frames: Optional[int] = None):
+        self.top = top or CONFIG.MEMORY_TOP_SITES
+        self.phases: List[Dict[str, Any]] = []
+        self.peak = 0
+        # Pico de cada fase abierta (las fases pueden anidarse)
+        self._open: List[int] = []
+        # Bytes de las instantáneas que retiene el perfilador: no cuentan en los picos
+        self._held: List[int] = []
+        self._filters = [tracemalloc.Filter(False, pattern) for pattern in self.IGNORED]
+        tracemalloc.start(frames or CONFIG.MEMORY_TRACE_FRAMES)
+    
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+    
+    def _fold_peak(self):
+        """Reparte el pico desde el último reinicio entre las fases abiertas"""
+        peak = tracemalloc.get_traced_memory()[1] - sum(self._held)
+        self.peak = max(self.peak, peak)
+        self._open = [max(open_peak, peak) for open_peak in self._open]
+        # Python 3.8 no puede reiniciarlo: el pico de la fase será el acumulado
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+    
+    @staticmethod
+    def _site(frame: tracemalloc.Frame) -> str:
+        return f"{'/'.join(Path(frame.filename).parts[-2:])}:{frame.lineno}"
+    
+    @staticmethod
+    def _kb(size: int) -> float:
+        return round(size / 1024, 1)
+    
+    def _top(self, stats: List[tracemalloc.Statistic]) -> List[Dict[str, Any]]:
+        return [{"site": self._site(stat.traceback[0]), "size_kb": self._kb(stat.size), "count": stat.count}
+                for stat in stats[:self.top]]
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        self._fold_peak()
+        start = tracemalloc.get_traced_memory()[0] - sum(self._held)
+        before = self._snapshot()
+        self._held.append(tracemalloc.get_traced_memory()[0] - sum(self._held) - start)
+        self._open.append(0)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self._fold_peak()
+            end = tracemalloc.get_traced_memory()[0] - sum(self._held)
+            after = self._snapshot()
+            self._held.pop()
+            growth = [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0]
+            growth.sort(key=lambda stat: stat.size_diff, reverse=True)
+            self.phases.append({
+                "phase": name,
+                "start_kb": self._kb(start),
+                "end_kb": self._kb(end),
+                "growth_kb": self._kb(end - start),
+                "peak_kb": self._kb(self._open.pop()),
+                "top_growth": [dict(site, growth_kb=self._kb(stat.size_diff))
+                               for site, stat in zip(self._top(growth), growth)],
+            })
+    
+    def report(self, command: str) -> Dict[str, Any]:
+        """Cierra el perfil: fases, pico global y lo que sigue retenido por sitio y por archivo"""
+        self._fold_peak()
+        final = self._snapshot()
+        tracemalloc.stop()
+        return {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "command": command,
+            "version": CONFIG.VERSION,
+            "python": sys.version.split()[0],
+            "peak_kb": self._kb(self.peak),
+            "peak_rss_kb": peak_rss_kb(),
+            "phases": self.phases,
+            "retained_top": self._top(final.statistics('lineno')),
+            "retained_by_file": [
+                {"file": "/".join(Path(stat.traceback[0].filename).parts[-2:]), "size_kb": self._kb(stat.size)}
+                for stat in final.statistics('filename')[:self.top]
+            ],
+        }
+
+def report_memory(ui: UI, profiler: MemoryProfiler, command: str, path: Optional[Path] = None):
+    """Muestra y guarda el perfil de --profile-memory"""
+    path = path or CONFIG.MEMORY_PROFILE_FILE
+    report = profiler.report(command)
+    
+    table = ui.create_table(f"Memoria por fase (tracemalloc, pico total {report['peak_kb']:,.0f} KB)")
+    table.add_column("Fase")
+    table.add_column("Inicio", justify="right")
+    table.add_column("Fin", justify="right")
+    table.add_column("Δ", justify="right")
+    table.add_column("Pico", justify="right")
+    table.add_column("Mayor crecimiento")
+    for phase in report["phases"]:
+        top = phase["top_growth"][0] if phase["top_growth"] else None
+        table.add_row(
+            phase["phase"],
+            f"{phase['start_kb']:,.0f} KB",
+            f"{phase['end_kb']:,.0f} KB",
+            f"{phase['growth_kb']:+,.0f} KB",
+            f"{phase['peak_kb']:,.0f} KB",
+            f"{top['site']} (+{top['growth_kb']:,.0f} KB)" if top else "—",
+        )
+    ui.console.print(table)
+    for site in report["retained_top"][:5]:
+        ui.print_muted(f"  {Icons.ARROW} {site['site']}: {site['size_kb']:,.0f} KB en {site['count']:,} bloques")
+    
+    ui.event("memory_profile", path=str(path), **report)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(path, json.dumps(report, indent=2, ensure_ascii=False))
+    except OSError as e:
+        ui.print_warning(f"No se pudo guardar el perfil de memoria: {e}")
+        return
+    ui.print_muted(f"Perfil de memoria: {project_relative(path)}")
+
+# =============================================================================
+# API DE BIBLIOTECA
+# =============================================================================
+
+class _NullLogger:
+    """Logger que descarta todo (la API no escribe setup.log)"""
+    
+    def debug(self, msg: str):
+        pass
+    
+    def info(self, msg: str):
+        pass
+    
+    def warning(self, msg: str):
+        pass
+    
+    def error(self, msg: str, exc_info: bool = False):
+        pass
+    
+    def critical(self, msg: str):
+        pass
+    
+    def section(self, title: str):
+        pass
+
+class _SilentUI(EventUI):
+    """UI sin salida: la API no imprime ni emite eventos"""
+    
+    def event(self, kind: str, **fields: Any):
+        pass
+
+def render(skills: Union[Mapping[str, str], Iterable[Path]], targets: Iterable[str],
+           profile: str = "full", root: Optional[Path] = None) -> Dict[str, str]:
+    """Renderiza skills en memoria y retorna {ruta relativa al proyecto: contenido}
+    
+    No escribe archivos, no imprime y no usa el CONFIG global (solo comparte la caché de
+    zip/tar abiertos, ver SkillArchive). `skills` acepta rutas de archivos bajo skills/ de
+    `root` o un mapeo {ruta relativa a skills/: contenido} (sin disco).
+    """
+    config = Config(ROOT=Path(root) if root is not None else None)
+    transformer = SkillTransformer(_SilentUI(), _NullLogger(),
+                                   TransformOptions(mmap_mode="never", profile=profile, layout="files"), config)
+    
+    if isinstance(skills, Mapping):
+        sources = []
+        for relative, content in skills.items():
+            # Igual que decode_source() con los archivos: sin BOM y con saltos universales
+            content = content[1:] if content.startswith('\ufeff') else content
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+            sources.append(SkillSource(config.SKILLS_SOURCE_DIR / relative, content,
+                                       hashlib.sha256(content.encode('utf-8')).hexdigest()))
+    else:
+        paths = [Path(path).absolute() for path in skills]
+        outside = [str(path) for path in paths if config.SKILLS_SOURCE_DIR not in path.parents]
+        if outside:
+            raise ValueError(f"Skills fuera de {config.SKILLS_SOURCE_DIR} (indica root=): {', '.join(outside)}")
+        sources = [transformer._read_skill(path) for path in paths]
+    
+    # Contenido compartido calculado sobre este corpus, sin leer ni guardar el grafo
+    graph = SkillGraph()
+    graph.nodes = {
+        SkillGraph.node_id(source.path, config.SKILLS_SOURCE_DIR): {
+            "sections": SkillGraph.section_index(source.content, config.SHARED_MIN_BYTES)
+        }
+        for source in sources
+    }
+    transformer.shared = transformer.shared_names(graph)
+    
+    targets = list(targets)
+    for target in targets:
+        if target not in config.ASSISTANTS:
+            raise ValueError(f"Asistente no soportado: {target}")
+        transformer._begin_includes(target, [])
+    output_dirs = {target: transformer.get_output_dir(target) for target in targets}
+    
+    # Un parseo por skill y un render por destino
+    pipeline = StagedPipeline([
+        ("parse", transformer._parse_stage, config.CPU_WORKERS),
+        ("render", lambda parsed: [
+            transformer._render_skill(parsed[0], target, output_dirs[target], parsed[1]) for target in targets
+        ], config.CPU_WORKERS),
+    ], queue_size=config.PIPELINE_QUEUE_SIZE, inline_max=config.PIPELINE_INLINE_MAX)
+    
+    result: Dict[str, str] = {}
+    errors: List[str] = []
+    for item in pipeline.run(sources):
+        if item.error is not None:
+            errors.append(f"{item.key.path.name}: {item.error}")
+        else:
+            for output in item.payload:
+                result[project_relative(output.path, config.PROJECT_ROOT)] = output.content
+    for target in targets:
+        for output in transformer.include_outputs(target):
+            result[project_relative(output.path, config.PROJECT_ROOT)] = output.content
+    
+    if errors:
+        raise ValueError("No se pudieron renderizar: " + "; ".join(errors))
+    return dict(sorted(result.items()))
+
 # =============================================================================
 # GENERACIÓN DE CONFIGURACIÓN
 # =============================================================================
@@ -1020,7 +4434,8 @@ class ConfigGenerator:
         self.ui = ui
         self.logger = logger
     
-    def generate_ai_assistant_json(self, installed_assistants: List[str], api_keys: Dict[str, str]):
+    def generate_ai_assistant_json(self, installed_assistants: List[str], api_keys: Dict[str, str],
+                                   selections: Optional[Mapping[str, SkillSelection]] = None):
         """Genera .ai-assistant.json"""
         self.logger.info("Generando .ai-assistant.json")
         
@@ -1056,10 +4471,11 @@ class ConfigGenerator:
             }
         }
         
-        CONFIG.AI_ASSISTANT_JSON.write_text(
-            json.dumps(config, indent=2),
-            encoding='utf-8'
-        )
+        store_selections(config, {assistant_id: selection for assistant_id, selection in (selections or {}).items()
+                                  if assistant_id in installed_assistants})
+        
+        with state_lock(CONFIG.AI_ASSISTANT_JSON):
+            atomic_write_text(CONFIG.AI_ASSISTANT_JSON, json.dumps(config, indent=2))
         
         self.ui.print_success(
             f".ai-assistant.json generado",
@@ -1068,10 +4484,6 @@ class ConfigGenerator:
     
     def generate_setupignore(self):
         """Genera .setupignore si no existe"""
-        if CONFIG.SETUP_IGNORE.exists():
-            self.logger.info(".setupignore ya existe")
-            return
-        
         content = """# AppNotesBG Setup Ignore
 # Skills excluidos de la instalación
 # Sintaxis: uno por línea, soporta wildcards
@@ -1084,7 +4496,12 @@ class ConfigGenerator:
 # *-test.md
 """
         
-        CONFIG.SETUP_IGNORE.write_text(content, encoding='utf-8')
+        # Comprobar y escribir bajo el lock: otro proceso no puede crearlo entre medias
+        with state_lock(CONFIG.SETUP_IGNORE):
+            if CONFIG.SETUP_IGNORE.exists():
+                self.logger.info(".setupignore ya existe")
+                return
+            atomic_write_text(CONFIG.SETUP_IGNORE, content)
         self.ui.print_success(".setupignore creado", icon=self.ui.icons.FILE)
     
     def save_env_file(self, api_keys: Dict[str, str]):
@@ -1101,26 +4518,116 @@ class ConfigGenerator:
             env_content += f"{config['env_var']}={key}\n\n"
         
         # Añadir al .env existente o crear nuevo
-        if CONFIG.ENV_FILE.exists():
-            existing = CONFIG.ENV_FILE.read_text(encoding='utf-8')
-            if 'AppNotesBG API Keys' not in existing:
-                existing += f"\n\n{env_content}"
-                CONFIG.ENV_FILE.write_text(existing, encoding='utf-8')
-        else:
-            CONFIG.ENV_FILE.write_text(env_content, encoding='utf-8')
+        with state_lock(CONFIG.ENV_FILE):
+            if CONFIG.ENV_FILE.exists():
+                existing = CONFIG.ENV_FILE.read_text(encoding='utf-8')
+                if 'AppNotesBG API Keys' not in existing:
+                    existing += f"\n\n{env_content}"
+                    atomic_write_text(CONFIG.ENV_FILE, existing)
+            else:
+                atomic_write_text(CONFIG.ENV_FILE, env_content, mode=0o600)
         
         self.ui.print_success("API keys guardadas en .env", icon=self.ui.icons.KEY)
 
-# =============================================================================
-# INSTALADOR PRINCIPAL
-# =============================================================================
+# =============================================================================
+# INSTALADOR PRINCIPAL
+# =============================================================================
+
+class SkillPrefetch:
+    """Descubre, lee y parsea los skills en un hilo mientras el instalador detecta, valida y pregunta"""
+    
+    def __init__(self, transformer: SkillTransformer):
+        self.transformer = transformer
+        self.skills: List[Path] = []
+        self.parsed = 0
+        self.elapsed_ms = 0.0
+        self._discovered = threading.Event()
+        self._stop = threading.Event()
+        # Guardar en las cachés y detener la precarga se excluyen: tras take()/close() no se escribe nada
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="skill-prefetch", daemon=True)
+    
+    def start(self) -> 'SkillPrefetch':
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        transformer = self.transformer
+        started = time.perf_counter()
+        try:
+            # El descubrimiento se completa siempre: la instalación lo toma tal cual
+            self.skills = list(transformer.iter_skills())
+            self._discovered.set()
+            
+            quarantine = SkillQuarantine(transformer.config)
+            budget = transformer.config.PREFETCH_MAX_BYTES
+            for skill_file in self.skills:
+                if self._stop.is_set() or budget <= 0:
+                    break
+                if transformer._use_mmap(skill_file):
+                    continue  # Los grandes se mapean durante la pasada
+                try:
+                    # Los apartados ni se leen: la pasada real reporta la cuarentena
+                    quarantine.check(skill_file)
+                except QuarantinedSkill:
+                    continue
+                
+                skill_started = time.perf_counter()
+                try:
+                    stamp, source, skill = transformer.prefetch(skill_file)
+                except Exception as e:
+                    # La pasada real lo vuelve a intentar y reporta el error
+                    transformer.logger.debug(f"Precarga omitida para {skill_file.name}: {e}")
+                    continue
+                if time.perf_counter() - skill_started > transformer.config.SKILL_MAX_SECONDS:
+                    # La precarga no tiene watchdog: se descarta para que la pasada real lo aparte
+                    continue
+                
+                with self._lock:
+                    if self._stop.is_set():
+                        break
+                    transformer.keep_prefetched(stamp, source, skill)
+                budget -= stamp[0]
+                self.parsed += 1
+        except Exception as e:
+            transformer.logger.warning(f"Precarga de skills interrumpida: {e}")
+        finally:
+            self.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+    
+    def take(self) -> Optional[List[Path]]:
+        """Detiene la precarga y retorna los skills descubiertos (None si el descubrimiento falló)"""
+        self._halt()
+        while not self._discovered.wait(0.05):
+            if not self._thread.is_alive():
+                return None
+        # El parseo en curso no compite con la pasada real; uno colgado se abandona (hilo daemon)
+        timeout = self.transformer.config.SKILL_MAX_SECONDS
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.transformer.logger.warning(f"La precarga no terminó en {timeout:g}s; se abandona")
+        self.transformer.logger.info(
+            f"Precarga: {len(self.skills)} skills descubiertos, {self.parsed} parseados antes de instalar"
+        )
+        self.transformer.ui.event("prefetch", skills=len(self.skills), parsed=self.parsed)
+        return list(self.skills)
+    
+    def close(self):
+        self._halt()
+        self.transformer.drop_prefetched()
+    
+    def _halt(self):
+        with self._lock:
+            self._stop.set()
+
+# Primera línea tras el shebang del hook instalado: identifica el propio para poder reescribirlo
+GIT_HOOK_MARKER = "# Auto-actualización de skills para asistentes de IA"
 
 class MultiAssistantInstaller:
     """Orquestador principal"""
     
-    def __init__(self):
-        self.ui = UI()
-        self.logger = SetupLogger(CONFIG.SETUP_LOG)
+    def __init__(self, ui=None, logger: Optional[SetupLogger] = None):
+        self.ui = ui or UI()
+        self.logger = logger or SetupLogger(CONFIG.SETUP_LOG)
         self.detector = AssistantDetector(self.ui, self.logger)
         self.api_manager = APIKeyManager(self.ui, self.logger)
         self.transformer = SkillTransformer(self.ui, self.logger)
@@ -1128,54 +4635,74 @@ class MultiAssistantInstaller:
         
         self.installed_assistants: List[str] = []
         self.skills: List[Path] = []
+        self.prefetch: Optional[SkillPrefetch] = None
     
     def run(self, args: argparse.Namespace) -> int:
         """Ejecuta el flujo completo"""
         
+        self.transformer.options = TransformOptions.from_args(args)
+        self.api_manager.offline = args.offline
+        
         # Modo dry-run
         if args.dry_run:
-            self.ui.console.print(
-                Panel("[yellow]🔍 MODO DRY-RUN: No se realizarán cambios reales[/yellow]")
-            )
+            self.ui.print_panel("[yellow]🔍 MODO DRY-RUN: No se realizarán cambios reales[/yellow]")
         
         # Banner
         self.ui.print_banner()
         
         # Verificar requisitos
-        if not self._check_requirements():
+        with self.ui.phase("requirements"):
+            passed = self._check_requirements()
+        if not passed:
             return 1
         
+        # El corpus no depende de la detección ni de las API keys: se prepara mientras tanto
+        if CONFIG.PREFETCH_SKILLS:
+            self.prefetch = SkillPrefetch(self.transformer).start()
+        
         # Detectar asistentes
-        assistant_statuses = self.detector.detect_all()
-        self.detector.display_results(assistant_statuses)
+        with self.ui.phase("detection"):
+            assistant_statuses = self.detector.detect_all()
+            self.detector.display_results(assistant_statuses)
         
         # Seleccionar asistentes
-        selected = self._select_assistants(assistant_statuses, args)
+        with self.ui.phase("selection"):
+            selected = self._select_assistants(assistant_statuses, args)
         if not selected:
+            if self.prefetch is not None:
+                self.prefetch.close()
             self.ui.print_warning("No se seleccionaron asistentes")
             return 0
         
         # Configurar API keys
         api_keys = {}
         if not args.skip_api:
-            api_keys = self.api_manager.configure_interactive()
+            with self.ui.phase("api_keys"):
+                api_keys = self.api_manager.configure_interactive()
         
-        # Descubrir skills
-        self.skills = self.transformer.discover_skills()
+        # Descubrir skills: el dry-run necesita la lista; la instalación la recorre en streaming
+        if args.dry_run:
+            with self.ui.phase("discovery"):
+                self.skills = self.transformer.discover_skills()
         
-        # Instalar para cada asistente
-        for assistant_id in selected:
-            self._install_assistant(assistant_id, args.dry_run)
+        # Instalar: cada skill se parsea una vez para todos los asistentes elegidos
+        with self.ui.phase("install"):
+            self._install_assistants(selected, args.dry_run)
         
         # Generar configuraciones
         if not args.dry_run:
-            self.config_gen.generate_ai_assistant_json(self.installed_assistants, api_keys)
-            self.config_gen.generate_setupignore()
-            self.config_gen.save_env_file(api_keys)
-            
-            # Opcional: git hooks
-            if self.ui.confirm("¿Activar auto-actualización con git hooks?", default=True):
-                self._install_git_hook()
+            with self.ui.phase("config"):
+                self.config_gen.generate_ai_assistant_json(self.installed_assistants, api_keys,
+                                                           self.transformer.selections)
+                self.config_gen.generate_setupignore()
+                self.config_gen.save_env_file(api_keys)
+                
+                # Opcional: git hooks
+                if self.ui.confirm("¿Activar auto-actualización con git hooks?", default=True):
+                    self._install_git_hook()
+        
+        if not args.dry_run:
+            RunHistory().record("install", self.ui.timings, self.transformer.processed)
         
         # Resumen final
         self._print_final_summary()
@@ -1259,44 +4786,80 @@ class MultiAssistantInstaller:
                 pass
             return []
     
-    def _install_assistant(self, assistant_id: str, dry_run: bool):
-        """Instala para un asistente específico"""
-        config = CONFIG.ASSISTANTS[assistant_id]
+    def _install_assistants(self, selected: List[str], dry_run: bool):
+        """Instala para los asistentes elegidos en una sola pasada de transformación"""
+        configs = [CONFIG.ASSISTANTS[assistant_id] for assistant_id in selected]
         
         self.ui.console.print()
-        self.ui.console.print(Panel(
-            f"{config['emoji']} Instalando para {config['name']}",
-            border_style=config['color']
-        ))
+        names = [f"{c['emoji']} {c['name']}" for c in configs]
+        self.ui.print_panel(
+            f"Instalando para {', '.join(names)}",
+            border_style=configs[0]['color'] if len(configs) == 1 else "cyan"
+        )
+        
+        # Selección de skills: la pedida por línea de comandos o la guardada para cada asistente
+        self.transformer.selections = self._resolve_selections(selected)
+        for assistant_id, selection in self.transformer.selections.items():
+            if selection:
+                self.ui.print_info(f"{CONFIG.ASSISTANTS[assistant_id]['name']}: solo {selection.describe()}")
         
         if dry_run:
-            skills_dir = CONFIG.get_assistant_dir(assistant_id) / config['skills_subdir']
-            self.ui.print_muted(f"[DRY-RUN] Se instalaría en: {skills_dir}")
+            for assistant_id in selected:
+                self.ui.print_muted(f"[DRY-RUN] Se instalaría en: {self.transformer.get_output_dir(assistant_id)}")
+            planner = InstallPlanner(self.ui, self.logger, self.transformer)
+            planner.display(planner.build(selected, self.skills))
+            if self.prefetch is not None:
+                self.prefetch.close()
             return
         
-        # Transformar skills
-        count = self.transformer.transform_all(self.skills, assistant_id)
+        # Transformar a medida que se descubren (o desde la precarga); también registra el grafo para 'update'
+        skills = self.prefetch.take() if self.prefetch is not None else None
+        # Con selección, cada skill se enruta al parsearlo a los asistentes que lo incluyen
+        try:
+            counts = self.transformer.transform_stream(
+                skills if skills is not None else self.transformer.iter_skills(), selected
+            )
+        finally:
+            if self.prefetch is not None:
+                self.prefetch.close()
+        self.skills = self.transformer.corpus
         
-        self.installed_assistants.append(assistant_id)
-        self.logger.info(f"Instalación completada: {assistant_id} ({count} skills)")
+        for assistant_id in selected:
+            self.installed_assistants.append(assistant_id)
+            self.logger.info(f"Instalación completada: {assistant_id} ({counts.get(assistant_id, 0)} skills)")
+    
+    def _resolve_selections(self, selected: List[str]) -> Dict[str, SkillSelection]:
+        requested = self.transformer.options.selection
+        stored: Dict[str, SkillSelection] = {}
+        if requested is None and CONFIG.AI_ASSISTANT_JSON.exists():
+            with contextlib.suppress(OSError, ValueError):
+                stored = load_selections(json.loads(CONFIG.AI_ASSISTANT_JSON.read_text(encoding='utf-8')))
+        return {assistant_id: requested if requested is not None else stored.get(assistant_id, SkillSelection())
+                for assistant_id in selected}
     
     def _install_git_hook(self):
-        """Instala git hook para auto-actualización"""
+        """Instala git hook para auto-actualización (reescribe el propio si ya existía)"""
         hook_path = CONFIG.PROJECT_ROOT / ".git" / "hooks" / "post-checkout"
         
         if hook_path.exists():
-            self.ui.print_warning("Ya existe un post-checkout hook")
-            return
+            try:
+                own = GIT_HOOK_MARKER in hook_path.read_text(encoding='utf-8', errors='replace')
+            except OSError:
+                own = False
+            if not own:
+                self.ui.print_warning("Ya existe un post-checkout hook")
+                return
         
-        hook_content = '''#!/bin/bash
-# Auto-actualización de skills para asistentes de IA
+        hook_content = f'''#!/bin/bash
+{GIT_HOOK_MARKER}
 echo "🔄 Actualizando configuraciones de IA..."
 cd "$(dirname "$0")/../.."
-python ./skills/setup.py update --quiet 2>/dev/null || true
+# Con 'setup.py serve' activo, el cliente solo encola la actualización en el servidor (sin importar setup.py)
+python -S ./skills/tools/serve_client.py 2>/dev/null \\
+    || python ./skills/setup.py update --quiet --background 2>/dev/null || true
 '''
         
-        hook_path.write_text(hook_content)
-        hook_path.chmod(0o755)
+        atomic_write_text(hook_path, hook_content, mode=0o755)
         
         self.ui.print_success("Git hook instalado para auto-actualización", icon=self.ui.icons.GEAR)
     
@@ -1323,22 +4886,24 @@ python ./skills/setup.py update --quiet 2>/dev/null || true
         
         # Próximos pasos
         self.ui.console.print()
-        self.ui.console.print(Panel(
+        self.ui.print_panel(
             "[bold]Próximos pasos:[/bold]\n"
             "1. Reinicia tu asistente de IA\n"
             "2. Los skills están disponibles automáticamente\n"
             "3. Para actualizar: [cyan]python ./skills/setup.py update[/cyan]",
             title="🚀 Listo para usar",
             border_style="green"
-        ))
+        )
 
 # =============================================================================
 # COMANDOS ESPECIALES
 # =============================================================================
 
-def cmd_update(ui: UI, logger: SetupLogger):
-    """Modo actualización"""
+def cmd_update(ui: UI, logger: SetupLogger, options: Optional[TransformOptions] = None,
+               transformer: Optional[SkillTransformer] = None):
+    """Modo actualización (el modo serve pasa su transformer con las cachés en caliente)"""
     ui.print_section("Modo Actualización", Icons.LOADING)
+    ui.timings.clear()  # El modo serve reutiliza la UI entre ejecuciones
     
     if not CONFIG.AI_ASSISTANT_JSON.exists():
         ui.print_error("No se encontró .ai-assistant.json")
@@ -1356,21 +4921,534 @@ def cmd_update(ui: UI, logger: SetupLogger):
     ui.print_info(f"Asistentes instalados: {', '.join(installed)}")
     
     # Detectar cambios
-    transformer = SkillTransformer(ui, logger)
-    skills = transformer.discover_skills()
+    if transformer is None:
+        transformer = SkillTransformer(ui, logger, options)
+    else:
+        transformer.reset()
+    with ui.phase("discovery"):
+        skills = transformer.discover_skills()
     
-    # Reinstalar
+    # Skills modificados y sus dependientes según el grafo
+    with ui.phase("graph"):
+        graph = SkillGraph.load()
+        changed = graph.refresh(skills)
+        impacted = graph.impact(changed)
+        transformer.shared = transformer.shared_names(graph)
+    ui.print_info(f"Skills modificados: {len(changed)}, a regenerar con dependientes: {len(impacted)}")
+    
+    # Selección por asistente: la guardada, o la pedida ahora (que sustituye a la guardada)
+    selections = load_selections(config)
+    requested = transformer.options.selection
+    if requested is not None:
+        selections.update({assistant_id: requested for assistant_id in installed})
+    transformer.selections = selections
+    
+    # Reinstalar: una pasada común, cada skill se parsea una vez para todos sus destinos
+    jobs: Dict[str, List[Path]] = {}
     for assistant_id in installed:
         ui.print_info(f"Actualizando {assistant_id}...")
-        transformer.transform_all(skills, assistant_id)
+        selected = transformer.select(skills, assistant_id, graph)
+        if selections.get(assistant_id):
+            ui.print_muted(f"  {Icons.ARROW} Selección: {selections[assistant_id].describe()} "
+                           f"({len(selected)} de {len(skills)} skills)")
+        stale = selected if transformer.options.full else transformer.stale_skills(selected, assistant_id, impacted)
+        if not stale and not transformer.has_deselected_outputs(assistant_id):
+            ui.print_muted(f"  {Icons.ARROW} Sin cambios")
+            continue
+        jobs[assistant_id] = stale
+    if jobs:
+        with ui.phase("install"):
+            transformer.transform_many(jobs)
+    # Solo tras publicar: si la instalación se interrumpe, la próxima pasada detecta los mismos cambios,
+    # y los skills con error o en cuarentena se vuelven a intentar
+    graph.forget(transformer.failed)
+    graph.save()
     
-    # Actualizar timestamp
-    config['project']['last_update'] = datetime.now().isoformat()
-    CONFIG.AI_ASSISTANT_JSON.write_text(json.dumps(config, indent=2))
+    # Actualizar timestamp releyendo bajo lock para no pisar escrituras concurrentes
+    with ui.phase("config"), state_lock(CONFIG.AI_ASSISTANT_JSON):
+        config = json.loads(CONFIG.AI_ASSISTANT_JSON.read_text(encoding='utf-8'))
+        config['project']['last_update'] = datetime.now().isoformat()
+        if requested is not None:
+            store_selections(config, selections)
+        atomic_write_text(CONFIG.AI_ASSISTANT_JSON, json.dumps(config, indent=2))
     
+    RunHistory().record("update", ui.timings, transformer.processed)
     ui.print_success("Actualización completada")
     return 0
 
+def cmd_graph(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Consultas sobre el grafo de dependencias de skills"""
+    ui.print_section("Grafo de Dependencias", Icons.SEARCH)
+    
+    transformer = SkillTransformer(ui, logger)
+    graph = SkillGraph.load()
+    graph.refresh(transformer.discover_skills())
+    graph.save()
+    
+    edge_count = sum(len(deps) for deps in graph.edges.values())
+    cycles = graph.cycles()
+    ui.print_info(f"Skills: {len(graph.nodes)}, referencias: {edge_count}, ciclos: {len(cycles)}")
+    ui.event("graph", nodes=len(graph.nodes), edges=edge_count, cycles=len(cycles))
+    
+    for query in args.impact or []:
+        matches = graph.find(query)
+        if not matches:
+            ui.print_error(f"Skill no encontrado: {query}")
+            return 1
+        impacted = sorted(graph.impact(matches) - set(matches))
+        ui.print_tree(impacted, f"Impacto de {', '.join(matches)} ({len(impacted)} dependientes)")
+        ui.event("impact", skills=matches, dependents=impacted)
+    
+    if args.cycles:
+        for cycle in cycles:
+            ui.print_warning(" → ".join(cycle + cycle[:1]))
+        ui.event("cycles", cycles=cycles)
+    
+    if not args.impact and not args.cycles:
+        # Skills más referenciados
+        reverse = graph.dependents()
+        table = ui.create_table("Skills más referenciados")
+        table.add_column("Skill")
+        table.add_column("Dependientes", justify="right")
+        for node, dependents in sorted(reverse.items(), key=lambda kv: (-len(kv[1]), kv[0]))[:10]:
+            table.add_row(node, str(len(dependents)))
+        ui.console.print(table)
+    
+    return 0
+
+def cmd_lint(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Lint rápido (lectura + parseo, sin render): pensado para pre-commit"""
+    ui.print_section("Lint de Skills", Icons.SEARCH)
+    
+    transformer = SkillTransformer(ui, logger, TransformOptions.from_args(args))
+    issues = transformer.lint_all(transformer.discover_skills())
+    transformer.report_lint(issues)
+    
+    failing = [i for i in issues if args.strict or i.severity == "error"]
+    ui.event("lint_summary", issues=len(issues), failing=len(failing))
+    return 1 if failing else 0
+
+STATS_BUCKETS = (128, 256, 512, 1024, 2048, 4096)
+
+def cmd_stats(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Bytes y tokens aproximados de las salidas, leídos del manifiesto y del índice"""
+    ui.print_section("Tamaño del contexto generado", Icons.CHART)
+    
+    manifest = OutputManifest().load()["assistants"]
+    assistants = [a for a in (args.target or sorted(manifest)) if a in manifest]
+    if not assistants:
+        ui.print_warning("No hay salidas registradas. Ejecuta primero la instalación o 'update'")
+        return 1
+    
+    graph = SkillGraph.load()
+    rows = []
+    for assistant_id in assistants:
+        for path, entry in manifest[assistant_id].get("outputs", {}).items():
+            metadata = graph.metadata(entry.get("source", "").replace('\\', '/'))
+            size = entry.get("bytes", 0)
+            rows.append({
+                "assistant": assistant_id,
+                "path": path,
+                "bytes": size,
+                # Manifiestos anteriores no guardaban tokens: ~4 bytes por token
+                "tokens": entry.get("tokens", size // 4),
+                "domain": str(metadata.get("dominio") or "sin dominio"),
+                "level": str(metadata.get("nivel") or "sin nivel"),
+            })
+    
+    def aggregate(field_name: str) -> Dict[str, Dict[str, int]]:
+        totals: Dict[str, Dict[str, int]] = defaultdict(lambda: {"files": 0, "bytes": 0, "tokens": 0})
+        for row in rows:
+            group = totals[row[field_name]]
+            group["files"] += 1
+            group["bytes"] += row["bytes"]
+            group["tokens"] += row["tokens"]
+        return dict(sorted(totals.items(), key=lambda kv: -kv[1]["tokens"]))
+    
+    groups = {
+        "assistant": ("Por asistente", aggregate("assistant")),
+        "domain": ("Por dominio", aggregate("domain")),
+        "level": ("Por nivel", aggregate("level")),
+    }
+    for title, totals in groups.values():
+        table = ui.create_table(title)
+        table.add_column("Grupo")
+        table.add_column("Archivos", justify="right")
+        table.add_column("Bytes", justify="right")
+        table.add_column("Tokens (~)", justify="right")
+        for name, group in totals.items():
+            table.add_row(name, str(group["files"]), f"{group['bytes']:,}", f"{group['tokens']:,}")
+        ui.console.print(table)
+    
+    # Histograma de tokens por archivo
+    labels = [f"< {STATS_BUCKETS[0]}"] + [
+        f"{low}–{high - 1}" for low, high in zip(STATS_BUCKETS, STATS_BUCKETS[1:])
+    ] + [f">= {STATS_BUCKETS[-1]}"]
+    histogram = [0] * len(labels)
+    for row in rows:
+        histogram[bisect.bisect_right(STATS_BUCKETS, row["tokens"])] += 1
+    
+    ui.console.print("\n[bold]Tokens por archivo[/bold]")
+    peak = max(histogram) or 1
+    for label, count in zip(labels, histogram):
+        ui.console.print(f"  {label:>11} │ {'█' * round(count / peak * 30)} {count}")
+    
+    top = sorted(rows, key=lambda r: (-r["tokens"], r["path"]))[:args.top]
+    table = ui.create_table(f"Top {len(top)} skills más pesados")
+    table.add_column("Salida")
+    table.add_column("Bytes", justify="right")
+    table.add_column("Tokens (~)", justify="right")
+    for row in top:
+        table.add_row(row["path"], f"{row['bytes']:,}", f"{row['tokens']:,}")
+    ui.console.print(table)
+    
+    ui.event("stats",
+             **{key: totals for key, (_, totals) in groups.items()},
+             histogram=dict(zip(labels, histogram)),
+             top=[{k: r[k] for k in ("assistant", "path", "bytes", "tokens")} for r in top])
+    return 0
+
+def compare_bench(current: Dict[str, float], baseline: Dict[str, float],
+                  threshold: float, min_delta_ms: float) -> List[Dict[str, Any]]:
+    """Compara métrica a métrica; en skills_per_sec más es mejor, en el resto menos.
+    
+    Una métrica del baseline que falta en el resultado ('missing') cuenta como fallo igual que una regresión:
+    si un escenario deja de medirse, la puerta no puede darlo por bueno.
+    """
+    rows = []
+    for name in sorted(set(current) | set(baseline)):
+        base, value = baseline.get(name), current.get(name)
+        row = {"metric": name, "baseline": base, "current": value, "delta_pct": None, "status": "ok"}
+        if base is None or value is None:
+            row["status"] = "new" if base is None else "missing"
+            rows.append(row)
+            continue
+        
+        row["delta_pct"] = round((value - base) / base * 100, 1) if base else None
+        if name.endswith("skills_per_sec"):
+            regressed = value < base / (1 + threshold)
+        elif name.endswith("_ms"):
+            regressed = value > base * (1 + threshold) and value - base > min_delta_ms
+        else:
+            regressed = value > base * (1 + threshold)
+        if regressed:
+            row["status"] = "regression"
+        rows.append(row)
+    return rows
+
+def cmd_bench(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Último resultado de skills/tools/bench_setup.py frente al baseline; con --compare falla ante regresiones"""
+    ui.print_section("Benchmark", Icons.CHART)
+    
+    runs = [entry for entry in RunHistory().entries("bench") if entry.get("metrics")]
+    if not runs:
+        ui.print_error("No hay resultados de benchmark en el historial")
+        ui.print_info("Genera uno con: python ./skills/tools/bench_setup.py")
+        return 1
+    result = {key: runs[-1].get(key) for key in ("at", "version", "python", "skills", "repeat", "metrics")}
+    ui.print_info(f"Resultado del {result['at']}: {result['skills']} skills, {result['repeat']} repeticiones")
+    
+    baseline = None
+    if CONFIG.BENCH_BASELINE.exists():
+        baseline = json.loads(CONFIG.BENCH_BASELINE.read_text(encoding='utf-8'))
+    
+    # Solo se comparan mediciones equivalentes y tomadas con el setup.py actual
+    mismatched = [key for key in ("skills", "repeat", "python")
+                  if baseline is not None and baseline.get(key) != result[key]]
+    stale = datetime.fromisoformat(result["at"]).timestamp() < Path(__file__).stat().st_mtime
+    threshold = args.threshold / 100 if args.threshold is not None else CONFIG.BENCH_THRESHOLD
+    rows = compare_bench(result["metrics"], (baseline or {}).get("metrics", {}),
+                         threshold, CONFIG.BENCH_MIN_DELTA_MS)
+    regressions = [row for row in rows if row["status"] == "regression"]
+    missing = [row for row in rows if row["status"] == "missing"]
+    
+    table = ui.create_table("Métricas (mediana)" + (" frente al baseline" if baseline else ""))
+    table.add_column("Métrica")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Actual", justify="right")
+    table.add_column("Δ", justify="right")
+    table.add_column("Estado")
+    def number(value: Optional[float]) -> str:
+        if value is None:
+            return "—"
+        return f"{value:,.1f}" if isinstance(value, float) else f"{value:,}"
+    
+    for row in rows:
+        table.add_row(
+            row["metric"],
+            number(row["baseline"]),
+            number(row["current"]),
+            f"{row['delta_pct']:+.1f}%" if row["delta_pct"] is not None else "—",
+            {"ok": "✅", "regression": "❌ regresión", "new": "nueva", "missing": "❌ ausente"}[row["status"]],
+        )
+    ui.console.print(table)
+    
+    passed = not (args.compare and (regressions or missing or mismatched or stale))
+    report = {
+        "passed": passed,
+        "threshold_pct": round(threshold * 100, 1),
+        "min_delta_ms": CONFIG.BENCH_MIN_DELTA_MS,
+        "current": result,
+        "baseline": baseline,
+        "comparison": rows,
+        "regressions": [row["metric"] for row in regressions],
+        "missing": [row["metric"] for row in missing],
+        "mismatched": mismatched,
+        "stale": stale,
+    }
+    ui.event("bench", **report)
+    if args.report:
+        atomic_write_text(Path(args.report), json.dumps(report, indent=2, ensure_ascii=False))
+        ui.print_muted(f"Reporte: {args.report}")
+    
+    if args.save_baseline or baseline is None:
+        atomic_write_text(CONFIG.BENCH_BASELINE, json.dumps(result, indent=2, sort_keys=True))
+        ui.print_success(f"Baseline guardado en {project_relative(CONFIG.BENCH_BASELINE)}")
+    
+    if stale:
+        ui.print_warning("setup.py cambió después de este resultado: vuelve a ejecutar skills/tools/bench_setup.py")
+    if mismatched:
+        ui.print_warning("El resultado no es comparable con el baseline: " + ", ".join(
+            f"{key} {baseline.get(key)} → {result[key]}" for key in mismatched))
+    if not args.compare:
+        return 0
+    if baseline is None:
+        ui.print_warning("No había baseline: se guardó el actual y no hay nada que comparar")
+        return 0
+    if stale or mismatched:
+        ui.print_error("No se compara: ejecuta el benchmark con el setup.py actual y los mismos parámetros "
+                       "que el baseline, o guarda uno nuevo con --save-baseline")
+        return 1
+    if regressions or missing:
+        if regressions:
+            ui.print_error(f"{len(regressions)} métricas superan el umbral de {threshold * 100:.0f}%: "
+                           f"{', '.join(report['regressions'])}")
+        if missing:
+            ui.print_error(f"{len(missing)} métricas del baseline no se midieron: {', '.join(report['missing'])}")
+        return 1
+    ui.print_success(f"Sin regresiones (umbral {threshold * 100:.0f}%)")
+    return 0
+
+def _plan_targets(args: argparse.Namespace) -> List[str]:
+    """Asistentes del plan: --target o los activos en .ai-assistant.json"""
+    if args.target:
+        return list(dict.fromkeys(args.target))
+    if CONFIG.AI_ASSISTANT_JSON.exists():
+        config = json.loads(CONFIG.AI_ASSISTANT_JSON.read_text(encoding='utf-8'))
+        return config.get('configuration', {}).get('active_assistants', [])
+    return []
+
+def cmd_plan(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Calcula los cambios sin aplicarlos y guarda el plan"""
+    ui.print_section("Plan de Instalación", Icons.SEARCH)
+    
+    targets = _plan_targets(args)
+    if not targets:
+        ui.print_error("No hay asistentes para planificar")
+        ui.print_info("Usa --target opencode|claude|cursor o ejecuta primero el instalador")
+        return 1
+    
+    transformer = SkillTransformer(ui, logger, TransformOptions.from_args(args))
+    config = json.loads(CONFIG.AI_ASSISTANT_JSON.read_text(encoding='utf-8')) if CONFIG.AI_ASSISTANT_JSON.exists() else {}
+    selections = load_selections(config)
+    if transformer.options.selection is not None:
+        selections.update({target: transformer.options.selection for target in targets})
+    transformer.selections = selections
+    bundled = [target for target in targets if transformer.layout_for(target) == "bundle"]
+    if bundled:
+        ui.print_error(f"plan/apply trabaja con archivos sueltos; {', '.join(bundled)} usa el layout bundle")
+        ui.print_info("Usa 'update' (o --layout files)")
+        return 1
+    
+    planner = InstallPlanner(ui, logger, transformer)
+    with ui.phase("plan"):
+        plan = planner.build(targets)
+    planner.display(plan)
+    
+    plan_file = Path(args.plan_file) if args.plan_file else CONFIG.PLAN_FILE
+    planner.save(plan, plan_file)
+    ui.print_success(f"Plan guardado en {plan_file}", icon=Icons.FILE)
+    ui.print_muted("Aplicar con: python ./skills/setup.py apply")
+    
+    return 1 if plan["errors"] else 0
+
+def cmd_apply(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Aplica un plan guardado sin volver a parsear los skills"""
+    ui.print_section("Aplicando Plan", Icons.ROCKET)
+    
+    plan_file = Path(args.plan_file) if args.plan_file else CONFIG.PLAN_FILE
+    if not plan_file.exists():
+        ui.print_error(f"No se encontró el plan: {plan_file}")
+        ui.print_info("Genera uno con: python ./skills/setup.py plan")
+        return 1
+    
+    planner = InstallPlanner(ui, logger, SkillTransformer(ui, logger))
+    plan = planner.load(plan_file)
+    
+    if plan["installer_version"] != CONFIG.VERSION:
+        ui.print_error(f"El plan se generó con la versión {plan['installer_version']} del instalador")
+        return 1
+    
+    # Fallar rápido si las fuentes cambiaron desde el plan
+    changed = planner.changed_sources(plan)
+    if changed:
+        ui.print_error(f"Las fuentes cambiaron desde el plan ({len(changed)}): {', '.join(changed[:5])}")
+        ui.print_info("Vuelve a generar el plan con: python ./skills/setup.py plan")
+        return 1
+    
+    with ui.phase("apply"):
+        count = planner.apply(plan)
+    
+    if CONFIG.AI_ASSISTANT_JSON.exists():
+        with state_lock(CONFIG.AI_ASSISTANT_JSON):
+            config = json.loads(CONFIG.AI_ASSISTANT_JSON.read_text(encoding='utf-8'))
+            config['project']['last_update'] = datetime.now().isoformat()
+            # La selección con la que se calculó el plan pasa a ser la de cada asistente
+            if "selections" in plan:
+                selections = load_selections(config)
+                selections.update({assistant_id: SkillSelection.from_dict(data)
+                                   for assistant_id, data in plan["selections"].items()})
+                store_selections(config, selections)
+            atomic_write_text(CONFIG.AI_ASSISTANT_JSON, json.dumps(config, indent=2))
+    
+    ui.print_success(f"Plan aplicado: {count} cambios")
+    return 0
+
+# Opciones de 'update' que hereda el worker en segundo plano: (atributo de args, opción)
+WORKER_OPTIONS = (
+    ("quiet", "--quiet"), ("output", "--output"), ("full", "--full"), ("mmap", "--mmap"),
+    ("profile", "--profile"), ("layout", "--layout"), ("domain", "--domain"), ("level", "--level"),
+    ("include", "--include"), ("exclude", "--exclude"), ("all_skills", "--all-skills"),
+    ("profile_memory", "--profile-memory"),
+)
+
+def worker_argv(args: argparse.Namespace) -> List[str]:
+    """Argumentos del worker reconstruidos desde los ya parseados (no desde sys.argv)"""
+    argv = ["update", "--background-worker"]
+    for dest, option in WORKER_OPTIONS:
+        value = getattr(args, dest, None)
+        if value is None or value is False:
+            continue
+        if value is True:
+            argv.append(option)
+        elif isinstance(value, list):
+            for item in value:
+                argv += [option, str(item)]
+        else:
+            argv += [option, str(value)]
+    return argv
+
+def cmd_update_background(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Encola una actualización y la ejecuta en segundo plano sin bloquear"""
+    # Un servidor 'serve' activo la atiende en caliente; solo se espera su confirmación
+    response = server_request({"cmd": "update", "full": bool(getattr(args, 'full', False)), "wait": False},
+                              timeout=TransformServer.CLIENT_TIMEOUT)
+    if response is not None:
+        logger.debug(f"Actualización encolada en el servidor: {response}")
+        ui.print_muted("Actualización encolada en el servidor 'serve'")
+        return 0 if response.get("ok") else 1
+    
+    CONFIG.STATE_DIR.mkdir(parents=True, exist_ok=True)
+    CONFIG.UPDATE_PENDING.touch()
+    
+    # Si ya hay un worker activo, él atenderá la solicitud encolada
+    lock = FileLock(CONFIG.UPDATE_LOCK)
+    if not lock.acquire(blocking=False):
+        logger.debug("Actualización en curso; solicitud encolada")
+        ui.print_muted("Actualización en curso; se ejecutará una pasada adicional al terminar")
+        return 0
+    lock.release()
+    
+    # El worker hereda las opciones de la invocación original
+    spawn_detached([sys.executable, str(Path(__file__).absolute()), *worker_argv(args)])
+    logger.debug("Worker de actualización lanzado en segundo plano")
+    ui.print_muted("Actualización lanzada en segundo plano (ver: setup.py status)")
+    return 0
+
+def run_update_worker(ui: UI, logger: SetupLogger, options: Optional[TransformOptions] = None):
+    """Worker single-flight: agrupa las solicitudes pendientes en una sola pasada"""
+    lock = FileLock(CONFIG.UPDATE_LOCK)
+    result = 0
+    
+    while True:
+        if not lock.acquire(blocking=False):
+            # Otro worker tiene el lock y verá la solicitud pendiente
+            return result
+        
+        try:
+            # 'status' lo lee sin lock: nunca debe ver el archivo a medio escribir
+            atomic_write_text(CONFIG.UPDATE_STATUS, json.dumps({
+                "pid": os.getpid(),
+                "started_at": datetime.now().isoformat()
+            }))
+            
+            while CONFIG.UPDATE_PENDING.exists():
+                CONFIG.UPDATE_PENDING.unlink(missing_ok=True)
+                result = cmd_update(ui, logger, options)
+        finally:
+            CONFIG.UPDATE_STATUS.unlink(missing_ok=True)
+            lock.release()
+        
+        # Una solicitud pudo llegar entre la última comprobación y la liberación
+        if not CONFIG.UPDATE_PENDING.exists():
+            return result
+
+def cmd_status(ui: UI, logger: SetupLogger):
+    """Muestra si hay actualizaciones en curso o pendientes"""
+    lock = FileLock(CONFIG.UPDATE_LOCK)
+    running = not lock.acquire(blocking=False)
+    if not running:
+        lock.release()
+    
+    pending = CONFIG.UPDATE_PENDING.exists()
+    ui.event("update_status", running=running, pending=pending)
+    
+    if not running and not pending:
+        ui.print_success("No hay actualizaciones en curso")
+        return 0
+    
+    table = ui.create_table("Actualizaciones")
+    table.add_column("Estado", width=14)
+    table.add_column("Detalle")
+    
+    if running:
+        info = {}
+        try:
+            info = json.loads(CONFIG.UPDATE_STATUS.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            pass
+        table.add_row(
+            f"{Icons.LOADING} En curso",
+            f"PID {info.get('pid', '?')} desde {info.get('started_at', '?')}"
+        )
+    if pending:
+        table.add_row(f"{Icons.PENDING} Pendiente", "Se ejecutará una pasada adicional")
+    
+    ui.console.print(table)
+    return 0
+
+def cmd_rollback(ui: UI, logger: SetupLogger, args: argparse.Namespace):
+    """Vuelve a la generación de salidas anterior (swap de directorios) y a su manifiesto"""
+    targets = _plan_targets(args)
+    if not targets:
+        ui.print_error("No hay asistentes activos: usa --target")
+        return 1
+    
+    manifest = OutputManifest()
+    failed = 0
+    for assistant_id in targets:
+        name = CONFIG.ASSISTANTS[assistant_id]['name']
+        restored = OutputGenerations.for_assistant(CONFIG, assistant_id).rollback(manifest.assistant(assistant_id))
+        if restored is None:
+            ui.print_warning(f"{name}: no hay generación anterior")
+            failed += 1
+            continue
+        manifest.restore(assistant_id, dict(restored, rolled_back=True))
+        logger.info(f"Rollback de {assistant_id}")
+        ui.print_success(f"{name}: restaurada la generación anterior")
+        ui.event("rollback", assistant=assistant_id)
+    return 1 if failed else 0
+
 def cmd_detect(ui: UI, logger: SetupLogger):
     """Solo detectar asistentes"""
     detector = AssistantDetector(ui, logger)
@@ -1404,17 +5482,195 @@ def cmd_clean(ui: UI, logger: SetupLogger):
 # ENTRY POINT
 # =============================================================================
 
+def run_command(ui: UI, logger: SetupLogger, args: argparse.Namespace) -> int:
+    """Despacha el comando o el asistente pedido en la línea de comandos"""
+    # Comandos especiales
+    if args.lint_only:
+        return cmd_lint(ui, logger, args)
+    
+    if args.assistant == "update":
+        options = TransformOptions.from_args(args)
+        if args.background_worker:
+            return run_update_worker(ui, logger, options)
+        if args.background:
+            return cmd_update_background(ui, logger, args)
+        with FileLock(CONFIG.UPDATE_LOCK):
+            return cmd_update(ui, logger, options)
+    
+    if args.assistant == "plan":
+        return cmd_plan(ui, logger, args)
+    
+    if args.assistant == "apply":
+        with FileLock(CONFIG.UPDATE_LOCK):
+            return cmd_apply(ui, logger, args)
+    
+    if args.assistant == "graph":
+        return cmd_graph(ui, logger, args)
+    
+    if args.assistant == "stats":
+        return cmd_stats(ui, logger, args)
+    
+    if args.assistant == "bench":
+        return cmd_bench(ui, logger, args)
+    
+    if args.assistant == "serve":
+        return TransformServer(ui, logger, TransformOptions.from_args(args)).serve()
+    
+    if args.assistant == "rollback":
+        with FileLock(CONFIG.UPDATE_LOCK):
+            return cmd_rollback(ui, logger, args)
+    
+    if args.assistant == "status":
+        return cmd_status(ui, logger)
+    
+    if args.assistant == "detect":
+        return cmd_detect(ui, logger)
+    
+    if args.assistant == "clean":
+        return cmd_clean(ui, logger)
+    
+    # Instalador principal
+    try:
+        installer = MultiAssistantInstaller(ui, logger)
+        return installer.run(args)
+    except KeyboardInterrupt:
+        ui.print_warning("\n⚠️  Instalación cancelada por el usuario")
+        return 130
+    except Exception as e:
+        logger.error(f"Error fatal: {e}", exc_info=True)
+        ui.print_error(f"Error inesperado: {e}")
+        ui.print_info(f"Revisa el log: {CONFIG.SETUP_LOG}")
+        return 1
+
+def _option_parsers(suppress: bool = False) -> Tuple[argparse.ArgumentParser, ...]:
+    """Opciones que comparten varios comandos: salida, instalación, render y selección de skills
+    
+    Con suppress no tienen default: para los subcomandos, cuando el parser principal ya las define.
+    """
+    parsers = []
+    def group(title: str):
+        parser = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS if suppress else None)
+        parsers.append(parser)
+        return parser.add_argument_group(title)
+    
+    output = group("salida")
+    output.add_argument(
+        "--output", "-o",
+        choices=["text", "json"],
+        help="Formato de salida: text (Rich, por defecto) o json (eventos NDJSON, no interactivo)"
+    )
+    output.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Modo silencioso (solo errores)"
+    )
+    output.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Perfilar la memoria por fase con tracemalloc (pico, crecimiento y sitios de asignación) "
+             "y guardar el reporte en .ai-assistant.d/memory-profile.json"
+    )
+    
+    install = group("instalación")
+    install.add_argument(
+        "--dry-run", "-n",
+        action="store_true",
+        help="Simular instalación sin hacer cambios"
+    )
+    install.add_argument(
+        "--force", "-f",
+        action="store_true",
+        help="Forzar instalación aunque no se detecte el asistente"
+    )
+    install.add_argument(
+        "--skip-api",
+        action="store_true",
+        help="Omitir configuración de API keys"
+    )
+    install.add_argument(
+        "--offline",
+        action="store_true",
+        help="No validar API keys por red: usar veredictos en caché o guardarlas sin validar"
+    )
+    
+    transform = group("render")
+    transform.add_argument(
+        "--mmap",
+        choices=["auto", "always", "never"],
+        help="Parseo zero-copy con memory-map (auto, por defecto: solo skills grandes)"
+    )
+    transform.add_argument(
+        "--profile",
+        choices=["full", "compact"],
+        help="Perfil de render: compact elimina relleno y aplica presupuestos de bytes (se recuerda por asistente)"
+    )
+    transform.add_argument(
+        "--layout",
+        choices=["files", "bundle"],
+        help="Layout de salida: bundle emite un único archivo por asistente con índice y offsets (se recuerda por asistente)"
+    )
+    
+    selection = group("selección de skills")
+    selection.add_argument(
+        "--domain",
+        action="append",
+        metavar="DOMINIO",
+        help="Instalar solo skills de estos dominios (sección 'Dominio'; repetible o separado por comas; se recuerda por asistente)"
+    )
+    selection.add_argument(
+        "--level",
+        action="append",
+        metavar="NIVEL",
+        help="Instalar solo skills de estos niveles (sección 'Nivel'; repetible o separado por comas)"
+    )
+    selection.add_argument(
+        "--include",
+        action="append",
+        metavar="PATRÓN",
+        help="Instalar solo skills cuya ruta bajo skills/ coincida (comodines como en .setupignore; repetible)"
+    )
+    selection.add_argument(
+        "--exclude",
+        action="append",
+        metavar="PATRÓN",
+        help="No instalar skills cuya ruta bajo skills/ coincida (repetible)"
+    )
+    selection.add_argument(
+        "--all-skills",
+        action="store_true",
+        help="Quitar la selección guardada e instalar todo el corpus"
+    )
+    return tuple(parsers)
+
 def main():
+    # Sin comando: instalador interactivo, que acepta las opciones de instalación, o --lint-only / --client
     parser = argparse.ArgumentParser(
         description=f"{CONFIG.EMOJI_LOGO} AppNotesBG - Multi-Asistente AI Installer",
         formatter_class=argparse.RawDescriptionHelpFormatter,
+        parents=_option_parsers(),
         epilog=f"""
 Ejemplos:
   python ./skills/setup.py                    # Modo interactivo
   python ./skills/setup.py opencode           # Instalar Opencode
   python ./skills/setup.py all --dry-run      # Simular para todos
   python ./skills/setup.py claude --force     # Forzar instalación Claude
+  python ./skills/setup.py all --offline      # Sin red: API keys validadas desde la caché
   python ./skills/setup.py update             # Actualizar existentes
+  python ./skills/setup.py update --background # Actualizar sin bloquear (git hooks)
+  python ./skills/setup.py status             # Ver actualizaciones en curso
+  python ./skills/setup.py serve              # Servidor en caliente para el git hook
+  python ./skills/setup.py plan -t claude     # Calcular cambios y guardar el plan
+  python ./skills/setup.py apply              # Aplicar el plan guardado
+  python ./skills/setup.py graph --impact note-creator  # Dependientes de un skill
+  python ./skills/setup.py stats --top 5      # Bytes y tokens por asistente/dominio/nivel
+  python ./skills/setup.py bench --compare    # Falla si el último benchmark empeora frente al baseline
+  python ./skills/setup.py update -o json     # Eventos NDJSON para CI
+  python ./skills/setup.py update --profile-memory   # Memoria por fase (tracemalloc)
+  python ./skills/setup.py update --profile compact  # Salidas compactas (menos tokens)
+  python ./skills/setup.py update --layout bundle    # Un único archivo por asistente
+  python ./skills/setup.py claude --domain notes,auth --exclude '*-history.md'  # Solo parte del corpus
+  python ./skills/setup.py --lint-only        # Validar skills (pre-commit)
+  python ./skills/setup.py rollback           # Volver a la generación de salidas anterior
   python ./skills/setup.py detect             # Solo detectar asistentes
   python ./skills/setup.py clean              # Limpiar todo
 
@@ -1423,70 +5679,164 @@ Versión: {CONFIG.VERSION}
     )
     
     parser.add_argument(
-        "assistant",
-        nargs="?",
-        choices=["opencode", "claude", "cursor", "all", "update", "detect", "clean"],
-        help="Asistente para instalar o comando especial"
+        "--lint-only",
+        action="store_true",
+        help="Solo validar los skills (secciones, tamaños, nombres, referencias) sin generar salidas"
     )
     
     parser.add_argument(
-        "--dry-run", "-n",
+        "--strict",
         action="store_true",
-        help="Simular instalación sin hacer cambios"
+        help="Con --lint-only, fallar también ante advertencias"
     )
     
     parser.add_argument(
-        "--force", "-f",
+        "--client",
         action="store_true",
-        help="Forzar instalación aunque no se detecte el asistente"
+        help="Encola una actualización en 'serve' y sale (código 1 si no hay servidor); el hook usa skills/tools/serve_client.py"
     )
     
     parser.add_argument(
-        "--skip-api",
+        "--version", "-v",
+        action="version",
+        version=f"%(prog)s {CONFIG.VERSION}"
+    )
+    
+    # Cada comando acepta solo las opciones que tienen efecto en él. Las que también admite el
+    # parser principal no llevan default en el subcomando: así no pisan las dadas antes del comando
+    output, install, transform, selection = _option_parsers(suppress=True)
+    commands = parser.add_subparsers(dest="assistant", title="comandos", metavar="COMANDO")
+    
+    for assistant_id, config in CONFIG.ASSISTANTS.items():
+        commands.add_parser(assistant_id, parents=[output, install, transform, selection],
+                            help=f"Instalar {config['name']}")
+    commands.add_parser("all", parents=[output, install, transform, selection],
+                        help="Instalar todos los asistentes")
+    
+    update = commands.add_parser("update", parents=[output, transform, selection],
+                                 help="Regenerar las salidas de los asistentes instalados")
+    update.add_argument(
+        "--full",
         action="store_true",
-        help="Omitir configuración de API keys"
+        help="Regenerar todos los skills sin usar el grafo de dependencias"
+    )
+    update.add_argument(
+        "--background",
+        action="store_true",
+        help="Ejecutar en segundo plano (una sola ejecución a la vez)"
+    )
+    update.add_argument(
+        "--background-worker",
+        action="store_true",
+        help=argparse.SUPPRESS
     )
     
-    parser.add_argument(
-        "--quiet", "-q",
+    plan = commands.add_parser("plan", parents=[output, transform, selection],
+                               help="Calcular los cambios sin aplicarlos y guardar el plan")
+    plan.add_argument(
+        "--target", "-t",
+        action="append",
+        choices=list(CONFIG.ASSISTANTS.keys()),
+        help="Asistente a planificar (repetible; por defecto los activos)"
+    )
+    plan.add_argument(
+        "--plan-file",
+        help="Ruta del archivo de plan (por defecto .ai-assistant.d/plan.json)"
+    )
+    
+    apply = commands.add_parser("apply", parents=[output], help="Aplicar el plan guardado")
+    apply.add_argument(
+        "--plan-file",
+        help="Ruta del archivo de plan (por defecto .ai-assistant.d/plan.json)"
+    )
+    
+    graph = commands.add_parser("graph", parents=[output], help="Consultar el grafo de dependencias")
+    graph.add_argument(
+        "--impact",
+        action="append",
+        metavar="SKILL",
+        help="Listar los skills afectados por cambios en SKILL (repetible)"
+    )
+    graph.add_argument(
+        "--cycles",
         action="store_true",
-        help="Modo silencioso (solo errores)"
+        help="Listar referencias circulares entre skills"
     )
     
-    parser.add_argument(
-        "--version", "-v",
-        action="version",
-        version=f"%(prog)s {CONFIG.VERSION}"
+    stats = commands.add_parser("stats", parents=[output], help="Bytes y tokens de las salidas")
+    stats.add_argument(
+        "--target", "-t",
+        action="append",
+        choices=list(CONFIG.ASSISTANTS.keys()),
+        help="Asistente a incluir (repetible; por defecto todos los registrados)"
+    )
+    stats.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Número de skills más pesados a listar"
     )
     
-    args = parser.parse_args()
+    bench = commands.add_parser("bench", parents=[output],
+                                help="Comparar el último benchmark (skills/tools/bench_setup.py) con el baseline")
+    bench.add_argument(
+        "--compare",
+        action="store_true",
+        help="Fallar (código 1) si alguna métrica empeora más que el umbral frente al baseline"
+    )
+    bench.add_argument(
+        "--threshold",
+        type=float,
+        metavar="PCT",
+        help=f"Regresión tolerada en porcentaje (por defecto {CONFIG.BENCH_THRESHOLD * 100:.0f})"
+    )
+    bench.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Guardar el último resultado como nuevo baseline"
+    )
+    bench.add_argument(
+        "--report",
+        metavar="FILE",
+        help="Escribir el reporte JSON (para CI) en FILE"
+    )
     
-    # Setup básico
-    ui = UI()
-    logger = SetupLogger(CONFIG.SETUP_LOG)
+    commands.add_parser("serve", parents=[output, transform, selection],
+                        help="Servidor en caliente para el git hook")
     
-    # Comandos especiales
-    if args.assistant == "update":
-        return cmd_update(ui, logger)
+    rollback = commands.add_parser("rollback", parents=[output],
+                                   help="Volver a la generación de salidas anterior")
+    rollback.add_argument(
+        "--target", "-t",
+        action="append",
+        choices=list(CONFIG.ASSISTANTS.keys()),
+        help="Asistente a restaurar (repetible; por defecto los activos)"
+    )
     
-    if args.assistant == "detect":
-        return cmd_detect(ui, logger)
+    commands.add_parser("status", parents=[output], help="Ver actualizaciones en curso")
+    commands.add_parser("detect", parents=[output], help="Solo detectar asistentes")
+    commands.add_parser("clean", parents=[output], help="Limpiar todo")
     
-    if args.assistant == "clean":
-        return cmd_clean(ui, logger)
+    args = parser.parse_args()
     
-    # Instalador principal
+    # El git hook no necesita UI ni log: solo la confirmación del servidor
+    if args.client:
+        return serve_client()
+    
+    # Setup básico (en modo JSON no se importa Rich ni se escribe log en consola)
+    json_output = args.output == "json"
+    ui = EventUI() if json_output else UI()
+    logger = SetupLogger(CONFIG.SETUP_LOG, console=not json_output)
+    
+    # Perfil de memoria: cada fase de la UI toma instantáneas de tracemalloc al entrar y salir
+    if args.profile_memory:
+        ui.memory = MemoryProfiler()
     try:
-        installer = MultiAssistantInstaller()
-        return installer.run(args)
-    except KeyboardInterrupt:
-        ui.print_warning("\n⚠️  Instalación cancelada por el usuario")
-        return 130
-    except Exception as e:
-        logger.error(f"Error fatal: {e}", exc_info=True)
-        ui.print_error(f"Error inesperado: {e}")
-        ui.print_info(f"Revisa el log: {CONFIG.SETUP_LOG}")
-        return 1
+        return run_command(ui, logger, args)
+    finally:
+        if ui.memory is not None:
+            report_memory(ui, ui.memory, args.assistant or ("lint" if args.lint_only else "install"))
 
 if __name__ == "__main__":
     sys.exit(main())
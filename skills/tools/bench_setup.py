@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de setup.py sobre un corpus sintético fijo (herramienta de desarrollo, no se instala).
+
+Ejecuta el CLI real en un proyecto temporal: instalación en frío, sin cambios e incremental, con
+archivos sueltos, plan/apply, layout bundle y skills empaquetados en un zip. Cada métrica es la
+mediana de las repeticiones y el resultado queda en el historial del proyecto como 'bench', de
+donde lo lee 'setup.py bench' para compararlo con el baseline.
+
+Uso:
+  python ./skills/tools/bench_setup.py
+  python ./skills/tools/bench_setup.py --skills 1000 --repeat 5 --output bench.json
+  python ./skills/setup.py bench --compare    # Falla si el resultado empeora frente al baseline
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import subprocess
+import tempfile
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import setup  # noqa: E402
+from setup import Config, OutputGenerations, RunHistory  # noqa: E402
+
+# Corpus y repeticiones por defecto; 'setup.py bench --compare' exige los mismos que el baseline
+SKILLS = 300
+REPEAT = 3
+
+DOMAINS = ("notas", "auth", "sync", "ui", "ia", "infra", "busqueda", "recordatorios")
+
+# Escenarios: (nombre, comandos, fuente de los skills o None si se mantiene, editar una hoja antes)
+# Cambiar de fuente parte de estado limpio; tras cada instalación en frío se mide también la carga
+SCENARIOS: Tuple[Tuple[str, Tuple[Tuple[str, ...], ...], Optional[str], bool], ...] = (
+    ("cold", (("update", "--full"),), "files", False),
+    ("noop", (("update",),), None, False),
+    ("incremental", (("update",),), None, True),
+    ("plan_apply", (("plan",), ("apply",)), None, True),
+    ("bundle", (("update", "--full", "--layout", "bundle"),), "files", False),
+    ("bundle_incremental", (("update",),), None, True),
+    ("archive", (("update", "--full"),), "zip", False),
+    ("archive_incremental", (("update",),), None, True),
+)
+
+def write_corpus(root: Path, count: int) -> List[Path]:
+    """Proyecto sintético y determinista: skills con referencias cruzadas y secciones compartidas"""
+    shared = "## Convenciones\n" + "".join(
+        f"- Convención común {i}: mantener el estilo y las pruebas del módulo\n" for i in range(8)
+    )
+    paths = []
+    for i in range(count):
+        domain = DOMAINS[i % len(DOMAINS)]
+        # Cada skill referencia al líder de su grupo de 10 y al del siguiente (grafo en estrella)
+        leaders = {i // 10 * 10, (i // 10 + 1) * 10 % count} - {i}
+        refs = [f"AppNotesBG-{DOMAINS[j % len(DOMAINS)]}/skill-{j:05}.md" for j in sorted(leaders)]
+        body = [
+            f"---\nname: skill-{i:05}\ndominio: {domain}\nnivel: {('basico', 'intermedio', 'avanzado')[i % 3]}\n---",
+            f"# Skill {i:05}",
+            f"## Rol\nEspecialista sintético {i} del dominio {domain}.",
+            "## Reglas\n" + "".join(f"- Regla {i}.{k}: validar entradas y registrar errores\n" for k in range(6)),
+            "## Referencias\n" + "".join(f"- `{ref}`\n" for ref in refs),
+        ]
+        if i % 10 == 0:
+            body.append(shared)
+        path = root / f"AppNotesBG-{domain}" / f"skill-{i:05}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n\n".join(body) + "\n", encoding='utf-8')
+        paths.append(path)
+    return paths
+
+class BenchProject:
+    """Proyecto temporal cuyos skills/ son una copia del corpus o el corpus empaquetado en un zip"""
+    
+    ARCHIVE = "bench-corpus.zip"
+    
+    def __init__(self, root: Path, skills: int):
+        self.root = root
+        self.corpus_dir = root / "corpus"
+        self.corpus = write_corpus(self.corpus_dir, skills)
+        self.config = Config(ROOT=root)
+        self.config.SKILLS_SOURCE_DIR.mkdir(parents=True)
+        self.script = self.config.SKILLS_SOURCE_DIR / "setup.py"
+        shutil.copy2(Path(setup.__file__).resolve(), self.script)
+        self.source = ""
+    
+    def reset(self, source: str):
+        """Estado limpio para que la instalación completa sea realmente en frío"""
+        config = self.config
+        shutil.rmtree(config.STATE_DIR, ignore_errors=True)
+        for assistant_id in config.ASSISTANTS:
+            shutil.rmtree(config.get_assistant_dir(assistant_id), ignore_errors=True)
+        for entry in config.SKILLS_SOURCE_DIR.iterdir():
+            if entry.is_dir():
+                shutil.rmtree(entry)
+            elif entry.name == self.ARCHIVE:
+                entry.unlink()
+        config.AI_ASSISTANT_JSON.write_text(json.dumps({
+            "project": {"name": "bench", "last_update": None},
+            "configuration": {"active_assistants": list(config.ASSISTANTS)},
+        }), encoding='utf-8')
+        
+        self.source = source
+        if source == "zip":
+            self._pack()
+        else:
+            # copy2 conserva los mtime: el primer update sin cambios no relee nada
+            for domain_dir in sorted(self.corpus_dir.iterdir()):
+                shutil.copytree(domain_dir, config.SKILLS_SOURCE_DIR / domain_dir.name)
+    
+    def edit(self, round_: int):
+        """Modifica una hoja (ningún skill la referencia) en la fuente vigente"""
+        edited = self.corpus[1]
+        with open(edited, "a", encoding='utf-8') as f:
+            f.write(f"\n- Cambio de la ronda {round_}\n")
+        if self.source == "zip":
+            self._pack()
+        else:
+            shutil.copy2(edited, self.config.SKILLS_SOURCE_DIR / edited.relative_to(self.corpus_dir))
+    
+    def _pack(self):
+        with zipfile.ZipFile(self.config.SKILLS_SOURCE_DIR / self.ARCHIVE, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path in self.corpus:
+                archive.write(path, path.relative_to(self.corpus_dir).as_posix())
+    
+    def run(self, argv: Tuple[str, ...]) -> float:
+        """Ejecuta un comando del CLI y devuelve su duración en ms"""
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, str(self.script), *argv, "--output", "json"],
+                                cwd=str(self.root), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, timeout=600)
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise RuntimeError(f"'{' '.join(argv)}' falló ({result.returncode}): "
+                               f"{result.stderr.decode('utf-8', 'replace')[-200:]}")
+        return wall_ms
+    
+    def load_outputs_ms(self) -> float:
+        """Lo que hace un asistente al arrancar: recorrer su directorio y leer cada archivo"""
+        started = time.perf_counter()
+        for assistant_id in self.config.ASSISTANTS:
+            for dirpath, dirnames, filenames in os.walk(self.config.get_assistant_dir(assistant_id)):
+                # Solo la generación vigente, no las guardadas para rollback
+                if OutputGenerations.DIRNAME in dirnames:
+                    dirnames.remove(OutputGenerations.DIRNAME)
+                for filename in filenames:
+                    with open(os.path.join(dirpath, filename), "rb") as f:
+                        f.read()
+        return (time.perf_counter() - started) * 1000
+
+def run_bench(skills: int, repeat: int) -> Dict[str, Any]:
+    """Cada métrica es la mediana de las repeticiones; las fases salen del historial de 'update'"""
+    samples: Dict[str, List[float]] = defaultdict(list)
+    peaks: List[int] = []
+    
+    with tempfile.TemporaryDirectory(prefix="ai-assistant-bench-") as tmp:
+        project = BenchProject(Path(tmp), skills)
+        history = RunHistory(project.config.HISTORY_FILE)
+        
+        for round_ in range(1, repeat + 1):
+            for scenario, commands, source, edit in SCENARIOS:
+                if source:
+                    project.reset(source)
+                if edit:
+                    project.edit(round_)
+                
+                total_ms = 0.0
+                for argv in commands:
+                    wall_ms = project.run(argv)
+                    total_ms += wall_ms
+                    if len(commands) > 1:
+                        samples[f"{scenario}.{argv[0]}_ms"].append(wall_ms)
+                    if argv[0] != "update":
+                        continue
+                    entry = history.entries("update")[-1]
+                    for phase, ms in entry["phases_ms"].items():
+                        samples[f"{scenario}.{phase}_ms"].append(ms)
+                    if source and entry.get("skills_per_sec"):
+                        samples[f"{scenario}.skills_per_sec"].append(entry["skills_per_sec"])
+                    if entry.get("peak_rss_kb"):
+                        peaks.append(entry["peak_rss_kb"])
+                samples[f"{scenario}.wall_ms"].append(total_ms)
+                if source:
+                    samples[f"{scenario}.load_ms"].append(project.load_outputs_ms())
+            print(f"Ronda {round_} de {repeat}", flush=True)
+    
+    metrics = {name: round(sorted(values)[len(values) // 2], 3) for name, values in sorted(samples.items())}
+    if peaks:
+        metrics["peak_rss_kb"] = max(peaks)
+    return {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "version": setup.CONFIG.VERSION,
+        "python": sys.version.split()[0],
+        "skills": skills,
+        "repeat": repeat,
+        "metrics": metrics,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de setup.py sobre un corpus sintético")
+    parser.add_argument("--skills", type=int, default=SKILLS,
+                        help=f"Skills del corpus (default: {SKILLS})")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help=f"Repeticiones de cada escenario (default: {REPEAT})")
+    parser.add_argument("--output", metavar="FILE", help="Escribir además el resultado JSON en FILE")
+    args = parser.parse_args()
+    
+    repeat = max(1, args.repeat)
+    print(f"Corpus sintético: {args.skills} skills × {len(setup.CONFIG.ASSISTANTS)} asistentes, "
+          f"{repeat} repeticiones")
+    started = time.perf_counter()
+    try:
+        result = run_bench(args.skills, repeat)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+        print(f"Benchmark fallido: {e}")
+        return 1
+    
+    for name, value in result["metrics"].items():
+        print(f"{name:<36}{value:>14,.1f}" if isinstance(value, float) else f"{name:<36}{value:>14,}")
+    RunHistory().record("bench", {"bench": (time.perf_counter() - started) * 1000}, args.skills,
+                        **{key: result[key] for key in ("python", "repeat", "metrics")})
+    if args.output:
+        setup.atomic_write_text(Path(args.output), json.dumps(result, indent=2, sort_keys=True))
+    print("Comparar con el baseline: python ./skills/setup.py bench --compare")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
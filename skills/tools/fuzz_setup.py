@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fuzzing del parser de skills de setup.py (herramienta de desarrollo, no se instala).
+
+Entradas patológicas de tamaño creciente: el tiempo debe crecer linealmente con el tamaño (se
+ajusta el exponente de tiempo ∝ tamaño^k en log-log sobre al menos tres tamaños). Además comprueba la propiedad texto == memory-map con saltos CRLF, CR, LF y BOM mezclados.
+
+Uso:
+  python ./skills/tools/fuzz_setup.py
+  python ./skills/tools/fuzz_setup.py --sizes 32 128 512 2048 --cases 2000 --seed 1
+"""
+
+import sys
+import math
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import setup  # noqa: E402
+from setup import Config, MappedSkill, SkillGraph, SkillSource, SkillTransformer, TransformOptions  # noqa: E402
+
+# Exponente tolerado del ajuste tiempo ∝ tamaño^k (lineal ≈ 1, cuadrático ≈ 2)
+MAX_EXPONENT = 1.3
+# El tamaño menor de cada caso se duplica hasta tardar al menos esto (ms), sin pasar de MAX_BYTES
+MIN_MS = 5.0
+MAX_BYTES = 64 * 1024 * 1024
+
+# Entradas patológicas: (nombre, generador de n bytes aproximados)
+CASES: Tuple[Tuple[str, Callable[[int], str]], ...] = (
+    ("linea_larga", lambda n: "# T\n## Rol\n" + "a" * n + "\n"),
+    ("puntos", lambda n: "# T\n## Rol\n" + "a." * (n // 2) + "\n"),
+    ("barras", lambda n: "# T\n## Rol\n" + "a/" * (n // 2) + "\n"),
+    ("ruta_sin_md", lambda n: "# T\n## Rol\nAppNotesBG-x/" + "a." * (n // 2) + "\n"),
+    ("encabezados", lambda n: "# T\n" + "## h\n" * (n // 5)),
+    ("secciones_nivel", lambda n: "# T\n" + "## Nivel\nx\n" * (n // 11)),
+    ("fences", lambda n: "# T\n## Rol\n" + "```\n" * (n // 4)),
+    ("fences_anidados", lambda n: "# T\n## Rol\n" + "".join("`" * (3 + i % 5) + "\n" for i in range(n // 6))),
+    ("crlf", lambda n: "# T\r\n## Rol\r\n" + "x\r\n" * (n // 3)),
+    ("cr_suelto", lambda n: "# T\r## Rol\r" + "x\r" * (n // 2)),
+    ("frontmatter_abierto", lambda n: "---\n" + "k: v\n" * (n // 5)),
+    ("espacios_encabezado", lambda n: "# T\n##" + " " * n + "\n"),
+    ("almohadillas", lambda n: "# T\n## Rol\n" + "#" * n + "\n"),
+    ("titulo_espacios", lambda n: "# " + " " * n + "x\n"),
+    ("multibyte", lambda n: "# Título\n## Rol\n" + "ñé€😀" * (n // 13) + "\n"),
+)
+
+# Líneas con las que se generan los casos de la propiedad texto == memory-map
+LINES = ("# T", "## Rol", "## Nivel", "texto", "```", "", "  ## no", "#x", "## ", "##\tTab", "---",
+         "k: v", "é", "- `AppNotesBG-x/y.md`")
+
+def parse(transformer: SkillTransformer, skill_file: Path, content: str):
+    """Todo lo que el instalador hace con el texto de un skill: índice, referencias, parseo y render"""
+    SkillGraph.extract_refs(content)
+    SkillGraph.section_index(content)
+    setup.index_metadata(content)
+    skill_data = transformer._parse_skill(skill_file, content)
+    source = SkillSource(skill_file, content, "fuzz")
+    for assistant_id in transformer.config.ASSISTANTS:
+        transformer._render_skill(source, assistant_id, transformer.get_output_dir(assistant_id), skill_data)
+    skill_file.write_bytes(content.encode('utf-8'))
+    transformer._parse_skill(skill_file, MappedSkill(skill_file))
+
+def best_ms(transformer: SkillTransformer, skill_file: Path, content: str, repeat: int = 3) -> float:
+    """Mejor tiempo de parse() entre las repeticiones"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(transformer, skill_file, content)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def slope(points: Sequence[Tuple[int, float]]) -> float:
+    """Pendiente por mínimos cuadrados de log(ms) frente a log(bytes)"""
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(max(ms, 1e-6)) for _, ms in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+def growth(transformer: SkillTransformer, skill_file: Path, sizes: Sequence[int]) -> Iterator[Dict[str, Any]]:
+    """Tiempos de cada caso por tamaño y exponente ajustado.
+    
+    Los tamaños de un caso se escalan a la vez (×2) hasta que el menor supera MIN_MS, para que el
+    coste fijo y el ruido no aplanen la pendiente; si ni con MAX_BYTES lo supera, el caso falla.
+    """
+    for name, generate in CASES:
+        scale = 1
+        while best_ms(transformer, skill_file, generate(sizes[0] * scale)) < MIN_MS \
+                and sizes[-1] * scale * 2 <= MAX_BYTES:
+            scale *= 2
+        points = []
+        for size in sizes:
+            content = generate(size * scale)
+            points.append((len(content), best_ms(transformer, skill_file, content)))
+        exponent = slope(points)
+        measurable = points[0][1] >= MIN_MS
+        yield {
+            "case": name,
+            "scale": scale,
+            "ms": [round(ms, 2) for _, ms in points],
+            "exponent": round(exponent, 2),
+            "measurable": measurable,
+            "linear": measurable and exponent <= MAX_EXPONENT,
+        }
+
+def parity(transformer: SkillTransformer, skill_file: Path, cases: int, seed: int) -> List[bytes]:
+    """Propiedad: el parseo de texto y el de memory-map coinciden"""
+    rng = random.Random(seed)
+    failures = []
+    def outcome(content: Any) -> Any:
+        try:
+            skill_data = transformer._parse_skill(skill_file, content)
+        except Exception as e:
+            return type(e).__name__
+        return (skill_data.title, dict(skill_data.sections), skill_data.metadata)
+    
+    for _ in range(cases):
+        lines = [rng.choice(LINES) for _ in range(rng.randint(0, 12))]
+        data = rng.choice(("\n", "\r\n", "\r")).join(lines).encode('utf-8')
+        if rng.random() < 0.3:
+            data = MappedSkill.BOM + data
+        skill_file.write_bytes(data)
+        if outcome(setup.decode_source(data)) != outcome(MappedSkill(skill_file)):
+            failures.append(data)
+    return failures
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fuzzing del parser de skills de setup.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 128, 512], metavar="KB",
+                        help="Tamaños de las entradas patológicas en KB, al menos tres (default: 32 128 512)")
+    parser.add_argument("--cases", type=int, default=2000, help="Casos de la propiedad texto == memory-map")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    sizes = sorted(set(size * 1024 for size in args.sizes))
+    if len(sizes) < 3:
+        parser.error("--sizes necesita al menos tres tamaños distintos para ajustar la pendiente")
+    with tempfile.TemporaryDirectory(prefix="ai-assistant-fuzz-") as tmp:
+        config = Config(ROOT=Path(tmp))
+        config.SKILLS_SOURCE_DIR.mkdir(parents=True)
+        transformer = SkillTransformer(setup._SilentUI(), setup._NullLogger(), TransformOptions(mmap_mode="never"), config)
+        # Sin índice compartido: cada caso se renderiza completo y no se lee el grafo del proyecto
+        transformer.shared = {}
+        for assistant_id in config.ASSISTANTS:
+            transformer._begin_includes(assistant_id, [])
+        skill_file = config.SKILLS_SOURCE_DIR / "fuzz.md"
+        
+        print(f"{'Caso':<22}{'Escala':>8}" + "".join(f"{size // 1024:>10} KB" for size in sizes)
+              + f"{'Exponente':>11}")
+        superlinear, unmeasurable = [], []
+        for row in growth(transformer, skill_file, sizes):
+            status = "" if row["linear"] else "  superlineal" if row["measurable"] else "  sin medir"
+            print(f"{row['case']:<22}{row['scale']:>7}×" + "".join(f"{ms:>10.1f} ms" for ms in row["ms"])
+                  + f"{row['exponent']:>11.2f}{status}")
+            if not row["measurable"]:
+                unmeasurable.append(row["case"])
+            elif not row["linear"]:
+                superlinear.append(row["case"])
+        failures = parity(transformer, skill_file, args.cases, args.seed)
+    
+    for data in failures[:3]:
+        print(f"Parseo texto/memory-map distinto: {data!r}")
+    if superlinear or unmeasurable or failures:
+        if superlinear:
+            print(f"Coste superlineal (exponente máx. {MAX_EXPONENT:g}) en: {', '.join(superlinear)}")
+        if unmeasurable:
+            print(f"Por debajo de {MIN_MS:g} ms incluso con {MAX_BYTES // (1024 * 1024)} MB: {', '.join(unmeasurable)}")
+        if failures:
+            print(f"{len(failures)} de {args.cases} entradas se parsean distinto con memory-map")
+        return 1
+    print(f"Parser lineal en todos los casos; {args.cases} casos texto/memory-map consistentes")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
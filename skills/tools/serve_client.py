@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente mínimo de 'setup.py serve' para el git hook post-checkout.
+
+Encola una actualización en el servidor y sale sin esperar a que termine. No importa setup.py
+(cargarlo entero cuesta más que la propia petición) y funciona con 'python -S'; el protocolo es
+el de server_request() en setup.py. Sale con 1 si no hay servidor escuchando o no acepta la
+petición, para que el hook recurra a 'setup.py update --background'.
+
+Uso:
+  python -S ./skills/tools/serve_client.py
+  python -S ./skills/tools/serve_client.py --full
+"""
+
+import sys
+import json
+import socket
+from pathlib import Path
+
+# Misma ruta que Config.SERVE_SOCKET y mismo límite que TransformServer.CLIENT_TIMEOUT
+SERVE_SOCKET = Path(__file__).resolve().parent.parent.parent / ".ai-assistant.d" / "serve.sock"
+TIMEOUT = 5.0
+
+def main() -> int:
+    if not hasattr(socket, "AF_UNIX") or not SERVE_SOCKET.exists():
+        return 1
+    payload = {"cmd": "update", "full": "--full" in sys.argv[1:], "wait": False}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(str(SERVE_SOCKET))
+            sock.sendall(json.dumps(payload).encode('utf-8') + b"\n")
+            line = sock.makefile('rb').readline()
+        response = json.loads(line)
+    except (OSError, ValueError):
+        return 1
+    return 0 if isinstance(response, dict) and response.get("ok") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
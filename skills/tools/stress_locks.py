@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de estrés de los archivos de estado de setup.py (herramienta de desarrollo, no se instala).
+
+N procesos hacen read-modify-write a la vez sobre .env y .ai-assistant.json con state_lock y
+atomic_write_text, mientras un lector los parsea sin lock. Al final no debe faltar ninguna
+escritura ni el lector haber visto un archivo a medio escribir.
+
+Uso:
+  python ./skills/tools/stress_locks.py
+  python ./skills/tools/stress_locks.py --processes 16 --iterations 200
+  python ./skills/tools/stress_locks.py --no-lock    # Reproduce las escrituras perdidas sin lock
+"""
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import setup  # noqa: E402
+
+def use_root(root: str) -> setup.Config:
+    """Cada proceso apunta el CONFIG global del instalador al proyecto temporal"""
+    setup.CONFIG = setup.Config(ROOT=Path(root))
+    setup.CONFIG.STATE_DIR.mkdir(parents=True, exist_ok=True)
+    return setup.CONFIG
+
+def writer(root: str, worker: int, iterations: int, locked: bool):
+    config = use_root(root)
+    for i in range(iterations):
+        # .env: se añade una línea por iteración, como save_env_file al completar el archivo
+        with setup.state_lock(config.ENV_FILE) if locked else contextlib.nullcontext():
+            existing = config.ENV_FILE.read_text(encoding='utf-8') if config.ENV_FILE.exists() else ""
+            setup.atomic_write_text(config.ENV_FILE, existing + f"STRESS_{worker}_{i}=1\n", mode=0o600)
+        
+        # .ai-assistant.json: contador global y lista por proceso
+        with setup.state_lock(config.AI_ASSISTANT_JSON) if locked else contextlib.nullcontext():
+            data = json.loads(config.AI_ASSISTANT_JSON.read_text(encoding='utf-8'))
+            data["project"]["counter"] += 1
+            data["project"].setdefault("workers", {}).setdefault(str(worker), []).append(i)
+            setup.atomic_write_text(config.AI_ASSISTANT_JSON, json.dumps(data, indent=2))
+
+def reader(root: str, stop: multiprocessing.Event, torn: multiprocessing.Value):
+    """Lee sin lock, como 'status' o un asistente: atomic_write_text no debe dejar ver archivos parciales"""
+    config = use_root(root)
+    while not stop.is_set():
+        try:
+            json.loads(config.AI_ASSISTANT_JSON.read_text(encoding='utf-8'))
+        except ValueError:
+            with torn.get_lock():
+                torn.value += 1
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Estrés de locks y escrituras atómicas de setup.py")
+    parser.add_argument("--processes", "-p", type=int, default=8)
+    parser.add_argument("--iterations", "-i", type=int, default=100)
+    parser.add_argument("--no-lock", action="store_true", help="Sin state_lock (debe perder escrituras)")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix="ai-assistant-stress-") as root:
+        config = use_root(root)
+        setup.atomic_write_text(config.AI_ASSISTANT_JSON, json.dumps({"project": {"counter": 0}}))
+        
+        stop = multiprocessing.Event()
+        torn = multiprocessing.Value('i', 0)
+        watcher = multiprocessing.Process(target=reader, args=(root, stop, torn))
+        watcher.start()
+        started = time.perf_counter()
+        workers = [multiprocessing.Process(target=writer, args=(root, n, args.iterations, not args.no_lock))
+                   for n in range(args.processes)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        watcher.join()
+        
+        expected = args.processes * args.iterations
+        env_lines = set(config.ENV_FILE.read_text(encoding='utf-8').splitlines())
+        project = json.loads(config.AI_ASSISTANT_JSON.read_text(encoding='utf-8'))["project"]
+        entries = sum(len(items) for items in project.get("workers", {}).values())
+        failed_workers = sum(1 for process in workers if process.exitcode != 0)
+    
+    print(f"{args.processes} procesos × {args.iterations} iteraciones en {elapsed:.2f} s"
+          f" ({'sin lock' if args.no_lock else 'con state_lock'})")
+    print(f"  .env:               {len(env_lines)}/{expected} líneas")
+    print(f"  .ai-assistant.json: contador {project['counter']}/{expected}, {entries}/{expected} entradas")
+    print(f"  lecturas parciales: {torn.value}")
+    if failed_workers:
+        print(f"  procesos fallidos:  {failed_workers}")
+    
+    ok = (len(env_lines) == expected and project["counter"] == expected and entries == expected
+          and torn.value == 0 and not failed_workers)
+    print("OK: ninguna escritura perdida" if ok else "FALLO: escrituras perdidas o archivos parciales")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())